@@ -0,0 +1,112 @@
+# analysis/benchmark_loaders.py
+
+# Import libraries
+import os                       # points the loaders to the synthetic data (TAX_APP_DATA_DIR)
+import sys                      # command line arguments
+import tempfile                 # folder for the synthetic exports
+import time                     # parse time
+import tracemalloc              # peak memory during parsing
+
+# Backend modules
+import loaders.load_datasets as datasets
+import loaders.paths as paths
+
+
+##################################################################################################
+
+### Benchmark of the ESTV CSV loaders
+# Measures parse time and peak traced memory (Python objects and NumPy/pandas arrays) of
+# the wide ESTV loaders, on the bundled files and on synthetic exports with the data rows
+# repeated (default: 100x). The loaders read fixed file names in the data folder, so the
+# synthetic files are written to a temporary folder with the same file names, and the loaders
+# are pointed to it through TAX_APP_DATA_DIR (see loaders/paths.py).
+#
+# Usage (from the tax_calculator_app folder):
+#   python -m analysis.benchmark_loaders [factor] [repeats]
+
+LOADERS = {
+    "2025_estv_tax_rates_confederation.csv": datasets.load_federal_tax_rates,
+    "2025_estv_tax_rates_sg.csv": datasets.load_cantonal_base_tax_rates,
+    "2025_estv_tax_multipliers_sg.csv": datasets.load_cantonal_municipal_church_multipliers,
+}
+
+
+def write_synthetic_export(source_path, target_path, factor):
+    """
+    Write a copy of an ESTV export with the data rows (all rows after the header) repeated.
+
+    Parameters:
+        source_path (str): bundled ESTV CSV.
+        target_path (str): path of the synthetic CSV.
+        factor (int): number of copies of the data rows.
+    """
+
+    with open(source_path, encoding="utf-8-sig") as f:
+        lines = f.read().splitlines()
+
+    header_row = datasets._find_header_row(source_path)
+    data_rows = [line for line in lines[header_row + 1:] if line.strip(",")]
+
+    with open(target_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines[: header_row + 1] + data_rows * factor) + "\n")
+
+
+def measure_loader(loader, repeats=5):
+    """
+    Run a loader several times and measure it.
+
+    Returns:
+        dict: "rows", best "seconds" and "peak_mib" (peak traced memory of one run).
+    """
+
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        df = loader()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    loader()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {"rows": len(df), "seconds": best, "peak_mib": peak / 2**20}
+
+
+def run_benchmark(factor=100, repeats=5):
+    """
+    Benchmark all loaders on the bundled files and on synthetic exports.
+
+    Returns:
+        list of dict: one entry per loader and data set.
+    """
+
+    results = []
+    for file_name, loader in LOADERS.items():
+        results.append({"file": file_name, "data": "bundled", **measure_loader(loader, repeats)})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for file_name in LOADERS:
+            write_synthetic_export(paths.data_path(file_name), os.path.join(tmp, file_name), factor)
+
+        previous = os.environ.get("TAX_APP_DATA_DIR")
+        os.environ["TAX_APP_DATA_DIR"] = tmp
+        try:
+            for file_name, loader in LOADERS.items():
+                results.append({"file": file_name, "data": f"{factor}x", **measure_loader(loader, repeats)})
+        finally:
+            if previous is None:
+                del os.environ["TAX_APP_DATA_DIR"]
+            else:
+                os.environ["TAX_APP_DATA_DIR"] = previous
+
+    return results
+
+
+if __name__ == "__main__":
+    factor = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    print(f"{'file':42} {'data':8} {'rows':>7} {'time [ms]':>10} {'peak [MiB]':>11}")
+    for r in run_benchmark(factor, repeats):
+        print(f"{r['file']:42} {r['data']:8} {r['rows']:7d} {r['seconds'] * 1000:10.1f} {r['peak_mib']:11.2f}")
@@ -0,0 +1,192 @@
+# analysis/benchmark_tax_engines.py
+
+# Import libraries
+import argparse                 # command line options (sizes, chunk size)
+import json                     # result of the warm-up probe process
+import os                       # Numba cache folder of the warm-up probe
+import subprocess               # warm-up measured in fresh interpreters
+import sys                      # interpreter of the warm-up probe
+import tempfile                 # empty Numba cache for the cold start
+import time                     # run time
+import tracemalloc              # peak memory of one chunk (temporary arrays)
+
+import numpy as np              # synthetic inputs
+
+# Backend modules
+import loaders.load_datasets as datasets
+import tax_calculations.total_income_tax as t
+import tax_calculations.fused_tax_kernel as fk
+
+
+##################################################################################################
+
+### Benchmark of the tax breakdown engines
+# Compares the NumPy engine (total_income_tax.calculation_total_income_tax_vectorized) with the
+# fused Numba kernel (fused_tax_kernel.calculation_total_income_tax_fused) on 1K to 100M rows.
+# The inputs are one block of synthetic rows (net incomes, tax class, commune, church) of the
+# chunk size; larger sizes are processed chunk by chunk, as the dataset generator does, so the
+# memory stays bounded. Both engines get the same inputs and their results are compared.
+#
+# JIT warm-up: the first use of the kernel in a fresh interpreter (Numba import, compilation
+# and the first call), once with an empty Numba cache (cold) and once with the cache filled.
+#
+# Usage (from the tax_calculator_app folder):
+#   python -m analysis.benchmark_tax_engines [--sizes 1000 10000 ... 100000000] [--chunk-size 1000000]
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000]
+DEFAULT_CHUNK_SIZE = 1_000_000
+
+
+def load_tax_tables():
+    """Compiled tax tables (total_income_tax.compile_tax_tables) from the bundled files."""
+    return t.compile_tax_tables(
+        datasets.load_federal_tax_rates(),
+        datasets.load_cantonal_base_tax_rates(),
+        datasets.load_cantonal_municipal_church_multipliers(),
+    )
+
+
+def synthetic_inputs(tax_tables, n_rows, seed=0):
+    """Arguments of the breakdown functions (after tax_tables) for n_rows random taxpayers."""
+    rng = np.random.default_rng(seed)
+    return {
+        "marital_status": rng.choice(np.array(["single", "married"], dtype=object), size=n_rows),
+        "number_of_children": rng.integers(0, 4, size=n_rows),
+        "income_net_federal": rng.uniform(-5_000, 400_000, size=n_rows),
+        "income_net_cantonal": rng.uniform(-5_000, 400_000, size=n_rows),
+        "commune": rng.choice(tax_tables["multipliers"]["commune"], size=n_rows),
+        "church_affiliation": rng.choice(
+            np.array(["roman_catholic", "protestant", "christian_catholic", "none"], dtype=object), size=n_rows
+        ),
+    }
+
+
+ENGINES = {
+    "numpy": t.calculation_total_income_tax_vectorized,
+    "numba": fk.calculation_total_income_tax_fused,
+}
+
+
+def _slice(inputs, n_rows):
+    return {key: values[:n_rows] for key, values in inputs.items()}
+
+
+def time_engine(engine, tax_tables, inputs, n_rows, chunk_size, repeats):
+    """Best time (seconds) of `repeats` runs over n_rows rows, in chunks of chunk_size."""
+    function = ENGINES[engine]
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for chunk_start in range(0, n_rows, chunk_size):
+            function(tax_tables, **_slice(inputs, min(chunk_size, n_rows - chunk_start)))
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def peak_memory_mib(engine, tax_tables, inputs):
+    """Peak traced memory (MiB) of one call on the input block (result plus temporaries)."""
+    tracemalloc.start()
+    ENGINES[engine](tax_tables, **inputs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2**20
+
+
+def measure_warmup():
+    """First use of the kernel in this interpreter: seconds for the Numba import and compilation
+    (load_kernel plus the first call on 1'000 rows) and for a second call."""
+    tax_tables = load_tax_tables()
+    inputs = synthetic_inputs(tax_tables, 1_000)
+
+    start = time.perf_counter()
+    fk.calculation_total_income_tax_fused(tax_tables, **inputs)
+    first = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fk.calculation_total_income_tax_fused(tax_tables, **inputs)
+    return {"first_call": first, "second_call": time.perf_counter() - start}
+
+
+def _warmup_in_fresh_process(cache_dir):
+    env = {**os.environ, "NUMBA_CACHE_DIR": cache_dir}
+    output = subprocess.run(
+        [sys.executable, "-m", "analysis.benchmark_tax_engines", "--warmup-probe"],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_benchmark(sizes=DEFAULT_SIZES, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Time both engines on every size and measure the JIT warm-up.
+
+    Returns:
+        dict: "rows" (per size: rows, seconds and rows/s per engine, speedup), "identical"
+              (results equal on the input block), "peak_mib" per engine (one chunk),
+              "warmup" ("cold" and "cached": first and second call in a fresh interpreter).
+    """
+
+    if not fk.numba_available():
+        raise ImportError("Numba is not installed; only the NumPy engine is available")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        warmup = {"cold": _warmup_in_fresh_process(cache_dir), "cached": _warmup_in_fresh_process(cache_dir)}
+
+    tax_tables = load_tax_tables()
+    inputs = synthetic_inputs(tax_tables, min(chunk_size, max(sizes)))
+    block = len(inputs["income_net_federal"])
+
+    # Compile in this process before timing
+    expected = t.calculation_total_income_tax_vectorized(tax_tables, **inputs)
+    actual = fk.calculation_total_income_tax_fused(tax_tables, **inputs)
+    identical = all(np.array_equal(expected[key], actual[key]) for key in expected)
+
+    rows = []
+    for n_rows in sizes:
+        repeats = max(1, min(20, 1_000_000 // n_rows))
+        row = {"rows": n_rows}
+        for engine in ENGINES:
+            seconds = time_engine(engine, tax_tables, inputs, n_rows, block, repeats)
+            row[engine] = {"seconds": seconds, "rows_per_second": n_rows / seconds}
+        row["speedup"] = row["numpy"]["seconds"] / row["numba"]["seconds"]
+        rows.append(row)
+        print(f"{n_rows:>12,} rows  numpy {row['numpy']['seconds']:9.4f} s  "
+              f"numba {row['numba']['seconds']:9.4f} s  speedup {row['speedup']:5.1f}x")
+
+    return {
+        "rows": rows,
+        "identical": identical,
+        "chunk_size": block,
+        "peak_mib": {engine: peak_memory_mib(engine, tax_tables, inputs) for engine in ENGINES},
+        "warmup": warmup,
+    }
+
+
+def format_report(report):
+    """Text summary of run_benchmark()."""
+    lines = [
+        f"{'rows':>12}  {'numpy rows/s':>14}  {'numba rows/s':>14}  {'speedup':>7}",
+        *(f"{r['rows']:>12,}  {r['numpy']['rows_per_second']:>14,.0f}  "
+          f"{r['numba']['rows_per_second']:>14,.0f}  {r['speedup']:>6.1f}x" for r in report["rows"]),
+        "",
+        f"Identical results: {report['identical']}",
+        f"Peak traced memory per {report['chunk_size']:,}-row chunk: numpy {report['peak_mib']['numpy']:.0f} MiB, "
+        f"numba {report['peak_mib']['numba']:.0f} MiB",
+    ]
+    for kind, warmup in report["warmup"].items():
+        lines.append(f"JIT warm-up ({kind} Numba cache): first call {warmup['first_call']:.2f} s, "
+                     f"second call {warmup['second_call'] * 1000:.2f} ms (1'000 rows)")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the NumPy engine and the fused Numba kernel.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="numbers of rows")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="rows per call")
+    parser.add_argument("--warmup-probe", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.warmup_probe:
+        print(json.dumps(measure_warmup()))
+    else:
+        print(format_report(run_benchmark(args.sizes, args.chunk_size)))
@@ -0,0 +1,308 @@
+# analysis/dataset_io.py
+
+# Import libraries
+import json                     # schema metadata stored with the Parquet files
+import os                       # output paths and partition folders
+import shutil                   # replaces an existing partitioned dataset
+import time                     # creation timestamp in the metadata
+
+import pandas as pd             # dataset chunks and CSV output
+import pyarrow as pa            # columnar tables for Parquet
+import pyarrow.parquet as pq    # incremental Parquet writer and column-projected reads
+
+# Backend modules
+import loaders.paths as paths   # data folder of the package (tax_calculator_app/data)
+
+
+##################################################################################################
+
+### Savings dataset: columns and file locations
+# The generator writes the dataset chunk by chunk, training reads back only the columns it needs.
+#   Parquet (default): data/deduction_savings_dataset.parquet
+#       - a single file with one row group per chunk, or
+#       - a folder with one sub folder per partition value (e.g. commune=St. Gallen/part-0.parquet)
+#   CSV (optional):    data/deduction_savings_dataset.csv
+
+# Generated files: always in tax_calculator_app/data, also while TAX_APP_DATA_DIR points the
+# loaders to other input tables (see loaders/paths.py)
+PARQUET_PATH = paths.generated_data_path("deduction_savings_dataset.parquet")
+CSV_PATH = paths.generated_data_path("deduction_savings_dataset.csv")
+
+# Model inputs, in the order used for training and prediction
+FEATURE_COLS = [
+    "income_gross",
+    "age",
+    "employed",
+    "marital_status",
+    "is_two_income_couple",
+    "number_of_children_under_7",
+    "number_of_children_7_and_over",
+    "number_of_children",
+    "commune",
+    "church_affiliation",
+    "contribution_pillar_3a",
+    "total_insurance_expenses",
+    "travel_expenses_main_income",
+    "child_care_expenses_third_party",
+    "taxable_assets",
+    "child_education_expenses",
+]
+
+# Categorical model inputs (one-hot encoded in training)
+CATEGORICAL_COLS = ["marital_status", "commune", "church_affiliation"]
+
+# Targets: estimated tax savings when a specific deduction is maxed
+TARGET_COLS = ["delta_3a", "delta_childcare", "delta_insurance"]
+
+# Columns that can be used to partition the Parquet dataset
+PARTITION_COLUMNS = ("commune", "household_class")
+
+# Rows per Parquet row group (partitions are buffered until they reach this size)
+DEFAULT_ROW_GROUP_SIZE = 100_000
+
+# Rows buffered over all partitions, as a multiple of the row group size; above it the largest
+# partitions are written early (with smaller row groups) so memory stays bounded
+MAX_BUFFERED_ROW_GROUPS = 2
+
+# Key of the dataset description in the Parquet schema metadata
+METADATA_KEY = b"tax_calculator.savings_dataset"
+
+
+def household_class(df):
+    """
+    Household class per row: marital status and whether there are children,
+    e.g. "single", "single_with_children", "married", "married_with_children".
+    """
+    with_children = df["number_of_children"].to_numpy() > 0
+    return df["marital_status"].astype(str).where(~with_children, df["marital_status"].astype(str) + "_with_children")
+
+
+##################################################################################################
+
+### Writers
+
+
+def write_parquet_dataset(chunks, path=PARQUET_PATH, partition_by=None, metadata=None,
+                          row_group_size=DEFAULT_ROW_GROUP_SIZE):
+    """
+    Write DataFrame chunks to Parquet incrementally, without holding the full dataset.
+
+    Partitioned datasets buffer every partition until it fills a row group; once all buffers
+    together exceed MAX_BUFFERED_ROW_GROUPS row groups, the largest partitions are written early
+    (smaller row groups), so at most about that many rows are held besides the current chunk.
+
+    Parameters:
+        chunks (iterable of pd.DataFrame): dataset chunks with identical columns.
+        path (str): output file (unpartitioned) or folder (partitioned).
+        partition_by (str or None): "commune", "household_class" or None.
+        metadata (dict or None): dataset description stored in the schema metadata
+            (e.g. seed and number of samples); column lists are added automatically.
+        row_group_size (int): rows per row group.
+
+    Returns:
+        dict: "rows" written and "files" (list of written file paths).
+    """
+
+    if partition_by is not None and partition_by not in PARTITION_COLUMNS:
+        raise ValueError(f"Unknown partition column: {partition_by}. Use one of {PARTITION_COLUMNS}.")
+
+    description = {
+        **(metadata or {}),
+        "feature_columns": FEATURE_COLS,
+        "target_columns": TARGET_COLS,
+        "partition_by": partition_by,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+    # Replace an existing dataset (a previous partitioned folder or file)
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+    schema = None
+    writers = {}        # partition value -> open ParquetWriter
+    buffers = {}        # partition value -> list of tables not yet written
+    buffered_rows = {}  # partition value -> number of buffered rows
+    max_buffered_rows = MAX_BUFFERED_ROW_GROUPS * row_group_size
+    rows = 0
+
+    def flush(key):
+        if not buffers.get(key):
+            return
+        if key not in writers:
+            if key is None:
+                file_path = path
+            else:
+                folder = os.path.join(path, f"{partition_by}={key}")
+                os.makedirs(folder, exist_ok=True)
+                file_path = os.path.join(folder, "part-0.parquet")
+            writers[key] = pq.ParquetWriter(file_path, schema)
+        writers[key].write_table(pa.concat_tables(buffers[key]), row_group_size=row_group_size)
+        buffers[key] = []
+        buffered_rows[key] = 0
+
+    try:
+        for chunk in chunks:
+            if partition_by == "household_class":
+                chunk = chunk.assign(household_class=household_class(chunk))
+
+            # Schema from the first chunk; the partition column is encoded in the folder name
+            data_columns = [c for c in chunk.columns if c != partition_by]
+            if schema is None:
+                schema = pa.Schema.from_pandas(chunk[data_columns], preserve_index=False)
+                schema = schema.with_metadata({METADATA_KEY: json.dumps(description).encode("utf-8")})
+
+            groups = [(None, chunk)] if partition_by is None else chunk.groupby(partition_by, sort=False)
+            for key, group in groups:
+                table = pa.Table.from_pandas(group[data_columns], schema=schema, preserve_index=False)
+                buffers.setdefault(key, []).append(table)
+                buffered_rows[key] = buffered_rows.get(key, 0) + len(group)
+                if buffered_rows[key] >= row_group_size:
+                    flush(key)
+            rows += len(chunk)
+
+            # Many small partitions: write the largest ones until one row group is left buffered
+            if sum(buffered_rows.values()) > max_buffered_rows:
+                for key in sorted(buffered_rows, key=buffered_rows.get, reverse=True):
+                    if sum(buffered_rows.values()) <= row_group_size:
+                        break
+                    flush(key)
+
+        for key in list(buffers):
+            flush(key)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    return {"rows": rows, "files": [w.where for w in writers.values()]}
+
+
+def write_csv_dataset(chunks, path=CSV_PATH):
+    """
+    Write DataFrame chunks to one CSV file (header from the first chunk).
+
+    Returns:
+        dict: "rows" written and "files" (the CSV path).
+    """
+
+    rows = 0
+    for i, chunk in enumerate(chunks):
+        chunk.to_csv(path, mode="w" if i == 0 else "a", header=(i == 0), index=False)
+        rows += len(chunk)
+    return {"rows": rows, "files": [path]}
+
+
+##################################################################################################
+
+### Readers
+
+
+def read_dataset_metadata(path=PARQUET_PATH):
+    """Return the dataset description stored with a Parquet dataset (empty dict for CSV)."""
+    if not os.path.exists(path):
+        return {}
+    if os.path.isdir(path):
+        schema = pq.ParquetDataset(path, partitioning="hive").schema
+    else:
+        schema = pq.read_schema(path)
+    raw = (schema.metadata or {}).get(METADATA_KEY)
+    return json.loads(raw) if raw else {}
+
+
+def default_dataset_path():
+    """
+    Savings dataset read by default: the Parquet dataset or the CSV file, whichever was written
+    last (so a newer --csv run is not shadowed by an older Parquet dataset).
+
+    Raises:
+        FileNotFoundError: if neither exists.
+    """
+    existing = [path for path in (PARQUET_PATH, CSV_PATH) if os.path.exists(path)]
+    if not existing:
+        raise FileNotFoundError(
+            f"No savings dataset ({PARQUET_PATH} or {CSV_PATH}); run analysis/generate_savings_dataset.py first."
+        )
+    return max(existing, key=os.path.getmtime)
+
+
+def read_training_data(columns=None, path=None):
+    """
+    Read the savings dataset, only the requested columns.
+
+    Uses the most recently written of the Parquet dataset and the CSV file (default_dataset_path).
+
+    Parameters:
+        columns (list of str or None): columns to read (default: features + targets).
+        path (str or None): dataset path (default: default_dataset_path()).
+
+    Returns:
+        pd.DataFrame: the requested columns, in the requested order.
+    """
+
+    if columns is None:
+        columns = FEATURE_COLS + TARGET_COLS
+    if path is None:
+        path = default_dataset_path()
+
+    if path.endswith(".csv"):
+        return pd.read_csv(path, usecols=columns)[columns]
+
+    # Parquet: only the requested column chunks are read; partition values come from the folder names
+    table = pq.read_table(path, columns=columns, partitioning="hive" if os.path.isdir(path) else None)
+    df = table.to_pandas()
+
+    # Partition columns come back as categoricals; use plain values like the CSV
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(str)
+    return df[columns]
+
+
+def iter_dataset_batches(columns=None, path=None, batch_size=DEFAULT_ROW_GROUP_SIZE):
+    """
+    Stream the savings dataset in batches, only the requested columns.
+
+    Only one batch is held in memory at a time, so datasets larger than memory can be
+    processed. Row order follows the files (and partitions) on disk.
+
+    Parameters:
+        columns (list of str or None): columns to read (default: features + targets).
+        path (str or None): dataset path (default: default_dataset_path()).
+        batch_size (int): maximum number of rows per batch.
+
+    Yields:
+        pd.DataFrame: the requested columns of the next batch of rows.
+    """
+
+    if columns is None:
+        columns = FEATURE_COLS + TARGET_COLS
+    if path is None:
+        path = default_dataset_path()
+
+    if path.endswith(".csv"):
+        for chunk in pd.read_csv(path, usecols=columns, chunksize=batch_size):
+            yield chunk[columns]
+        return
+
+    # Parquet: file by file and row group by row group (pyarrow.dataset reads ahead and uses
+    # more memory); partition values are taken from the "column=value" folder names
+    if os.path.isdir(path):
+        files = []
+        for root, _, names in sorted(os.walk(path)):
+            partition_values = dict(
+                part.split("=", 1) for part in os.path.relpath(root, path).split(os.sep) if "=" in part
+            )
+            files += [(os.path.join(root, name), partition_values) for name in sorted(names) if name.endswith(".parquet")]
+    else:
+        files = [(path, {})]
+
+    for file_path, partition_values in files:
+        parquet_file = pq.ParquetFile(file_path)
+        file_columns = [c for c in columns if c not in partition_values]
+        for batch in parquet_file.iter_batches(batch_size=batch_size, columns=file_columns):
+            df = batch.to_pandas()
+            for col, value in partition_values.items():
+                if col in columns:
+                    df[col] = value
+            yield df[columns]
@@ -1,28 +1,40 @@
 # analysis/generate_savings_dataset.py
 
 # Import libraries
+import json                           # manifest of the committed chunks
+import os                             # chunk files, atomic rename
+import time                           # progress (rows per second, ETA)
 import numpy as np                    # used to generate random user profiles
 import pandas as pd                   # used to build and save the training dataset
+import pyarrow as pa                  # chunk files with the generation parameters in the metadata
+import pyarrow.parquet as pq          # writes and inspects the chunk files
+import sys                            # command line arguments (number of samples, seed)
 
 # Backend modules 
-import loaders.load_datasets as datasets
+import loaders.startup as startup
+import loaders.paths as paths
 import deductions.mandatory_deductions as md
 import deductions.optional_deductions as od
 import tax_calculations.total_income_tax as t
+import tax_calculations.batch_income_tax as bt
+import analysis.dataset_io as dataset_io
+import diagnostics.profiling as profiling
 
 
 
-### Load shared datasets once (tax tables and multipliers)
-# Load federal and cantonal tax rate tables
-tax_rates_federal = datasets.load_federal_tax_rates()
-tax_rates_cantonal = datasets.load_cantonal_base_tax_rates()
+### Shared datasets (tax tables, multipliers and commune names)
+# Loaded once on first use with loaders/startup.py (same context as the app), not at import:
+# importing this module reads no file and does not call the STADA2 API, so process-pool
+# workers and other tools can import it cheaply.
+_context = None
 
-# Load communal/cantonal & church multipliers
-tax_multiplicators_cantonal_municipal = datasets.load_cantonal_municipal_church_multipliers()
 
-# Load communal multipliers
-communal_multipliers = datasets.load_communal_multipliers_validated()
-communes = communal_multipliers["commune"].tolist()  # list of commune names
+def get_context():
+    """App context (tax tables, multipliers, commune names, deduction rules), loaded on first use."""
+    global _context
+    if _context is None:
+        _context = startup.load_app_context()
+    return _context
 
 
 ##################################################################################################
@@ -131,10 +143,11 @@ def compute_total_tax(
     )
 
     ### Total income tax computed using backend function
+    context = get_context()
     income_tax_dictionary = t.calculation_total_income_tax(
-        tax_rates_federal,
-        tax_rates_cantonal,
-        tax_multiplicators_cantonal_municipal,
+        context["tax_rates_federal"],
+        context["tax_rates_cantonal"],
+        context["tax_multiplicators_cantonal_municipal"],
         marital_status=marital_status_norm,
         number_of_children=number_of_children,
         income_net_federal=income_net_federal,
@@ -182,7 +195,7 @@ def random_profile(rng):
     )
 
     # Commune selection
-    commune = rng.choice(communes)
+    commune = rng.choice(get_context()["communes"])
 
     # Church affiliation
     church_affiliation_norm = rng.choice(
@@ -225,41 +238,146 @@ def random_profile(rng):
     }
 
 
+##################################################################################################
+
+### Generate many random user profiles at once
+# Same distributions as random_profile(), but every field is drawn for all profiles in
+# one call. The random stream differs from drawing profile by profile, so the same seed
+# gives different (equally distributed) profiles.
+
+def random_profiles(rng, n_samples, communes):
+    """Generate a batch of random user profiles as columns.
+
+    Args:
+        rng (np.random.Generator): Numpy random generator instance.
+        n_samples (int): Number of profiles to draw.
+        communes (list of str): Commune names to draw from.
+
+    Returns:
+        pd.DataFrame: one row per profile, same columns as random_profile();
+        a profile batch ready for tax_calculations/batch_income_tax.py.
+    """
+
+    # Basic demographics
+    income_gross = rng.integers(30_000, 250_000, size=n_samples).astype(float)
+    age = rng.integers(22, 65, size=n_samples)
+    employed = rng.integers(0, 2, size=n_samples).astype(bool)
+    marital_status_norm = rng.choice(["single", "married"], size=n_samples)
+    is_two_income_couple = (marital_status_norm == "married") & rng.integers(0, 2, size=n_samples).astype(bool)
+
+    # Children
+    number_of_children_under_7 = rng.integers(0, 3, size=n_samples)
+    number_of_children_7_and_over = rng.integers(0, 3, size=n_samples)
+    number_of_children = number_of_children_under_7 + number_of_children_7_and_over
+
+    # Commune selection
+    commune = rng.choice(np.asarray(communes, dtype=object), size=n_samples)
+
+    # Church affiliation ("none" instead of None, as stored in the dataset)
+    church_affiliation_norm = rng.choice(
+        ["roman_catholic", "protestant", "christian_catholic", "none"],
+        size=n_samples,
+        p=[0.35, 0.25, 0.05, 0.35],
+    )
+
+    # Random deductions ("current state"); the upper bound depends on the profile
+    contribution_pillar_3a = rng.integers(0, np.where(employed, 8_000, 40_000)).astype(float)
+    total_insurance_expenses = rng.integers(0, 6_000, size=n_samples).astype(float)
+    travel_expenses_main_income = rng.integers(0, 10_000, size=n_samples).astype(float)
+    child_care_expenses_third_party = np.where(
+        number_of_children > 0, rng.integers(0, 30_000, size=n_samples), 0
+    ).astype(float)
+    taxable_assets = rng.integers(0, 500_000, size=n_samples).astype(float)
+    child_education_expenses = np.where(
+        number_of_children_7_and_over > 0, rng.integers(0, 20_000, size=n_samples), 0
+    ).astype(float)
+
+    return pd.DataFrame({
+        "income_gross": income_gross,
+        "age": age,
+        "employed": employed,
+        "marital_status": marital_status_norm,
+        "is_two_income_couple": is_two_income_couple,
+        "number_of_children_under_7": number_of_children_under_7,
+        "number_of_children_7_and_over": number_of_children_7_and_over,
+        "number_of_children": number_of_children,
+        "commune": commune,
+        "church_affiliation": church_affiliation_norm,
+        "contribution_pillar_3a": contribution_pillar_3a,
+        "total_insurance_expenses": total_insurance_expenses,
+        "travel_expenses_main_income": travel_expenses_main_income,
+        "child_care_expenses_third_party": child_care_expenses_third_party,
+        "taxable_assets": taxable_assets,
+        "child_education_expenses": child_education_expenses,
+    })
+
+
+##################################################################################################
+
+### Baseline tax and savings deltas for a whole batch
+
+# Large number to force deductions to hit their maximum caps
+BIG = 50_000
+
+# Savings scenarios: target column -> deduction input that is maxed
+SAVINGS_SCENARIOS = {
+    "delta_3a": "contribution_pillar_3a",
+    "delta_childcare": "child_care_expenses_third_party",
+    "delta_insurance": "total_insurance_expenses",
+}
+
+
+def compute_savings_batch(profiles, tax_tables):
+    """Compute baseline tax and the three savings deltas for a profile batch.
+
+    Vectorized equivalent of the compute_total_tax() calls in the per-profile loop:
+    one batch evaluation for the baseline and one per scenario.
+
+    Args:
+        profiles (pd.DataFrame): profile batch, e.g. from random_profiles().
+        tax_tables (dict): compiled tax tables (total_income_tax.compile_tax_tables).
+
+    Returns:
+        pd.DataFrame: "total_tax", "delta_3a", "delta_childcare", "delta_insurance".
+    """
+
+    baseline_tax = bt.calculate_income_tax_batch(profiles, tax_tables)["total_income_tax"]
+
+    result = {"total_tax": baseline_tax}
+    for target, deduction in SAVINGS_SCENARIOS.items():
+        scenario_tax = bt.calculate_income_tax_batch(profiles.assign(**{deduction: float(BIG)}), tax_tables)
+        result[target] = np.maximum(0.0, baseline_tax - scenario_tax["total_income_tax"])
+
+    return pd.DataFrame(result, index=profiles.index)
+
+
 ##################################################################################################
 
 ### Generate dataset for ML training
 
-def main(n_samples=4000, seed=42):
-    """Generate the ML training dataset for tax-saving estimation models.
+def generate_dataset_scalar(n_samples=4000, seed=42):
+    """Generate the training dataset profile by profile (reference implementation).
 
-    This function:
-      1. Creates 'n_samples' random user profiles.
-      2. Computes their baseline total income tax.
-      3. Computes three alternative scenarios where:
-            - Pillar 3a deduction is maxed
-            - Childcare deduction is maxed
-            - Insurance deduction is maxed
-      4. Calculates tax savings (delta values) for each scenario.
-      5. Stores all profiles and computed tax deltas in a single DataFrame.
-      6. Saves the final dataset to `data/deduction_savings_dataset.csv`.
+    Draws each profile with random_profile() and evaluates the baseline and the
+    three scenarios with compute_total_tax(). Slow, but it is the same calculation
+    as the Streamlit app, so it serves as a reference for the vectorized version.
 
     Args:
         n_samples (int): Number of synthetic training samples to generate.
         seed (int): Random seed for reproducibility.
 
     Returns:
-        None, as function only writes to disk  
+        pd.DataFrame: profiles with "total_tax" and the three delta columns.
     """
 
     rng = np.random.default_rng(seed)
     rows = []
-
-    BIG = 50_000  # Large number to force deductions to hit their maximum caps
+    start = time.perf_counter()
 
     for i in range(n_samples):
-        # Print in order to check on process 
-        if i % 100 == 0:
-            print(f"Generated {i}/{n_samples}")
+        # Print in order to check on process (every 1000 rows)
+        if i % 1000 == 0 and i > 0:
+            print(format_progress(i, n_samples, i, time.perf_counter() - start))
 
         profile = random_profile(rng)
 
@@ -371,10 +489,386 @@ def main(n_samples=4000, seed=42):
             }
         )
 
-    ### Create full dataset and save to CSV
-    df = pd.DataFrame(rows)
-    df.to_csv("data/deduction_savings_dataset.csv", index=False)
-    print("Saved dataset to data/deduction_savings_dataset.csv")
+    return pd.DataFrame(rows)
+
+
+def chunk_rng(seed, chunk_number):
+    """Random generator of one chunk, derived from the dataset seed and the chunk number.
+
+    Every chunk has its own random stream, so a chunk can be (re)generated on its own
+    and gives the same profiles as in an uninterrupted run.
+    """
+    return np.random.default_rng([seed, chunk_number])
+
 
+def generate_chunk(chunk_number, n_samples, seed, chunk_size, tax_tables):
+    """Generate one numbered chunk of the training dataset.
+
+    Args:
+        chunk_number (int): 0-based chunk number (rows chunk_number * chunk_size onwards).
+        n_samples (int): Total number of samples of the dataset (the last chunk may be shorter).
+        seed (int): Random seed of the dataset.
+        chunk_size (int): Number of profiles per chunk.
+        tax_tables (dict): compiled tax tables (total_income_tax.compile_tax_tables).
+
+    Returns:
+        pd.DataFrame: profiles with "total_tax" and the three delta columns.
+    """
 
+    n_rows = min(chunk_size, n_samples - chunk_number * chunk_size)
+    profiles = random_profiles(chunk_rng(seed, chunk_number), n_rows, get_context()["communes"])
+    return pd.concat([profiles, compute_savings_batch(profiles, tax_tables)], axis=1)
 
+
+def format_progress(rows_done, n_samples, rows_this_run, elapsed):
+    """Progress line with rows per second and ETA (rate of the rows generated in this run)."""
+    rate = rows_this_run / elapsed if elapsed > 0 else 0.0
+    eta = (n_samples - rows_done) / rate if rate > 0 else float("nan")
+    return (f"Generated {rows_done:,}/{n_samples:,} rows ({rows_done / n_samples:.0%})  "
+            f"{rate:,.0f} rows/s  ETA {eta:,.0f} s")
+
+
+def iter_dataset_chunks(n_samples=4000, seed=42, chunk_size=100_000):
+    """Yield the training dataset chunk by chunk (vectorized sampler and batch evaluation).
+
+    Only one chunk exists at a time, so memory stays bounded for millions of rows.
+
+    Args:
+        n_samples (int): Number of synthetic training samples to generate.
+        seed (int): Random seed for reproducibility.
+        chunk_size (int): Number of profiles drawn and evaluated at once.
+
+    Yields:
+        pd.DataFrame: profiles with "total_tax" and the three delta columns.
+    """
+
+    tax_tables = get_context()["tax_tables"]
+    start = time.perf_counter()
+
+    for chunk_number in range(-(-n_samples // chunk_size)):
+        chunk = generate_chunk(chunk_number, n_samples, seed, chunk_size, tax_tables)
+        yield chunk
+        rows_done = chunk_number * chunk_size + len(chunk)
+        print(format_progress(rows_done, n_samples, rows_done, time.perf_counter() - start))
+
+
+##################################################################################################
+
+### Checkpointed generation
+# Long runs (millions of rows) write every chunk to its own Parquet file in a chunk folder
+# (default: data/deduction_savings_dataset.chunks/chunk-00000.parquet, ...). A chunk is first
+# written to a ".tmp" file and then renamed, so a chunk file is either complete or missing.
+# manifest.json records the parameters (n_samples, seed, chunk_size) and the committed chunks;
+# it is replaced the same way after every chunk. Every chunk file also carries the parameters
+# in its schema metadata, so a lost or damaged manifest is rebuilt from the chunk files.
+#
+# A restarted run with the same parameters keeps the committed chunks and continues with the
+# first missing one; with other parameters it starts over. Since every chunk has its own
+# random stream (chunk_rng), the merged dataset is the same as from an uninterrupted run.
+#
+# Only the generator's own files (manifest.json, chunk-*.parquet and their ".tmp" files) are
+# ever removed, never the folder's other contents: a non-empty folder that is not a chunk
+# folder (e.g. --checkpoint-dir=data) is refused.
+
+CHECKPOINT_DIR = paths.generated_data_path("deduction_savings_dataset.chunks")
+MANIFEST_FILE = "manifest.json"
+
+# Marks manifests and chunk files written by generate_checkpointed
+CHECKPOINT_FORMAT = "tax_calculator.savings_dataset_chunks"
+CHUNK_METADATA_KEY = CHECKPOINT_FORMAT.encode("utf-8")
+
+
+def _chunk_file(chunk_number):
+    return f"chunk-{chunk_number:05d}.parquet"
+
+
+def _chunk_number(file_name):
+    """Chunk number of a chunk file name (None for any other file)."""
+    stem = file_name[len("chunk-"):-len(".parquet")]
+    if file_name.startswith("chunk-") and file_name.endswith(".parquet") and stem.isdigit():
+        return int(stem)
+    return None
+
+
+def _is_checkpoint_file(file_name):
+    """True for the files the generator writes into a chunk folder."""
+    name = file_name[:-len(".tmp")] if file_name.endswith(".tmp") else file_name
+    return name == MANIFEST_FILE or _chunk_number(name) is not None
+
+
+def _replace_atomically(path, write):
+    """Call write(tmp_path), then rename the temporary file to path."""
+    tmp_path = path + ".tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _write_manifest(checkpoint_dir, manifest):
+    def write(tmp_path):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+    _replace_atomically(os.path.join(checkpoint_dir, MANIFEST_FILE), write)
+
+
+def _write_chunk(path, chunk, parameters):
+    """Write a chunk to Parquet, with the generation parameters in the schema metadata."""
+    table = pa.Table.from_pandas(chunk, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        CHUNK_METADATA_KEY: json.dumps(parameters).encode("utf-8"),
+    })
+    pq.write_table(table, path)
+
+
+def _new_manifest(parameters, n_chunks):
+    return {"format": CHECKPOINT_FORMAT, "parameters": parameters, "n_chunks": n_chunks, "chunks": {}}
+
+
+def load_manifest(checkpoint_dir=CHECKPOINT_DIR):
+    """Manifest of a chunk folder (None if there is none, it cannot be read or it is not a chunk manifest)."""
+    try:
+        with open(os.path.join(checkpoint_dir, MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or manifest.get("format") != CHECKPOINT_FORMAT:
+        return None
+    if not isinstance(manifest.get("parameters"), dict) or not isinstance(manifest.get("chunks"), dict):
+        return None
+    return manifest
+
+
+def rebuild_manifest(checkpoint_dir, parameters):
+    """
+    Rebuild the manifest of a chunk folder from its chunk files.
+
+    Chunk files written with the given parameters are kept as committed chunks; chunk files
+    of other parameters or without readable parameters are removed.
+
+    Returns:
+        dict: the rebuilt manifest (already written to manifest.json).
+    """
+    n_chunks = -(-parameters["n_samples"] // parameters["chunk_size"])
+    manifest = _new_manifest(parameters, n_chunks)
+    for name in sorted(os.listdir(checkpoint_dir)):
+        chunk_number = _chunk_number(name)
+        if chunk_number is None:
+            continue
+        path = os.path.join(checkpoint_dir, name)
+        try:
+            schema = pq.read_schema(path)
+            chunk_parameters = json.loads((schema.metadata or {})[CHUNK_METADATA_KEY])
+            rows = pq.ParquetFile(path).metadata.num_rows
+        except (OSError, KeyError, ValueError, pa.ArrowException):
+            chunk_parameters = None
+        if chunk_parameters == parameters and chunk_number < n_chunks:
+            manifest["chunks"][str(chunk_number)] = {"file": name, "rows": rows}
+        else:
+            os.remove(path)
+    _write_manifest(checkpoint_dir, manifest)
+    return manifest
+
+
+def remove_checkpoints(checkpoint_dir=CHECKPOINT_DIR):
+    """
+    Remove the generator's files from a chunk folder, and the folder itself if it is then empty.
+
+    Raises:
+        ValueError: if the folder has no valid manifest (it is left untouched).
+    """
+    if load_manifest(checkpoint_dir) is None:
+        raise ValueError(f"{checkpoint_dir} is not a chunk folder of this generator (no valid {MANIFEST_FILE})")
+    for name in os.listdir(checkpoint_dir):
+        if name != MANIFEST_FILE and _is_checkpoint_file(name):
+            os.remove(os.path.join(checkpoint_dir, name))
+    # The manifest last, so an interrupted cleanup can be repeated
+    os.remove(os.path.join(checkpoint_dir, MANIFEST_FILE))
+    if not os.listdir(checkpoint_dir):
+        os.rmdir(checkpoint_dir)
+
+
+def _open_checkpoints(checkpoint_dir, parameters, n_chunks):
+    """Manifest of the chunk folder for these parameters: resumed, rebuilt or new."""
+    if not os.path.isdir(checkpoint_dir):
+        os.makedirs(checkpoint_dir)
+        manifest = _new_manifest(parameters, n_chunks)
+        _write_manifest(checkpoint_dir, manifest)
+        return manifest
+
+    manifest = load_manifest(checkpoint_dir)
+    if manifest is None:
+        foreign = [name for name in os.listdir(checkpoint_dir) if not _is_checkpoint_file(name)]
+        if foreign:
+            raise ValueError(
+                f"{checkpoint_dir} is not empty and has no valid {MANIFEST_FILE} "
+                f"(e.g. {sorted(foreign)[0]!r}); use an empty or new folder for the chunks."
+            )
+        print(f"Rebuilding the manifest of {checkpoint_dir} from its chunk files")
+        return rebuild_manifest(checkpoint_dir, parameters)
+
+    if manifest["parameters"] != parameters:
+        print(f"Chunks in {checkpoint_dir} were generated with {manifest['parameters']}, starting over")
+        remove_checkpoints(checkpoint_dir)
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        manifest = _new_manifest(parameters, n_chunks)
+        _write_manifest(checkpoint_dir, manifest)
+    return manifest
+
+
+def generate_checkpointed(n_samples=4000, seed=42, chunk_size=100_000, checkpoint_dir=CHECKPOINT_DIR):
+    """Generate all chunks of the training dataset into a chunk folder, resuming a previous run.
+
+    Args:
+        n_samples (int): Number of synthetic training samples to generate.
+        seed (int): Random seed for reproducibility.
+        chunk_size (int): Number of profiles per chunk.
+        checkpoint_dir (str): Folder with the chunk files and manifest.json (new, empty or
+            a chunk folder of a previous run).
+
+    Returns:
+        dict: the manifest ("chunks": chunk number -> {"file", "rows"}, all chunks committed).
+
+    Raises:
+        ValueError: if checkpoint_dir holds other files and no valid manifest.
+    """
+
+    parameters = {"n_samples": n_samples, "seed": seed, "chunk_size": chunk_size}
+    n_chunks = -(-n_samples // chunk_size)
+
+    manifest = _open_checkpoints(checkpoint_dir, parameters, n_chunks)
+
+    # Committed chunks: listed in the manifest and the file still exists
+    committed = {
+        number: entry for number, entry in manifest["chunks"].items()
+        if os.path.exists(os.path.join(checkpoint_dir, entry["file"]))
+    }
+    manifest["chunks"] = committed
+    missing = [number for number in range(n_chunks) if str(number) not in committed]
+    if committed and missing:
+        print(f"Resuming: {len(committed)}/{n_chunks} chunks already committed, "
+              f"continuing with chunk {missing[0]}")
+
+    # Leftovers of a chunk that was being written when the previous run stopped
+    for name in os.listdir(checkpoint_dir):
+        if name.endswith(".tmp") and _is_checkpoint_file(name):
+            os.remove(os.path.join(checkpoint_dir, name))
+
+    tax_tables = get_context()["tax_tables"]
+    rows_done = sum(entry["rows"] for entry in committed.values())
+    rows_this_run = 0
+    start = time.perf_counter()
+
+    for chunk_number in missing:
+        chunk = generate_chunk(chunk_number, n_samples, seed, chunk_size, tax_tables)
+        file_name = _chunk_file(chunk_number)
+        _replace_atomically(
+            os.path.join(checkpoint_dir, file_name),
+            lambda tmp_path: _write_chunk(tmp_path, chunk, parameters),
+        )
+        manifest["chunks"][str(chunk_number)] = {"file": file_name, "rows": len(chunk)}
+        _write_manifest(checkpoint_dir, manifest)
+
+        rows_done += len(chunk)
+        rows_this_run += len(chunk)
+        print(format_progress(rows_done, n_samples, rows_this_run, time.perf_counter() - start))
+
+    return manifest
+
+
+def iter_checkpoint_chunks(manifest, checkpoint_dir=CHECKPOINT_DIR):
+    """Read the committed chunks back in chunk order (merge step)."""
+    for chunk_number in range(manifest["n_chunks"]):
+        entry = manifest["chunks"][str(chunk_number)]
+        yield pd.read_parquet(os.path.join(checkpoint_dir, entry["file"]))
+
+
+def generate_dataset(n_samples=4000, seed=42, chunk_size=100_000):
+    """Generate the full training dataset in memory (see iter_dataset_chunks).
+
+    Returns:
+        pd.DataFrame: profiles with "total_tax" and the three delta columns.
+    """
+
+    return pd.concat(list(iter_dataset_chunks(n_samples, seed, chunk_size)), ignore_index=True)
+
+
+def main(n_samples=4000, seed=42, vectorized=True, output_format="parquet", partition_by=None,
+         chunk_size=100_000, checkpoint_dir=CHECKPOINT_DIR, keep_checkpoints=False):
+    """Generate the ML training dataset for tax-saving estimation models.
+
+    This function:
+      1. Creates 'n_samples' random user profiles.
+      2. Computes their baseline total income tax.
+      3. Computes three alternative scenarios where:
+            - Pillar 3a deduction is maxed
+            - Childcare deduction is maxed
+            - Insurance deduction is maxed
+      4. Calculates tax savings (delta values) for each scenario.
+      5. Commits the chunks to a chunk folder (resuming an interrupted run, see
+         generate_checkpointed) and merges them into
+         `data/deduction_savings_dataset.parquet` (default) or
+         `data/deduction_savings_dataset.csv`.
+
+    Args:
+        n_samples (int): Number of synthetic training samples to generate.
+        seed (int): Random seed for reproducibility.
+        vectorized (bool): Use the vectorized sampler and batch evaluation
+            (default) or the profile-by-profile reference implementation.
+        output_format (str): "parquet" (default) or "csv".
+        partition_by (str or None): Parquet only: "commune" or "household_class".
+        chunk_size (int): Profiles per chunk, also the Parquet row group size.
+        checkpoint_dir (str): Folder for the committed chunks (vectorized only).
+        keep_checkpoints (bool): Keep the chunk folder after the merge.
+
+    Returns:
+        None, as function only writes to disk  
+    """
+
+    ### Create dataset chunk by chunk and write it
+    if vectorized:
+        manifest = generate_checkpointed(n_samples, seed, chunk_size, checkpoint_dir)
+        chunks = iter_checkpoint_chunks(manifest, checkpoint_dir)
+    else:
+        chunks = [generate_dataset_scalar(n_samples, seed)]
+
+    if output_format == "csv":
+        written = dataset_io.write_csv_dataset(chunks, dataset_io.CSV_PATH)
+    elif output_format == "parquet":
+        written = dataset_io.write_parquet_dataset(
+            chunks,
+            dataset_io.PARQUET_PATH,
+            partition_by=partition_by,
+            metadata={"n_samples": n_samples, "seed": seed, "vectorized": vectorized,
+                      "chunk_size": chunk_size},
+            row_group_size=chunk_size,
+        )
+    else:
+        raise ValueError(f"Unknown output format: {output_format}. Use 'parquet' or 'csv'.")
+
+    print(f"Saved {written['rows']} rows to {len(written['files'])} file(s) "
+          f"({dataset_io.CSV_PATH if output_format == 'csv' else dataset_io.PARQUET_PATH})")
+
+    # The merged dataset is complete, the chunks are no longer needed
+    if vectorized and not keep_checkpoints:
+        remove_checkpoints(checkpoint_dir)
+
+
+if __name__ == "__main__":
+    # Profiled only if enabled through TAX_APP_PROFILE (see diagnostics/profiling.py)
+    # Usage: python -m analysis.generate_savings_dataset [n_samples] [seed]
+    #          [--scalar] [--csv] [--partition-by=commune|household_class]
+    #          [--chunk-size=100000] [--checkpoint-dir=...] [--keep-checkpoints]
+    # An interrupted run resumes from its committed chunks when started again with the same arguments
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    options = dict(a[2:].split("=", 1) if "=" in a else (a[2:], True) for a in sys.argv[1:] if a.startswith("--"))
+    with profiling.profiled("generate_savings_dataset"):
+        main(
+            n_samples=int(args[0]) if len(args) > 0 else 4000,
+            seed=int(args[1]) if len(args) > 1 else 42,
+            vectorized="scalar" not in options,
+            output_format="csv" if "csv" in options else "parquet",
+            partition_by=options.get("partition-by"),
+            chunk_size=int(options.get("chunk-size", 100_000)),
+            checkpoint_dir=options.get("checkpoint-dir", CHECKPOINT_DIR),
+            keep_checkpoints="keep-checkpoints" in options,
+        )
@@ -0,0 +1,349 @@
+# analysis/model_selection.py
+
+# Import libraries
+import argparse                 # command line options (latency budget, rows, report path)
+import io                       # in-memory buffer to measure the artifact size
+import os                       # model output directory
+import time                     # inference latency
+
+import joblib                   # artifact size (same serialization as the saved models)
+import numpy as np              # latency percentiles
+
+# Scikit-learn candidates
+from sklearn.model_selection import train_test_split
+from sklearn.compose import ColumnTransformer
+from sklearn.preprocessing import OneHotEncoder, SplineTransformer
+from sklearn.pipeline import Pipeline
+from sklearn.ensemble import RandomForestRegressor, HistGradientBoostingRegressor
+from sklearn.linear_model import Ridge
+from sklearn.metrics import mean_absolute_error, r2_score
+
+# Backend modules
+import analysis.dataset_io as dataset_io
+import loaders.paths as paths
+
+
+##################################################################################################
+
+### Latency-aware model selection
+# The app predicts the three savings targets for one profile after every "Calculate"
+# (model.predict on a one-row DataFrame), so the single-row latency of the pipeline is what
+# a user waits for. For every target, each candidate below is trained on the same split and
+# measured on:
+#   - accuracy:            R² and MAE on the held-out rows
+#   - single-row latency:  p50 / p95 of predict() on one-row DataFrames (as in the app)
+#   - batch latency:       microseconds per row of one predict() on BATCH_ROWS rows
+#   - artifact size:       size of the joblib dump (what models/savings_<target>.pkl would be)
+#
+# The selected model per target is the most accurate candidate whose single-row p95 is within
+# the latency budget (and within the size budget, if one is set). The report also marks the
+# Pareto front: candidates that no other candidate beats on R², single-row p95 and size at once.
+#
+# Usage (from the tax_calculator_app folder):
+#   python -m analysis.model_selection [--budget-ms 5] [--max-size-mb 20] [--max-rows 50000]
+#                                      [--report models/model_selection_report.md] [--save]
+
+# Default budget for the p95 single-row latency (milliseconds)
+DEFAULT_LATENCY_BUDGET_MS = 5.0
+
+# Default number of dataset rows used (train + test); forests and boosting get slow to compare above that
+DEFAULT_MAX_ROWS = 50_000
+
+# Number of single-row predictions timed per candidate, and rows of the batch prediction
+SINGLE_ROW_REPEATS = 200
+BATCH_ROWS = 10_000
+
+# Candidate name of the model the app currently ships (training_savings_models.main)
+BASELINE = "rf_60_d10"
+
+
+def _forest(n_estimators, max_depth, **kwargs):
+    """Random forest factory; trained on all cores, served single-threaded."""
+    return lambda: RandomForestRegressor(
+        n_estimators=n_estimators, max_depth=max_depth, random_state=42, n_jobs=-1, **kwargs
+    )
+
+
+# Candidate models: name -> (estimator factory, preprocessing kind)
+#   "onehot": one-hot encoded categoricals, numerics passed through (as in training_savings_models)
+#   "spline": one-hot categoricals, degree-1 splines on the numerics (piecewise linear features)
+CANDIDATES = {
+    # current model (60 trees, depth 10) and smaller forests
+    "rf_60_d10": (_forest(60, 10), "onehot"),
+    "rf_20_d10": (_forest(20, 10), "onehot"),
+    "rf_10_d8": (_forest(10, 8), "onehot"),
+    "rf_60_d6": (_forest(60, 6), "onehot"),
+    # pruned forest: large leaves and cost-complexity pruning remove most of the nodes
+    "rf_20_pruned": (_forest(20, 12, min_samples_leaf=20, ccp_alpha=50.0), "onehot"),
+    # gradient boosting (histogram based: shallow trees, fast to train)
+    "hgb_100": (lambda: HistGradientBoostingRegressor(max_iter=100, random_state=42), "onehot"),
+    "hgb_300": (lambda: HistGradientBoostingRegressor(max_iter=300, learning_rate=0.1, random_state=42), "onehot"),
+    # linear piecewise: the tax schedules are piecewise linear in income, so a ridge
+    # regression on piecewise-linear spline features can follow the brackets and caps
+    "piecewise_linear": (lambda: Ridge(alpha=1.0), "spline"),
+    # plain linear model: lower bound on cost and accuracy
+    "linear": (lambda: Ridge(alpha=1.0), "onehot"),
+}
+
+
+def build_pipeline(name):
+    """Build the preprocessing + model pipeline of a candidate (same format as the saved models)."""
+
+    factory, preprocessing = CANDIDATES[name]
+    categorical_cols = dataset_io.CATEGORICAL_COLS
+    numeric_cols = [c for c in dataset_io.FEATURE_COLS if c not in categorical_cols]
+
+    if preprocessing == "spline":
+        numeric = SplineTransformer(n_knots=12, degree=1, knots="quantile")
+    else:
+        numeric = "passthrough"
+
+    preprocessor = ColumnTransformer(
+        transformers=[
+            ("cat", OneHotEncoder(handle_unknown="ignore", sparse_output=False), categorical_cols),
+            ("num", numeric, numeric_cols),
+        ]
+    )
+    return Pipeline(steps=[("preprocess", preprocessor), ("model", factory())])
+
+
+def _serving_copy(pipeline, name):
+    """
+    Prepare a fitted pipeline for serving: forests predict single-threaded.
+
+    With n_jobs=-1 every predict() starts a thread pool, which dominates the latency of one
+    row. The baseline is kept as shipped so the report shows what the app pays today.
+    """
+    model = pipeline.named_steps["model"]
+    if name != BASELINE and hasattr(model, "n_jobs"):
+        model.set_params(n_jobs=1)
+    return pipeline
+
+
+def measure_latency(pipeline, X_test, repeats=SINGLE_ROW_REPEATS, batch_rows=BATCH_ROWS):
+    """
+    Measure the inference latency of a fitted pipeline.
+
+    Args:
+        pipeline: fitted sklearn pipeline.
+        X_test (pd.DataFrame): held-out feature rows.
+        repeats (int): number of timed single-row predictions.
+        batch_rows (int): rows of the timed batch prediction.
+
+    Returns:
+        dict: "single_p50_ms", "single_p95_ms" and "batch_us_per_row".
+    """
+
+    rows = [X_test.iloc[[i % len(X_test)]] for i in range(repeats)]
+    pipeline.predict(rows[0])  # warm-up
+
+    timings = []
+    for row in rows:
+        start = time.perf_counter()
+        pipeline.predict(row)
+        timings.append(time.perf_counter() - start)
+
+    batch = X_test.iloc[:batch_rows]
+    start = time.perf_counter()
+    pipeline.predict(batch)
+    batch_seconds = time.perf_counter() - start
+
+    return {
+        "single_p50_ms": float(np.percentile(timings, 50)) * 1000,
+        "single_p95_ms": float(np.percentile(timings, 95)) * 1000,
+        "batch_us_per_row": batch_seconds / len(batch) * 1e6,
+    }
+
+
+def artifact_size_mb(pipeline):
+    """Size of the joblib dump of a pipeline (MB)."""
+    buffer = io.BytesIO()
+    joblib.dump(pipeline, buffer)
+    return buffer.tell() / 1e6
+
+
+def pareto_front(results):
+    """
+    Mark the Pareto-optimal candidates of one target.
+
+    A candidate is dominated if another candidate is at least as good on R², single-row p95
+    and artifact size, and strictly better on one of them.
+
+    Returns:
+        set: names of the non-dominated candidates.
+    """
+
+    def objectives(r):
+        return (-r["r2"], r["single_p95_ms"], r["size_mb"])
+
+    front = set()
+    for r in results:
+        a = objectives(r)
+        dominated = any(
+            all(x <= y for x, y in zip(objectives(other), a)) and objectives(other) != a
+            for other in results if other is not r
+        )
+        if not dominated:
+            front.add(r["model"])
+    return front
+
+
+def select_model(results, budget_ms=DEFAULT_LATENCY_BUDGET_MS, max_size_mb=None):
+    """
+    Pick the most accurate candidate within the budgets.
+
+    Args:
+        results (list of dict): measured candidates of one target.
+        budget_ms (float): budget for the single-row p95 latency.
+        max_size_mb (float or None): optional budget for the artifact size.
+
+    Returns:
+        dict: the selected result (the fastest candidate if none fits the budgets).
+    """
+
+    within = [
+        r for r in results
+        if r["single_p95_ms"] <= budget_ms and (max_size_mb is None or r["size_mb"] <= max_size_mb)
+    ]
+    if not within:
+        return min(results, key=lambda r: r["single_p95_ms"])
+    return max(within, key=lambda r: r["r2"])
+
+
+def run_selection(candidates=None, targets=None, max_rows=DEFAULT_MAX_ROWS, budget_ms=DEFAULT_LATENCY_BUDGET_MS,
+                  max_size_mb=None, seed=42):
+    """
+    Train and measure all candidates for every target.
+
+    Args:
+        candidates (list of str or None): names of CANDIDATES (default: all).
+        targets (list of str or None): savings targets (default: dataset_io.TARGET_COLS).
+        max_rows (int or None): random sample of the dataset used (None: all rows).
+        budget_ms (float): budget for the single-row p95 latency.
+        max_size_mb (float or None): optional budget for the artifact size.
+        seed (int): seed for the sample and the train/test split.
+
+    Returns:
+        dict: per target "results" (list of dict per candidate, with "pareto"),
+              "selected" (name) and "pipelines" (fitted pipelines by name).
+    """
+
+    candidates = candidates or list(CANDIDATES)
+    targets = targets or dataset_io.TARGET_COLS
+
+    df = dataset_io.read_training_data(dataset_io.FEATURE_COLS + targets)
+    if max_rows is not None and len(df) > max_rows:
+        df = df.sample(n=max_rows, random_state=seed)
+    X = df[dataset_io.FEATURE_COLS]
+
+    selection = {}
+    for target in targets:
+        X_train, X_test, y_train, y_test = train_test_split(X, df[target], test_size=0.2, random_state=seed)
+
+        results, pipelines = [], {}
+        for name in candidates:
+            pipeline = build_pipeline(name)
+            start = time.perf_counter()
+            pipeline.fit(X_train, y_train)
+            fit_seconds = time.perf_counter() - start
+            pipeline = _serving_copy(pipeline, name)
+
+            prediction = pipeline.predict(X_test)
+            result = {
+                "model": name,
+                "r2": r2_score(y_test, prediction),
+                "mae": mean_absolute_error(y_test, prediction),
+                "fit_seconds": fit_seconds,
+                "size_mb": artifact_size_mb(pipeline),
+                **measure_latency(pipeline, X_test),
+            }
+            results.append(result)
+            pipelines[name] = pipeline
+            print(f"{target:16} {name:18} R² {result['r2']:.4f}  p95 {result['single_p95_ms']:7.2f} ms  "
+                  f"{result['size_mb']:7.2f} MB")
+
+        front = pareto_front(results)
+        for r in results:
+            r["pareto"] = r["model"] in front
+
+        selection[target] = {
+            "results": results,
+            "selected": select_model(results, budget_ms, max_size_mb)["model"],
+            "pipelines": pipelines,
+        }
+    return selection
+
+
+def format_report(selection, budget_ms=DEFAULT_LATENCY_BUDGET_MS, max_size_mb=None):
+    """Build the Markdown report: one table per target, Pareto front and selected model marked."""
+
+    size_budget = f", artifact size <= {max_size_mb:g} MB" if max_size_mb is not None else ""
+    lines = [
+        "# Savings model selection",
+        "",
+        f"Budget: single-row p95 <= {budget_ms:g} ms{size_budget}. "
+        f"Pareto = not beaten on R², single-row p95 and size at once. Baseline: {BASELINE} (as shipped).",
+    ]
+
+    for target, entry in selection.items():
+        results = entry["results"]
+        baseline = next((r for r in results if r["model"] == BASELINE), None)
+        selected = next(r for r in results if r["model"] == entry["selected"])
+
+        lines += [
+            "",
+            f"## {target}",
+            "",
+            "| model | R² | MAE (CHF) | single p50 (ms) | single p95 (ms) | batch (µs/row) | size (MB) | fit (s) | pareto | selected |",
+            "|---|---:|---:|---:|---:|---:|---:|---:|:-:|:-:|",
+        ]
+        for r in sorted(results, key=lambda r: r["single_p95_ms"]):
+            lines.append(
+                f"| {r['model']} | {r['r2']:.4f} | {r['mae']:,.2f} | {r['single_p50_ms']:.2f} | "
+                f"{r['single_p95_ms']:.2f} | {r['batch_us_per_row']:.2f} | {r['size_mb']:.2f} | "
+                f"{r['fit_seconds']:.1f} | {'x' if r['pareto'] else ''} | "
+                f"{'x' if r['model'] == entry['selected'] else ''} |"
+            )
+
+        if baseline is not None:
+            lines += [
+                "",
+                f"Selected {selected['model']}: R² {selected['r2'] - baseline['r2']:+.4f} vs. baseline, "
+                f"single-row p95 {selected['single_p95_ms']:.2f} ms instead of {baseline['single_p95_ms']:.2f} ms, "
+                f"{selected['size_mb']:.2f} MB instead of {baseline['size_mb']:.2f} MB.",
+            ]
+    return "\n".join(lines) + "\n"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare savings model candidates on accuracy, latency and size.")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_LATENCY_BUDGET_MS,
+                        help="budget for the single-row p95 latency (ms)")
+    parser.add_argument("--max-size-mb", type=float, default=None, help="budget for the artifact size (MB)")
+    parser.add_argument("--max-rows", type=int, default=DEFAULT_MAX_ROWS,
+                        help="rows sampled from the dataset (0: all rows)")
+    parser.add_argument("--candidates", nargs="+", choices=list(CANDIDATES), default=None)
+    parser.add_argument("--report", default=paths.model_path("model_selection_report.md"), help="path of the Markdown report")
+    parser.add_argument("--save", action="store_true",
+                        help="save the selected models as models/savings_<target>.pkl (used by the app)")
+    args = parser.parse_args()
+
+    selection = run_selection(
+        candidates=args.candidates,
+        max_rows=args.max_rows or None,
+        budget_ms=args.budget_ms,
+        max_size_mb=args.max_size_mb,
+    )
+    report = format_report(selection, args.budget_ms, args.max_size_mb)
+    print("\n" + report)
+
+    os.makedirs(os.path.dirname(args.report) or ".", exist_ok=True)
+    with open(args.report, "w", encoding="utf-8") as f:
+        f.write(report)
+    print(f"Report written to {args.report}")
+
+    if args.save:
+        for target, entry in selection.items():
+            out_path = paths.model_path(f"savings_{target}.pkl")
+            joblib.dump(entry["pipelines"][entry["selected"]], out_path)
+            print(f"Saved {entry['selected']} to {out_path}")
@@ -0,0 +1,206 @@
+# analysis/prediction_cache.py
+
+# Import libraries
+import os                       # reads the cache configuration from environment variables
+import threading                # one cache is shared by all Streamlit sessions
+from collections import OrderedDict   # entries in least recently used order
+
+import pandas as pd             # one-row feature DataFrame passed to the models
+
+# Backend modules
+import diagnostics.metrics as metrics
+
+
+##################################################################################################
+
+### Prediction cache for the savings models
+# Users nudge the amounts in small steps (CHF 10 / 100) and every rerun predicts the three
+# savings targets again, although the model output barely changes. The cache rounds the
+# CHF amounts of the features to a resolution (default CHF 100), keeps all other features
+# (age, children, flags and the categorical columns) exactly, and uses the result as key:
+#
+#   key = (round(income_gross / resolution) * resolution, ..., age, ..., commune, church_affiliation)
+#
+# On a miss the models predict on the rounded features, so every request in the same bucket
+# gets the same answer, independent of which request came first. The least recently used
+# entry is dropped once max_entries is reached. bypass=True predicts on the exact inputs
+# and leaves the cache untouched. prime=True (warm-up) fills the cache without counting the
+# lookup in the hit / miss statistics, so they only describe user requests.
+#
+# Configuration (environment variables, read when the cache is created):
+#   TAX_APP_PREDICTION_CACHE             "off" disables the cache (default: on)
+#   TAX_APP_PREDICTION_CACHE_SIZE        maximum number of entries (default: 10000)
+#   TAX_APP_PREDICTION_CACHE_RESOLUTION  rounding of the CHF amounts in CHF (default: 100)
+
+# Features in CHF that are rounded to the resolution; all other features are used exactly
+QUANTIZED_FEATURES = (
+    "income_gross",
+    "contribution_pillar_3a",
+    "total_insurance_expenses",
+    "travel_expenses_main_income",
+    "child_care_expenses_third_party",
+    "taxable_assets",
+    "child_education_expenses",
+)
+
+DEFAULT_MAX_ENTRIES = 10_000
+DEFAULT_RESOLUTION = 100
+
+
+def create_prediction_cache(max_entries=None, resolution=None, enabled=None):
+    """
+    Create an empty prediction cache, falling back to the environment variables
+    for every argument that is not given.
+
+    Parameters:
+        max_entries (int or None): maximum number of cached profiles (LRU eviction).
+        resolution (float or dict or None): rounding of the CHF amounts in CHF, either one
+            value for all QUANTIZED_FEATURES or a dict per feature (missing: default).
+        enabled (bool or None): False makes every call a bypass (exact prediction).
+
+    Returns:
+        dict: cache state used by predict_cached() and cache_stats().
+    """
+
+    if max_entries is None:
+        max_entries = int(os.environ.get("TAX_APP_PREDICTION_CACHE_SIZE", DEFAULT_MAX_ENTRIES))
+    if resolution is None:
+        resolution = float(os.environ.get("TAX_APP_PREDICTION_CACHE_RESOLUTION", DEFAULT_RESOLUTION))
+    if enabled is None:
+        enabled = os.environ.get("TAX_APP_PREDICTION_CACHE", "on").strip().lower() not in ("off", "0", "false", "no")
+
+    if not isinstance(resolution, dict):
+        resolution = {feature: resolution for feature in QUANTIZED_FEATURES}
+    resolution = {feature: resolution.get(feature, DEFAULT_RESOLUTION) for feature in QUANTIZED_FEATURES}
+
+    return {
+        "entries": OrderedDict(),
+        "max_entries": max(int(max_entries), 1),
+        "resolution": resolution,
+        "enabled": bool(enabled),
+        "lock": threading.Lock(),
+        "hits": 0,
+        "misses": 0,
+        "bypassed": 0,
+        "evictions": 0,
+    }
+
+
+def quantize_features(features, resolution):
+    """
+    Round the CHF amounts of a feature dictionary to their resolution.
+
+    Parameters:
+        features (dict): model features (see analysis/dataset_io.py FEATURE_COLS).
+        resolution (dict): rounding per feature in CHF (0 or None: exact).
+
+    Returns:
+        dict: copy of the features with the CHF amounts rounded.
+    """
+
+    quantized = dict(features)
+    for feature, step in resolution.items():
+        if step and feature in quantized:
+            quantized[feature] = round(float(quantized[feature]) / step) * step
+    return quantized
+
+
+def cache_key(features):
+    """Hashable key of a (quantized) feature dictionary: its (name, value) pairs in order."""
+    return tuple(features.items())
+
+
+def _predict_all(models, features):
+    """Predict every target for one profile; None for a model that fails."""
+
+    df_features = pd.DataFrame([features])
+    predictions = {}
+    for target, model in models.items():
+        try:
+            with metrics.timed("tax_app_model_inference_seconds", model=target):
+                predictions[target] = float(model.predict(df_features)[0])
+        except Exception:
+            predictions[target] = None
+    return predictions
+
+
+def predict_cached(cache, models, features, bypass=False, prime=False):
+    """
+    Predict the savings targets of one profile, answering repeated or near-identical
+    profiles from the cache.
+
+    Parameters:
+        cache (dict): cache from create_prediction_cache().
+        models (dict): target -> fitted model with predict(DataFrame).
+        features (dict): model features of one profile, in the training column order
+            (see analysis/dataset_io.py FEATURE_COLS).
+        bypass (bool): predict on the exact features without using or filling the cache.
+        prime (bool): use and fill the cache, but count the lookup as "warmup" in the metrics
+            and not in the hits / misses of cache_stats() (warm-up, see loaders/warmup.py).
+
+    Returns:
+        dict: target -> predicted saving (None if the model failed).
+    """
+
+    if bypass or not cache["enabled"]:
+        with cache["lock"]:
+            cache["bypassed"] += 1
+        metrics.increment("tax_app_prediction_cache_lookups_total", result="bypass")
+        return _predict_all(models, features)
+
+    quantized = quantize_features(features, cache["resolution"])
+    key = cache_key(quantized)
+
+    with cache["lock"]:
+        entries = cache["entries"]
+        if key in entries:
+            entries.move_to_end(key)
+            if not prime:
+                cache["hits"] += 1
+            metrics.increment("tax_app_prediction_cache_lookups_total", result="warmup" if prime else "hit")
+            return dict(entries[key])
+        if not prime:
+            cache["misses"] += 1
+    metrics.increment("tax_app_prediction_cache_lookups_total", result="warmup" if prime else "miss")
+
+    # Predicted outside the lock, so other sessions are not blocked by the models
+    predictions = _predict_all(models, quantized)
+
+    # Failed predictions are not cached, so the next request tries again
+    if all(value is not None for value in predictions.values()):
+        with cache["lock"]:
+            entries[key] = predictions
+            entries.move_to_end(key)
+            while len(entries) > cache["max_entries"]:
+                entries.popitem(last=False)
+                cache["evictions"] += 1
+    return dict(predictions)
+
+
+def cache_stats(cache):
+    """
+    Usage statistics of a prediction cache.
+
+    Returns:
+        dict: "hits", "misses", "bypassed", "evictions", "entries", "max_entries" and
+              "hit_rate" (hits / (hits + misses), 0 before the first lookup).
+    """
+
+    with cache["lock"]:
+        lookups = cache["hits"] + cache["misses"]
+        return {
+            "hits": cache["hits"],
+            "misses": cache["misses"],
+            "bypassed": cache["bypassed"],
+            "evictions": cache["evictions"],
+            "entries": len(cache["entries"]),
+            "max_entries": cache["max_entries"],
+            "hit_rate": cache["hits"] / lookups if lookups else 0.0,
+        }
+
+
+def clear_cache(cache):
+    """Remove all entries and reset the statistics."""
+    with cache["lock"]:
+        cache["entries"].clear()
+        cache["hits"] = cache["misses"] = cache["bypassed"] = cache["evictions"] = 0
@@ -0,0 +1,472 @@
+# analysis/result_store.py
+
+# Import libraries
+import argparse                 # command line (build a store, look up clients)
+import json                     # store metadata
+import os                       # store folder and files
+import time                     # throughput of a build
+
+import numpy as np              # memory-mapped columns and hash index
+import pandas as pd             # stable vectorized hashing of the client ids
+
+# Backend modules
+import loaders.paths as paths   # default store folder (tax_calculator_app/data)
+
+
+##################################################################################################
+
+### Memory-mapped result store for batch outputs
+# A folder with one fixed-width binary file per column, opened with np.memmap, so a single
+# client's results can be read without loading the batch output:
+#
+#   data/tax_results.store/
+#       meta.json           number of rows, allocated rows, id width, index capacity and file
+#       client_id.bin       client ids as fixed-width bytes (id_width bytes per row)
+#       <component>.bin     float64 per row, one file per output key of
+#                           total_income_tax.calculation_total_income_tax()
+#       index-<capacity>.bin  hash index: open addressing table of int64 (row + 1, 0 = empty slot)
+#
+# Lookups hash the client id (pandas' stable SipHash) and probe the index: O(1) on average,
+# independent of the number of clients. Column scans return the memory-mapped array itself
+# (zero-copy; pages are read on demand).
+#
+# Writing is an upsert: ids already in the store are overwritten in place, new ids are
+# appended. Files grow in steps (the allocated rows double), and the index is rebuilt with
+# twice the capacity once it is half full, into a new file named after its capacity.
+# meta.json is replaced last (atomic rename) and is the commit: it names the rows and the index
+# file that are valid. Until then the old index file stays in place, and lookups ignore index
+# entries that point past the committed rows, so an interrupted append leaves the previous
+# rows valid; an interrupted update of existing rows may leave those rows partially updated.
+#
+# Usage (from the tax_calculator_app folder):
+#   python -m analysis.result_store build profiles.parquet --id-column client_id [--store data/tax_results.store]
+#   python -m analysis.result_store lookup CLIENT_ID [CLIENT_ID ...]
+
+DEFAULT_STORE_PATH = paths.generated_data_path("tax_results.store")
+DEFAULT_ID_WIDTH = 32
+FORMAT_VERSION = 1
+
+# Output keys of total_income_tax.calculation_total_income_tax(), one column file each
+RESULT_COLUMNS = (
+    "federal_tax",
+    "cantonal_base_tax",
+    "cantonal_tax",
+    "municipal_tax",
+    "church_tax",
+    "total_cantonal_municipal_church_tax",
+    "total_income_tax",
+)
+
+_MIN_ALLOCATED_ROWS = 1024
+_MIN_INDEX_CAPACITY = 2048
+
+
+def _file(path, name):
+    return os.path.join(path, f"{name}.bin")
+
+
+def _index_name(capacity):
+    return f"index-{capacity}"
+
+
+def _index_file(path, meta):
+    """Index file of the committed store (stores of earlier versions: index.bin)."""
+    return os.path.join(path, meta.get("index_file", "index.bin"))
+
+
+def _write_meta(path, meta):
+    tmp_path = os.path.join(path, "meta.json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, os.path.join(path, "meta.json"))
+
+
+def _resize(file_path, n_bytes):
+    """Create or extend a file to n_bytes (new bytes are zero)."""
+    with open(file_path, "ab") as f:
+        f.truncate(n_bytes)
+
+
+def _map(path, meta, mode):
+    """Memory-map all files of a store (arrays of the allocated length)."""
+    allocated = meta["allocated_rows"]
+    return {
+        "ids": np.memmap(_file(path, "client_id"), dtype=f"S{meta['id_width']}", mode=mode, shape=(allocated,)),
+        "columns": {
+            name: np.memmap(_file(path, name), dtype=np.float64, mode=mode, shape=(allocated,))
+            for name in meta["columns"]
+        },
+        "index": np.memmap(_index_file(path, meta), dtype=np.int64, mode=mode, shape=(meta["index_capacity"],)),
+    }
+
+
+def _store_files(path, columns):
+    """File names a store with these columns (and the store already at path) consists of."""
+    names = {"meta.json", "meta.json.tmp", "client_id.bin", "index.bin"}
+    names |= {f"{name}.bin" for name in columns}
+    names |= {name for name in os.listdir(path) if name.startswith("index-") and name[6:-4].isdigit()
+              and name.endswith(".bin")}
+    try:
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            names |= {f"{name}.bin" for name in json.load(f).get("columns", [])}
+    except (OSError, ValueError, AttributeError):
+        pass
+    return names
+
+
+def create_result_store(path=DEFAULT_STORE_PATH, id_width=DEFAULT_ID_WIDTH, columns=RESULT_COLUMNS):
+    """
+    Create an empty result store (an existing store at path is replaced).
+
+    Only a new or empty folder, or the folder of a store, is used: the files of an existing
+    store are replaced, any other file in the folder is an error (nothing is removed).
+
+    Parameters:
+        path (str): store folder.
+        id_width (int): maximum length of a client id in bytes (UTF-8).
+        columns (tuple of str): result columns (default: the income tax components).
+
+    Raises:
+        ValueError: if the folder contains files that do not belong to a result store.
+    """
+
+    os.makedirs(path, exist_ok=True)
+    own_files = _store_files(path, columns)
+    existing = os.listdir(path)
+    foreign = sorted(name for name in existing if name not in own_files)
+    if foreign:
+        raise ValueError(
+            f"{path} contains files that are not part of a result store (e.g. {foreign[0]!r}); "
+            f"use an empty or new folder for the store."
+        )
+    for name in existing:
+        os.remove(os.path.join(path, name))
+
+    meta = {
+        "format": FORMAT_VERSION,
+        "rows": 0,
+        "allocated_rows": _MIN_ALLOCATED_ROWS,
+        "id_width": int(id_width),
+        "columns": list(columns),
+        "index_capacity": _MIN_INDEX_CAPACITY,
+        "index_file": f"{_index_name(_MIN_INDEX_CAPACITY)}.bin",
+    }
+    _resize(_file(path, "client_id"), meta["allocated_rows"] * meta["id_width"])
+    for name in columns:
+        _resize(_file(path, name), meta["allocated_rows"] * 8)
+    _resize(_index_file(path, meta), meta["index_capacity"] * 8)
+    _write_meta(path, meta)
+
+
+def open_result_store(path=DEFAULT_STORE_PATH, mode="r"):
+    """
+    Open a result store.
+
+    Parameters:
+        path (str): store folder.
+        mode (str): "r" (read only) or "r+" (read and write, used by write_results).
+
+    Returns:
+        dict: store with "path", "meta" and the memory-mapped "ids", "columns" and "index".
+    """
+
+    with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("format") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported result store format: {meta.get('format')}")
+    return {"path": path, "meta": meta, **_map(path, meta, mode)}
+
+
+##################################################################################################
+
+### Hash index
+
+
+def encode_ids(client_ids, id_width):
+    """Client ids as fixed-width bytes (str() of every id, UTF-8).
+
+    Raises:
+        ValueError: if an id is longer than id_width bytes.
+    """
+    encoded = np.array([str(client_id).encode("utf-8") for client_id in client_ids], dtype=object)
+    too_long = [value for value in encoded if len(value) > id_width]
+    if too_long:
+        raise ValueError(f"Client id longer than {id_width} bytes: {too_long[0]!r}")
+    return encoded.astype(f"S{id_width}")
+
+
+def _hash_ids(encoded):
+    """Stable 64-bit hash per encoded id (the same in every process and run)."""
+    return pd.util.hash_array(encoded.astype(object)).astype(np.int64)
+
+
+def _probe(index, ids, encoded, hashes, n_rows):
+    """
+    Find the encoded ids in the index.
+
+    Entries of rows >= n_rows (written by an interrupted append, not committed in meta.json)
+    are treated like entries of other ids.
+
+    Returns:
+        tuple: (rows, slots): row per id (-1 if missing) and the slot where the search ended
+        (the empty slot for a missing id).
+    """
+    mask = len(index) - 1
+    slots = hashes & mask
+    rows = np.full(len(encoded), -1, dtype=np.int64)
+    pending = np.arange(len(encoded))
+
+    while len(pending):
+        entry = index[slots[pending]]
+        empty = entry == 0
+        found = ~empty & (entry <= n_rows)
+        found[found] = ids[entry[found] - 1] == encoded[pending[found]]
+        rows[pending[found]] = entry[found] - 1
+        # Occupied by another id: continue with the next slot
+        pending = pending[~empty & ~found]
+        slots[pending] = (slots[pending] + 1) & mask
+    return rows, slots
+
+
+def _insert(index, hashes, new_rows):
+    """Insert rows (not yet in the index) with their hashes into the index."""
+    mask = len(index) - 1
+    slots = hashes & mask
+    pending = np.arange(len(new_rows))
+
+    while len(pending):
+        free = index[slots[pending]] == 0
+        candidates = pending[free]
+        # Several rows may want the same free slot: the first one gets it
+        _, first = np.unique(slots[candidates], return_index=True)
+        winners = candidates[first]
+        index[slots[winners]] = new_rows[winners] + 1
+
+        placed = np.zeros(len(new_rows), dtype=bool)
+        placed[winners] = True
+        pending = pending[~placed[pending]]
+        slots[pending] = (slots[pending] + 1) & mask
+
+
+def _rebuild_index(path, meta, store, capacity):
+    """
+    Rebuild the index with a new capacity (power of two) from all stored ids, into a new file.
+
+    The old index file stays valid until meta.json names the new one (write_results).
+    """
+    del store["index"]
+    meta["index_capacity"] = capacity
+    meta["index_file"] = f"{_index_name(capacity)}.bin"
+    index_path = _index_file(path, meta)
+    if os.path.exists(index_path):
+        os.remove(index_path)       # left by an interrupted rebuild, never committed
+    _resize(index_path, capacity * 8)
+    store["index"] = np.memmap(index_path, dtype=np.int64, mode="r+", shape=(capacity,))
+    rows = meta["rows"]
+    if rows:
+        _insert(store["index"], _hash_ids(np.asarray(store["ids"][:rows])), np.arange(rows))
+
+
+##################################################################################################
+
+### Reading and writing
+
+
+def lookup_rows(store, client_ids):
+    """Row of every client id in the store (-1 for ids that are not stored)."""
+    encoded = encode_ids(client_ids, store["meta"]["id_width"])
+    return _probe(store["index"], store["ids"], encoded, _hash_ids(encoded), store["meta"]["rows"])[0]
+
+
+def lookup(store, client_id):
+    """
+    Results of one client.
+
+    Returns:
+        dict or None: column -> value, None if the client is not in the store.
+    """
+    row = lookup_rows(store, [client_id])[0]
+    if row < 0:
+        return None
+    return {name: float(values[row]) for name, values in store["columns"].items()}
+
+
+def column(store, name):
+    """All stored values of one column (memory-mapped, no copy)."""
+    return store["columns"][name][: store["meta"]["rows"]]
+
+
+def client_ids(store):
+    """All stored client ids (decoded)."""
+    return [value.decode("utf-8") for value in store["ids"][: store["meta"]["rows"]]]
+
+
+def write_results(path, client_ids, results, id_width=DEFAULT_ID_WIDTH):
+    """
+    Upsert results into a store: overwrite stored clients in place, append new ones.
+
+    Parameters:
+        path (str): store folder (a new store is created if it has no meta.json,
+            see create_result_store).
+        client_ids (array-like): one id per result row (unique within the call).
+        results (pd.DataFrame or dict of arrays): the store's result columns, one row per id.
+        id_width (int): id width of a new store.
+
+    Returns:
+        dict: "updated" and "appended" rows and the total "rows" in the store.
+    """
+
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        create_result_store(path, id_width)
+    store = open_result_store(path, mode="r+")
+    meta = store["meta"]
+
+    encoded = encode_ids(client_ids, meta["id_width"])
+    if len(np.unique(encoded)) != len(encoded):
+        raise ValueError("Client ids must be unique within one write")
+    hashes = _hash_ids(encoded)
+    rows, _ = _probe(store["index"], store["ids"], encoded, hashes, meta["rows"])
+    existing = rows >= 0
+    new = ~existing
+    n_new = int(new.sum())
+
+    ### Grow the files and the index before appending
+    needed = meta["rows"] + n_new
+    if needed > meta["allocated_rows"]:
+        allocated = max(meta["allocated_rows"], _MIN_ALLOCATED_ROWS)
+        while allocated < needed:
+            allocated *= 2
+        store.pop("ids"), store.pop("columns")
+        _resize(_file(path, "client_id"), allocated * meta["id_width"])
+        for name in meta["columns"]:
+            _resize(_file(path, name), allocated * 8)
+        meta["allocated_rows"] = allocated
+        store.update({key: value for key, value in _map(path, meta, "r+").items() if key != "index"})
+    committed_index = _index_file(path, meta)
+    if needed * 2 > meta["index_capacity"]:
+        capacity = meta["index_capacity"]
+        while needed * 2 > capacity:
+            capacity *= 2
+        _rebuild_index(path, meta, store, capacity)
+
+    ### Write the values: existing rows in place, new rows after the last row
+    new_rows = np.arange(meta["rows"], needed)
+    target_rows = rows.copy()
+    target_rows[new] = new_rows
+    for name in meta["columns"]:
+        store["columns"][name][target_rows] = np.asarray(results[name], dtype=np.float64)
+    store["ids"][new_rows] = encoded[new]
+    _insert(store["index"], hashes[new], new_rows)
+
+    for array in (store["ids"], store["index"], *store["columns"].values()):
+        array.flush()
+    meta["rows"] = needed
+    _write_meta(path, meta)
+
+    # The new index is committed: the previous index file is no longer used
+    if _index_file(path, meta) != committed_index:
+        os.remove(committed_index)
+
+    return {"updated": int(existing.sum()), "appended": n_new, "rows": needed}
+
+
+##################################################################################################
+
+### Batch run into a store
+
+
+def build_result_store(input_path, id_column, store_path=DEFAULT_STORE_PATH, chunk_size=100_000,
+                       deduplicate=True):
+    """
+    Calculate the income tax of every profile in a file and upsert it into a result store.
+
+    Rows with identical tax inputs within a chunk are calculated once
+    (bt.calculate_income_tax_batch_deduplicated), unless deduplicate is False.
+
+    Parameters:
+        input_path (str): profiles (Parquet file/folder or CSV) with the batch profile fields
+            (see tax_calculations/batch_income_tax.py) and a client id column.
+        id_column (str): client id column.
+        store_path (str): store folder (created if needed; existing clients are updated).
+        chunk_size (int): profiles per chunk.
+        deduplicate (bool): calculate every distinct profile of a chunk only once.
+
+    Returns:
+        dict: "rows" processed, "updated", "appended", "seconds", the total "stored" rows and
+              "distinct_profiles" (profiles calculated, duplicates within a chunk counted once).
+    """
+
+    # Imported here: lookups only need the store
+    import analysis.dataset_io as dataset_io
+    import loaders.load_datasets as datasets
+    import deductions.optional_deductions as od
+    import tax_calculations.total_income_tax as t
+    import tax_calculations.batch_income_tax as bt
+    import tax_calculations.batch_deduplication as dedup
+
+    tax_tables = t.compile_tax_tables(
+        datasets.load_federal_tax_rates(),
+        datasets.load_cantonal_base_tax_rates(),
+        datasets.load_cantonal_municipal_church_multipliers(),
+    )
+    federal_rules = od.get_deduction_rules("federal")
+    cantonal_rules = od.get_deduction_rules("cantonal")
+
+    columns = list(dedup.TAX_INPUT_FIELDS) + [id_column]
+    totals = {"rows": 0, "updated": 0, "appended": 0, "stored": 0, "distinct_profiles": 0}
+    start = time.perf_counter()
+    for chunk in dataset_io.iter_dataset_batches(columns, input_path, chunk_size):
+        if deduplicate:
+            result, stats = bt.calculate_income_tax_batch_deduplicated(chunk, tax_tables, federal_rules, cantonal_rules)
+            totals["distinct_profiles"] += stats["distinct_profiles"]
+            chunk_summary = f"  chunk: {dedup.format_duplicate_stats(stats)}"
+        else:
+            result = bt.calculate_income_tax_batch(chunk, tax_tables, federal_rules, cantonal_rules)
+            totals["distinct_profiles"] += len(chunk)
+            chunk_summary = ""
+        written = write_results(store_path, chunk[id_column].to_numpy(), result)
+        totals["rows"] += len(chunk)
+        totals["updated"] += written["updated"]
+        totals["appended"] += written["appended"]
+        totals["stored"] = written["rows"]
+        print(f"{totals['rows']:>12,} profiles  {totals['rows'] / (time.perf_counter() - start):>10,.0f} profiles/s"
+              + chunk_summary)
+
+    totals["seconds"] = time.perf_counter() - start
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory-mapped result store of batch tax results.")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH, help="store folder")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="calculate profiles and upsert them into the store")
+    build.add_argument("input", help="profiles (Parquet or CSV)")
+    build.add_argument("--id-column", required=True, help="client id column")
+    build.add_argument("--chunk-size", type=int, default=100_000, help="profiles per chunk")
+    build.add_argument("--no-deduplicate", action="store_true", help="calculate duplicate profiles again")
+
+    find = commands.add_parser("lookup", help="print the stored results of clients")
+    find.add_argument("client_ids", nargs="+", help="client ids")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        report = build_result_store(args.input, args.id_column, args.store, args.chunk_size,
+                                    deduplicate=not args.no_deduplicate)
+        print(f"\n{report['rows']:,} profiles in {report['seconds']:.1f} s: {report['updated']:,} updated, "
+              f"{report['appended']:,} appended, {report['stored']:,} clients in {args.store}")
+        if report["rows"]:
+            duplicates = report["rows"] - report["distinct_profiles"]
+            print(f"Calculated {report['distinct_profiles']:,} distinct profiles "
+                  f"({duplicates:,} duplicate rows, {duplicates / report['rows']:.1%})")
+    else:
+        store = open_result_store(args.store)
+        for client_id in args.client_ids:
+            start = time.perf_counter()
+            result = lookup(store, client_id)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if result is None:
+                print(f"{client_id}: not found")
+            else:
+                print(f"{client_id} ({elapsed_ms:.2f} ms): " + ", ".join(f"{k} {v:,.2f}" for k, v in result.items()))
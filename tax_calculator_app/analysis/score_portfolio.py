@@ -0,0 +1,204 @@
+# analysis/score_portfolio.py
+
+# Import libraries
+import argparse                 # command line options (input, output, chunk size, n_jobs)
+import os                       # output folder
+import resource                 # peak memory (max RSS) of the process
+import sys                      # platform check for the max RSS unit
+import time                     # throughput
+
+import joblib                   # loads the saved model pipelines and hashes their preprocessing
+import numpy as np              # prediction arrays
+import pandas as pd             # chunk of client profiles
+import pyarrow as pa            # result chunks
+import pyarrow.parquet as pq    # streams the results to one Parquet file
+
+# Backend modules
+import analysis.dataset_io as dataset_io
+import loaders.paths as paths
+import tax_calculations.batch_deduplication as dedup
+
+
+##################################################################################################
+
+### Bulk scoring of a client portfolio with the savings models
+# Scores every client profile with the three savings models, chunk by chunk:
+#   1. read a chunk of profiles (only the feature columns and the client id, Parquet or CSV)
+#   2. build the feature matrix once per chunk: the chunk's columns in the order of
+#      dataset_io.FEATURE_COLS, transformed by the pipelines' preprocessing. Models whose
+#      preprocessing is identical share one transformed array.
+#   3. one vectorized predict() per model and chunk on that array (forests use n_jobs threads);
+#      profiles that occur several times in a chunk (same value in every feature) are predicted
+#      once and the scores are copied to all their rows (see tax_calculations/batch_deduplication.py)
+#   4. append the chunk's scores to the output Parquet file
+# Only one chunk of profiles and scores is in memory at a time, so peak memory depends on the
+# chunk size and not on the number of clients.
+#
+# Output columns: client id (or "row" if the input has none), one column per savings target
+# (CHF, negative predictions set to 0 as in the app), "top_opportunity" and "top_saving".
+#
+# Usage (from the tax_calculator_app folder):
+#   python -m analysis.score_portfolio [input] [output] [--id-column client_id]
+#                                      [--chunk-size 100000] [--n-jobs -1] [--no-deduplicate]
+# The input defaults to the savings dataset (data/deduction_savings_dataset.parquet).
+
+DEFAULT_OUTPUT_PATH = paths.generated_data_path("portfolio_scores.parquet")
+DEFAULT_CHUNK_SIZE = 100_000
+
+
+def load_models(model_dir=paths.MODEL_DIR, targets=None):
+    """Load the saved savings pipelines (models/savings_<target>.pkl) as target -> pipeline."""
+    targets = targets or dataset_io.TARGET_COLS
+    return {target: joblib.load(os.path.join(model_dir, f"savings_{target}.pkl")) for target in targets}
+
+
+def prepare_models(models, n_jobs=-1):
+    """
+    Split the pipelines into shared preprocessing steps and estimators.
+
+    Parameters:
+        models (dict): target -> fitted Pipeline(preprocess, model).
+        n_jobs (int): threads per predict() for estimators that support it (forests).
+
+    Returns:
+        list of tuple: (preprocessor, {target: estimator}), one entry per distinct preprocessor.
+    """
+
+    groups = {}
+    for target, pipeline in models.items():
+        preprocessor = pipeline.named_steps["preprocess"]
+        estimator = pipeline.named_steps["model"]
+        if "n_jobs" in estimator.get_params():
+            estimator.set_params(n_jobs=n_jobs)
+
+        # Pipelines trained by training_savings_models usually have equal preprocessing
+        signature = joblib.hash(preprocessor)
+        groups.setdefault(signature, (preprocessor, {}))[1][target] = estimator
+    return list(groups.values())
+
+
+def score_chunk(chunk, prepared_models):
+    """
+    Score one chunk of profiles.
+
+    Args:
+        chunk (pd.DataFrame): profiles with all dataset_io.FEATURE_COLS.
+        prepared_models (list): output of prepare_models().
+
+    Returns:
+        dict: target -> array of predicted savings (CHF, at least 0).
+    """
+
+    features = chunk[dataset_io.FEATURE_COLS]
+    scores = {}
+    for preprocessor, estimators in prepared_models:
+        X = preprocessor.transform(features)
+        for target, estimator in estimators.items():
+            scores[target] = np.maximum(estimator.predict(X), 0.0)
+    return scores
+
+
+def _max_rss_mib():
+    """Peak resident memory of this process so far (MiB)."""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / 2**20 if sys.platform == "darwin" else max_rss / 2**10
+
+
+def score_portfolio(input_path=None, output_path=DEFAULT_OUTPUT_PATH, id_column=None,
+                    chunk_size=DEFAULT_CHUNK_SIZE, n_jobs=-1, model_dir=paths.MODEL_DIR, deduplicate=True):
+    """
+    Score a client portfolio with the savings models and stream the scores to Parquet.
+
+    Args:
+        input_path (str or None): profiles (Parquet file/folder or CSV) with the feature
+            columns (default: the savings dataset).
+        output_path (str): Parquet file for the scores.
+        id_column (str or None): client id column copied to the output (default: row number).
+        chunk_size (int): profiles per chunk.
+        n_jobs (int): threads per forest predict() (-1: all cores).
+        model_dir (str): folder with models/savings_<target>.pkl.
+        deduplicate (bool): predict every distinct profile of a chunk only once.
+
+    Returns:
+        dict: "rows", "chunks", "seconds", "rows_per_second", "max_rss_mib" per chunk
+              (peak memory after each chunk, to check that it stays flat) and "distinct_profiles"
+              (profiles predicted, duplicates within a chunk counted once).
+    """
+
+    models = load_models(model_dir)
+    prepared_models = prepare_models(models, n_jobs)
+    targets = list(models)
+    columns = dataset_io.FEATURE_COLS + ([id_column] if id_column else [])
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    writer = None
+    rows = 0
+    distinct_profiles = 0
+    max_rss_per_chunk = []
+    start = time.perf_counter()
+
+    try:
+        for chunk in dataset_io.iter_dataset_batches(columns, input_path, chunk_size):
+            if deduplicate:
+                scores, stats = dedup.run_deduplicated(score_chunk, chunk, dataset_io.FEATURE_COLS, prepared_models)
+                distinct_profiles += stats["distinct_profiles"]
+            else:
+                scores = score_chunk(chunk, prepared_models)
+                distinct_profiles += len(chunk)
+            score_matrix = np.column_stack([scores[t] for t in targets])
+            top = score_matrix.argmax(axis=1)
+
+            result = pd.DataFrame({
+                **({id_column: chunk[id_column].to_numpy()} if id_column else
+                   {"row": np.arange(rows, rows + len(chunk))}),
+                **{t: np.round(scores[t], 2) for t in targets},
+                "top_opportunity": np.asarray(targets, dtype=object)[top],
+                "top_saving": np.round(score_matrix[np.arange(len(chunk)), top], 2),
+            })
+
+            table = pa.Table.from_pandas(result, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, table.schema)
+            writer.write_table(table)
+
+            rows += len(chunk)
+            max_rss_per_chunk.append(_max_rss_mib())
+            elapsed = time.perf_counter() - start
+            print(f"{rows:>12,} profiles  {rows / elapsed:>10,.0f} profiles/s  max RSS {max_rss_per_chunk[-1]:,.0f} MiB")
+    finally:
+        if writer is not None:
+            writer.close()
+
+    seconds = time.perf_counter() - start
+    return {
+        "rows": rows,
+        "chunks": len(max_rss_per_chunk),
+        "seconds": seconds,
+        "rows_per_second": rows / seconds if seconds > 0 else float("nan"),
+        "max_rss_mib": max_rss_per_chunk,
+        "distinct_profiles": distinct_profiles,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score a client portfolio with the savings models.")
+    parser.add_argument("input", nargs="?", default=None,
+                        help="profiles (Parquet or CSV, default: the savings dataset)")
+    parser.add_argument("output", nargs="?", default=DEFAULT_OUTPUT_PATH, help="Parquet file for the scores")
+    parser.add_argument("--id-column", default=None, help="client id column copied to the output")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="profiles per chunk")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="threads per forest predict (-1: all cores)")
+    parser.add_argument("--no-deduplicate", action="store_true", help="predict duplicate profiles again")
+    args = parser.parse_args()
+
+    report = score_portfolio(args.input, args.output, args.id_column, args.chunk_size, args.n_jobs,
+                             deduplicate=not args.no_deduplicate)
+    rss = report["max_rss_mib"]
+    print(f"\nScored {report['rows']:,} profiles in {report['seconds']:.1f} s "
+          f"({report['rows_per_second']:,.0f} profiles/s), written to {args.output}")
+    if report["rows"]:
+        duplicates = report["rows"] - report["distinct_profiles"]
+        print(f"Predicted {report['distinct_profiles']:,} distinct profiles "
+              f"({duplicates:,} duplicate rows, {duplicates / report['rows']:.1%})")
+    if rss:
+        print(f"Max RSS after the first chunk: {rss[0]:,.0f} MiB, at the end: {rss[-1]:,.0f} MiB")
@@ -2,28 +2,38 @@
 
 # Import libraries
 import joblib                      # Saves trained models to disk
-import pandas as pd               # Used to load the training dataset
+import numpy as np                # Held-out split and streaming metrics
 import os                         # Used to create model output directory
+import sys                        # Command line switch for incremental training
 
 # Scikit-learn for model training
 from sklearn.model_selection import train_test_split
 from sklearn.compose import ColumnTransformer
-from sklearn.preprocessing import OneHotEncoder
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
 from sklearn.pipeline import Pipeline
 from sklearn.ensemble import RandomForestRegressor
+from sklearn.neural_network import MLPRegressor
+from sklearn.linear_model import SGDRegressor
+
+# Backend modules
+import analysis.dataset_io as dataset_io
+import loaders.paths as paths
+import diagnostics.profiling as profiling
 
 
 ##################################################################################################
 
 ### Ttrain ML models for tax savings estimation
 
-def main():
+def main(path=None):
     """
     Train three separate machine-learning models that estimate potential tax savings
     from maximizing specific deductions (Pillar 3a, childcare, insurance).
 
-    1. Loads the synthetic training dataset generated by generate_savings_dataset.py.
-    2. Defines the feature columns used as model inputs.
+    1. Loads the feature and target columns of the synthetic training dataset
+       generated by generate_savings_dataset.py (the newer of the Parquet dataset
+       and the CSV file, or `path`).
+    2. Uses the feature columns defined in analysis/dataset_io.py as model inputs.
     3. Defines the target columns:
          - delta_3a: savings if Pillar 3a is maxed
          - delta_childcare: savings if childcare deduction is maxed
@@ -38,41 +48,28 @@ def main():
          - Saves the trained model pipeline into the `models/` directory
            using the filename pattern: `models/savings_<target>.pkl`
 
+    Args:
+        path (str or None): dataset path (default: dataset_io.default_dataset_path()).
+
     Returns:
         No returns as values are written to disk.
     """
     
-    ### Load dataset (created by generate_savings_dataset.py)
-    df = pd.read_csv("data/deduction_savings_dataset.csv")
-
     ### Define feature columns (inputs) and target columns (outputs)
-    feature_cols = [
-        "income_gross",
-        "age",
-        "employed",
-        "marital_status",
-        "is_two_income_couple",
-        "number_of_children_under_7",
-        "number_of_children_7_and_over",
-        "number_of_children",
-        "commune",
-        "church_affiliation",
-        "contribution_pillar_3a",
-        "total_insurance_expenses",
-        "travel_expenses_main_income",
-        "child_care_expenses_third_party",
-        "taxable_assets",
-        "child_education_expenses",
-    ]
+    feature_cols = dataset_io.FEATURE_COLS
 
     # Targets represent estimated tax savings when we max specific deductions
-    target_cols = ["delta_3a", "delta_childcare", "delta_insurance"]
+    target_cols = dataset_io.TARGET_COLS
+
+    ### Load dataset (created by generate_savings_dataset.py)
+    # Only the feature and target columns are read (the newer of Parquet and CSV, or the given path)
+    df = dataset_io.read_training_data(feature_cols + target_cols, path)
 
     # Feature matrix
     X = df[feature_cols]
 
     # Separate categorical and numeric columns
-    categorical_cols = ["marital_status", "commune", "church_affiliation"]
+    categorical_cols = dataset_io.CATEGORICAL_COLS
     numeric_cols = [c for c in feature_cols if c not in categorical_cols]
 
     ### Preprocessing: one-hot encode categoricals, pass through numerics
@@ -87,7 +84,7 @@ def main():
     
     ### Train and save 3 separate models 
     # Making sure that the models directory exists
-    os.makedirs("models", exist_ok=True)
+    os.makedirs(paths.MODEL_DIR, exist_ok=True)
 
     for target in target_cols:
         # Target vector for current task
@@ -118,7 +115,148 @@ def main():
     
 
         # Save trained pipeline as .pkl 
-        out_path = f"models/savings_{target}.pkl"
+        out_path = paths.model_path(f"savings_{target}.pkl")
         joblib.dump(pipeline, out_path)
         
 
+
+##################################################################################################
+
+### Out-of-core training
+# For datasets that do not fit in memory: the dataset is streamed in batches (only the
+# feature and target columns) and estimators that learn incrementally (partial_fit) are
+# updated batch by batch. Peak memory is bounded by the batch size, not the dataset size.
+#
+#   pass 1: collect the categories of the categorical columns (three columns only)
+#   pass 2: fit the preprocessing on the first training batch, then partial_fit per batch and epoch
+#   pass 3: evaluate on the held-out rows of the stream
+#
+# Rows are assigned to the held-out set with a random draw per batch (seeded by the batch
+# number), so every pass sees the same split. The saved artifact is the same kind of
+# sklearn Pipeline (preprocess + model) as in main(), so load_savings_models() and the
+# app's predict(df_features) call work unchanged.
+
+# Incremental estimators (must support partial_fit): name -> factory(seed)
+INCREMENTAL_ESTIMATORS = {
+    # small neural network: captures the interaction of income, marginal rate and caps
+    "mlp": lambda seed: MLPRegressor(hidden_layer_sizes=(64, 32), learning_rate_init=1e-3, random_state=seed),
+    # linear model: smallest and fastest, but cannot represent the caps
+    "sgd": lambda seed: SGDRegressor(random_state=seed),
+}
+
+
+def _held_out_mask(n_rows, batch_number, test_size, seed):
+    """Held-out rows of a batch; identical in every pass over the stream."""
+    return np.random.default_rng([seed, batch_number]).random(n_rows) < test_size
+
+
+def train_incremental(estimator="mlp", batch_size=100_000, epochs=2, test_size=0.2, seed=42,
+                      path=None, output_dir=paths.MODEL_DIR):
+    """
+    Train the three savings models out-of-core, streaming the dataset in batches.
+
+    Parameters:
+        estimator (str): key of INCREMENTAL_ESTIMATORS ("mlp" or "sgd").
+        batch_size (int): rows per streamed batch (bounds peak memory).
+        epochs (int): passes over the training rows.
+        test_size (float): share of rows held out for evaluation.
+        seed (int): seed for the held-out split and the estimators.
+        path (str or None): dataset path (default: the newer of the Parquet dataset and the CSV file).
+        output_dir (str): folder for the model files (models/savings_<target>.pkl).
+
+    Returns:
+        dict: per target the held-out metrics "r2", "mae" and "rows".
+    """
+
+    feature_cols = dataset_io.FEATURE_COLS
+    target_cols = dataset_io.TARGET_COLS
+    categorical_cols = dataset_io.CATEGORICAL_COLS
+    numeric_cols = [c for c in feature_cols if c not in categorical_cols]
+    columns = feature_cols + target_cols
+
+    ### Pass 1: categories, so one-hot columns are fixed before training starts
+    categories = {col: set() for col in categorical_cols}
+    for batch in dataset_io.iter_dataset_batches(categorical_cols, path, batch_size):
+        for col in categorical_cols:
+            categories[col].update(batch[col].astype(str).unique())
+
+    preprocessor = ColumnTransformer(
+        transformers=[
+            ("cat", OneHotEncoder(categories=[sorted(categories[c]) for c in categorical_cols],
+                                  handle_unknown="ignore"), categorical_cols),
+            ("num", StandardScaler(), numeric_cols),
+        ]
+    )
+    models = {target: INCREMENTAL_ESTIMATORS[estimator](seed) for target in target_cols}
+
+    ### Pass 2: partial_fit batch by batch
+    preprocessor_fitted = False
+    for epoch in range(epochs):
+        for batch_number, batch in enumerate(dataset_io.iter_dataset_batches(columns, path, batch_size)):
+            train = batch[~_held_out_mask(len(batch), batch_number, test_size, seed)]
+            if train.empty:
+                continue
+
+            # Scaling statistics come from the first training batch (the first batches may be all held out)
+            if not preprocessor_fitted:
+                preprocessor.fit(train[feature_cols])
+                preprocessor_fitted = True
+
+            X_train = preprocessor.transform(train[feature_cols])
+            for target, model in models.items():
+                model.partial_fit(X_train, train[target].to_numpy())
+        print(f"Epoch {epoch + 1}/{epochs} done")
+    if not preprocessor_fitted:
+        raise ValueError(f"No training rows (test_size={test_size}); lower test_size or use more data.")
+
+    ### Pass 3: metrics on the held-out stream (R² from running sums)
+    sums = {target: {"n": 0, "sum_y": 0.0, "sum_y2": 0.0, "sse": 0.0, "sae": 0.0} for target in target_cols}
+    for batch_number, batch in enumerate(dataset_io.iter_dataset_batches(columns, path, batch_size)):
+        test = batch[_held_out_mask(len(batch), batch_number, test_size, seed)]
+        if test.empty:
+            continue
+        X_test = preprocessor.transform(test[feature_cols])
+        for target, model in models.items():
+            y = test[target].to_numpy()
+            residual = y - model.predict(X_test)
+            s = sums[target]
+            s["n"] += len(y)
+            s["sum_y"] += y.sum()
+            s["sum_y2"] += (y ** 2).sum()
+            s["sse"] += (residual ** 2).sum()
+            s["sae"] += np.abs(residual).sum()
+
+    ### Save one pipeline per target (same artifact format as main())
+    os.makedirs(output_dir, exist_ok=True)
+    metrics = {}
+    for target, model in models.items():
+        s = sums[target]
+        total_variance = s["sum_y2"] - s["sum_y"] ** 2 / max(s["n"], 1)
+        metrics[target] = {
+            "r2": 1.0 - s["sse"] / total_variance if total_variance > 0 else float("nan"),
+            "mae": s["sae"] / max(s["n"], 1),
+            "rows": s["n"],
+        }
+        print(f"{target}: held-out R² = {metrics[target]['r2']:.4f}, MAE = CHF {metrics[target]['mae']:,.2f}")
+
+        pipeline = Pipeline(steps=[("preprocess", preprocessor), ("model", model)])
+        joblib.dump(pipeline, os.path.join(output_dir, f"savings_{target}.pkl"))
+
+    return metrics
+
+
+if __name__ == "__main__":
+    # Profiled only if enabled through TAX_APP_PROFILE (see diagnostics/profiling.py)
+    # Usage: python -m analysis.training_savings_models [--path=data/deduction_savings_dataset.csv]
+    #          [--incremental [--estimator=mlp|sgd] [--batch-size=100000] [--epochs=2]]
+    options = dict(a[2:].split("=", 1) if "=" in a else (a[2:], True) for a in sys.argv[1:] if a.startswith("--"))
+    with profiling.profiled("training_savings_models"):
+        if "incremental" in options:
+            train_incremental(
+                estimator=options.get("estimator", "mlp"),
+                batch_size=int(options.get("batch-size", 100_000)),
+                epochs=int(options.get("epochs", 2)),
+                path=options.get("path"),
+            )
+        else:
+            main(path=options.get("path"))
@@ -1,5 +1,8 @@
 # deductions/mandatory_deductions.py
 
+# Import libraries
+import numpy as np              # used for the array-based (vectorized) versions
+
 # Import backend module containing constants
 import data.constants as c
 
@@ -156,3 +159,112 @@ def get_total_mandatory_deductions(income_gross, age, employed):
     total_mandatory_deductions = social_deductions_total + bv_minimal_contribution
     
     return total_mandatory_deductions
+
+
+##################################################################################################
+
+
+### Vectorized mandatory deductions (batch use)
+# Array counterparts of the scalar functions above. They take arrays (or pandas Series)
+# of equal length and return NumPy arrays with exactly the same values as the scalar
+# functions applied row by row, without a Python loop.
+
+def get_total_social_deductions_vectorized(income_gross, employed):
+    """
+    Vectorized version of get_total_social_deductions().
+
+    Parameters:
+        income_gross (array-like of float):
+            Annual gross incomes in CHF before any deductions.
+        employed (array-like of bool):
+            True for employed persons, False for self-employed.
+
+    Returns:
+        np.ndarray:
+            Total annual social security deductions (AHV/IV/EO/ALV) in CHF per person.
+    """
+
+    income_gross = np.asarray(income_gross, dtype=float)
+    employed = np.asarray(employed, dtype=bool)
+
+    # Combined AHV + IV + EO rate depending on employment status
+    social_rate = np.where(
+        employed,
+        c.ahv_rate_employed + c.iv_rate_employed + c.eo_rate_employed,
+        c.ahv_rate_self_employed + c.iv_rate_self_employed + c.eo_rate_self_employed,
+    )
+
+    # ALV only for employed persons and only up to the ALV income ceiling
+    alv_total = np.where(
+        employed,
+        c.alv_rate_employed * np.minimum(income_gross, c.alv_income_ceiling),
+        0.0,
+    )
+
+    return income_gross * social_rate + alv_total
+
+
+def get_mandatory_pension_contribution_vectorized(income_gross, age):
+    """
+    Vectorized version of get_mandatory_pension_contribution().
+
+    The age band rates are selected with np.select and the coordinated salary is
+    capped at the BVG maximum, using the same bounds as the scalar function.
+
+    Parameters:
+        income_gross (array-like of float):
+            Annual gross incomes in CHF.
+        age (array-like of int):
+            Ages of the persons in years.
+
+    Returns:
+        np.ndarray:
+            Annual mandatory employee BVG contributions in CHF per person.
+    """
+
+    income_gross = np.asarray(income_gross, dtype=float)
+    age = np.asarray(age)
+
+    # BVG contribution rate per age band, 0 below the coordination level, under 25 or over 65
+    bv_rate = np.select(
+        [
+            (income_gross < c.coord_salary_min) | (age < 25),
+            (age >= 25) & (age <= 34),
+            (age >= 35) & (age <= 44),
+            (age >= 45) & (age <= 54),
+            (age >= 55) & (age <= 65),
+        ],
+        [
+            0.0,
+            c.bv_rate_25_34,
+            c.bv_rate_35_44,
+            c.bv_rate_45_54,
+            c.bv_rate_55_65,
+        ],
+        default=0.0,
+    )
+
+    # Coordinated salary, capped at the maximum coordinated salary
+    coord_salary = np.minimum(income_gross - c.coordination_deduction, c.coord_salary_max)
+
+    # Employee share of the total BVG contribution
+    return bv_rate * coord_salary * (1 - c.employer_contribution_share)
+
+
+def get_total_mandatory_deductions_vectorized(income_gross, age, employed):
+    """
+    Vectorized version of get_total_mandatory_deductions().
+
+    Parameters:
+        income_gross (array-like of float): annual gross incomes in CHF.
+        age (array-like of int): ages of the persons in years.
+        employed (array-like of bool): True if employed, False if self-employed.
+
+    Returns:
+        np.ndarray: total annual mandatory deductions in CHF per person.
+    """
+
+    return (
+        get_total_social_deductions_vectorized(income_gross, employed)
+        + get_mandatory_pension_contribution_vectorized(income_gross, age)
+    )
@@ -2,10 +2,13 @@
 
 # Import libraries
 import pandas as pd
+import numpy as np              # used for the array-based (vectorized) versions
+from functools import lru_cache # parse each deduction table only once per data folder
 
 # Backend modules
 import data.constants as c
 import loaders.load_datasets as ld
+import loaders.paths as paths   # data folder the rules are read from (cache key)
 
 
 ##################################################################################################
@@ -383,3 +386,362 @@ def calculate_cantonal_optional_deductions(
         "child_deduction_age_based": child_deduction_age_based,
         "total_cantonal_optional_deductions": total_cantonal_optional_deductions,
     }
+
+
+##################################################################################################
+
+
+### Pre-parsed deduction rules
+# The vectorized functions below do not search the deduction tables for every profile.
+# The rows they need are located once by keyword and stored as plain numbers:
+#   {rule_name: {"amount": ..., "percent": ..., "minimum": ..., "maximum": ...}}
+
+# Deduction rows used on federal level (rule name -> keyword in the 'deduction' column)
+FEDERAL_RULE_KEYWORDS = {
+    "travel": "deduction_of_travel_expenses_main_income",
+    "insurance_married_with_pension": "married_persons_with_contributions_pillar_2/3a",
+    "insurance_married_without_pension": "married_persons_without_contributions_pillar_2/3a",
+    "insurance_single_with_pension": "single_persons_with_contributions_pillar_2/3a",
+    "insurance_single_without_pension": "single_persons_without_contributions_pillar_2/3a",
+    "insurance_child": "deduction_of_insurance_premiums_and_savings_interest,_child",
+    "pillar_3a_with_pension": "maximum_deduction_pillar_3a_with_pension_solution",
+    "pillar_3a_without_pension": "maximum_deduction_pillar_3a_without_pension_solution",
+    "child": "child_deduction",
+    "married": "deduction_for_married_persons",
+    "childcare": "deduction_of_child_care_expenses_by_third_parties",
+}
+
+# Deduction rows used on cantonal level (St. Gallen)
+CANTONAL_RULE_KEYWORDS = {
+    "travel": "deduction_of_travel_expenses_main_income",
+    "insurance_married_with_pension": "married_persons_with_contributions_pillar_2/3a",
+    "insurance_married_without_pension": "married_persons_without_contributions_pillar_2/3a",
+    "insurance_single_with_pension": "single_persons_with_contributions_pillar_2/3a",
+    "insurance_single_without_pension": "single_persons_without_contributions_pillar_2/3a",
+    "insurance_child": "deduction_of_insurance_premiums_and_savings_interest,_child",
+    "pillar_3a_with_pension": "maximum_deduction_pillar_3a_with_pension_solution",
+    "pillar_3a_without_pension": "maximum_deduction_pillar_3a_without_pension_solution",
+    "two_income": "deduction_for_two_income_couples",
+    "asset_management": "deduction_for_asset_management_costs",
+    "childcare": "deduction_of_child_care_expenses_by_third_parties",
+    "education_own_contribution": "child_education_costs,_own_contribution",
+    "education": "deduction_for_child_education_costs",
+    "child_under_7": "child_deduction,_age_under_7",
+    "child_over_6": "child_deduction,_age_over_6",
+}
+
+
+def parse_deduction_rules(tax_deductions, rule_keywords):
+    """
+    Extract the deduction rules needed for the calculation from a deduction table.
+
+    Parameters:
+        tax_deductions (pd.DataFrame): cleaned deduction table (see load_tax_deductions).
+        rule_keywords (dict): rule name -> keyword of the matching 'deduction' row.
+
+    Returns:
+        dict: rule name -> {"amount", "percent", "minimum", "maximum"} as floats.
+    """
+
+    rules = {}
+    for name, keyword in rule_keywords.items():
+        row = get_row_by_keyword(tax_deductions, keyword)
+        rules[name] = {
+            "amount": float(row["amount"]),
+            "percent": float(row["percent"]),
+            "minimum": float(row["minimum"]),
+            "maximum": float(row["maximum"]),
+        }
+    return rules
+
+
+@lru_cache(maxsize=None)
+def _load_deduction_rules(tax_level, data_dir):
+    """Parsed rules of one tax level, cached per data folder (data_dir is only the cache key)."""
+    if tax_level == "federal":
+        return parse_deduction_rules(ld.load_tax_deductions(tax_level="federal"), FEDERAL_RULE_KEYWORDS)
+    return parse_deduction_rules(ld.load_tax_deductions(tax_level="cantonal"), CANTONAL_RULE_KEYWORDS)
+
+
+def get_deduction_rules(tax_level):
+    """
+    Load and parse the federal or cantonal deduction rules once per process and data folder.
+
+    The cache is keyed on the current data folder (loaders/paths.data_dir(), i.e.
+    TAX_APP_DATA_DIR), so pointing the loaders to another folder loads its rules. A reload of
+    changed files in the same folder must call clear_deduction_rules_cache() first.
+
+    Parameters:
+        tax_level (str): "federal" or "cantonal".
+
+    Returns:
+        dict: parsed deduction rules (see parse_deduction_rules).
+    """
+
+    return _load_deduction_rules(tax_level, paths.data_dir())
+
+
+def clear_deduction_rules_cache():
+    """Forget the parsed rules, so the next get_deduction_rules() reads the files again (reload)."""
+    _load_deduction_rules.cache_clear()
+
+
+##################################################################################################
+
+
+### Vectorized optional deductions (batch use)
+# Column-wise versions of the federal and cantonal optional deductions.
+# They take a profile batch (DataFrame or dict of arrays with the same field names
+# as the scalar functions) and return a DataFrame with one column per deduction
+# component plus the total, with the same values as the scalar functions.
+
+def _profile_column(profiles, name, default=0.0, dtype=float):
+    """Return a profile field as NumPy array, or the scalar default if the field is missing."""
+    if name in profiles:
+        return np.asarray(profiles[name], dtype=dtype)
+    return dtype(default)
+
+
+def cap_to_min_max_vectorized(amount, minimum, maximum):
+    """
+    Vectorized version of cap_to_min_max(): bounds that are 0 or below are ignored.
+
+    Parameters:
+        amount (np.ndarray): original values to be capped.
+        minimum (float): lower bound (only enforced if > 0).
+        maximum (float): upper bound (only enforced if > 0).
+
+    Returns:
+        np.ndarray: values constrained between minimum and maximum (where defined).
+    """
+
+    value = amount
+    if minimum > 0:
+        value = np.maximum(value, minimum)
+    if maximum > 0:
+        value = np.minimum(value, maximum)
+    return value
+
+
+def get_insurance_maximum_vectorized(rules, is_married, has_3a_or_pension):
+    """
+    Select the adult insurance premium maximum per profile from the four household
+    variants (married/single, with/without pillar 2 or 3a contributions).
+
+    Parameters:
+        rules (dict): parsed federal or cantonal deduction rules.
+        is_married (np.ndarray of bool): True for married persons.
+        has_3a_or_pension (np.ndarray of bool): True if employed or paying into pillar 3a.
+
+    Returns:
+        np.ndarray: maximum insurance premium deduction per profile.
+    """
+    return np.select(
+        [
+            is_married & has_3a_or_pension,
+            is_married & ~has_3a_or_pension,
+            ~is_married & has_3a_or_pension,
+        ],
+        [
+            rules["insurance_married_with_pension"]["maximum"],
+            rules["insurance_married_without_pension"]["maximum"],
+            rules["insurance_single_with_pension"]["maximum"],
+        ],
+        default=rules["insurance_single_without_pension"]["maximum"],
+    )
+
+
+def calculate_federal_optional_deductions_vectorized(profiles, rules=None):
+    """
+    Vectorized version of calculate_federal_optional_deductions().
+
+    Parameters:
+        profiles (pd.DataFrame or dict of arrays): profile batch with the fields
+            income_gross, employed, marital_status, number_of_children,
+            contribution_pillar_3a, total_insurance_expenses and optionally
+            travel_expenses_main_income, child_care_expenses_third_party.
+        rules (dict or None): parsed federal rules, defaults to get_deduction_rules("federal").
+
+    Returns:
+        pd.DataFrame: one column per deduction component and "total_federal_optional_deductions".
+    """
+
+    if rules is None:
+        rules = get_deduction_rules("federal")
+
+    # Read the profile fields as arrays
+    employed = np.asarray(profiles["employed"], dtype=bool)
+    is_married = np.asarray(profiles["marital_status"]) == "married"
+    number_of_children = np.asarray(profiles["number_of_children"], dtype=float)
+    contribution_pillar_3a = np.asarray(profiles["contribution_pillar_3a"], dtype=float)
+    total_insurance_expenses = np.asarray(profiles["total_insurance_expenses"], dtype=float)
+    travel_expenses_main_income = _profile_column(profiles, "travel_expenses_main_income")
+    child_care_expenses_third_party = _profile_column(profiles, "child_care_expenses_third_party")
+
+    ### Travel expenses, capped at the maximum
+    travel_deduction = np.minimum(travel_expenses_main_income, rules["travel"]["maximum"])
+
+    ### Insurance premiums (adults): household variant selected with masks
+    has_3a_or_pension = employed | (contribution_pillar_3a > 0)
+    insurance_deduction_adults = np.minimum(
+        total_insurance_expenses,
+        get_insurance_maximum_vectorized(rules, is_married, has_3a_or_pension),
+    )
+
+    ### Insurance premiums per child
+    insurance_deduction_children = number_of_children * rules["insurance_child"]["maximum"]
+
+    ### Pillar 3a with vs without pension solution
+    max_p3 = np.where(
+        employed,
+        rules["pillar_3a_with_pension"]["maximum"],
+        rules["pillar_3a_without_pension"]["maximum"],
+    )
+    deduction_pillar_3a = np.minimum(contribution_pillar_3a, max_p3)
+
+    ### Child deduction and married-person deduction (flat amounts)
+    child_deduction = number_of_children * rules["child"]["amount"]
+    married_deduction = np.where(is_married, rules["married"]["amount"], 0.0)
+
+    ### Child care expenses by third parties
+    childcare_deduction = np.minimum(child_care_expenses_third_party, rules["childcare"]["maximum"])
+
+    ### Total federal optional deductions
+    total_federal_optional_deductions = (
+        travel_deduction
+        + insurance_deduction_adults
+        + insurance_deduction_children
+        + deduction_pillar_3a
+        + child_deduction
+        + married_deduction
+        + childcare_deduction
+    )
+
+    # Columnar result with the same keys as the scalar function
+    return pd.DataFrame(
+        {
+            "travel_deduction": np.broadcast_to(travel_deduction, employed.shape),
+            "insurance_deduction_adults": insurance_deduction_adults,
+            "insurance_deduction_children": insurance_deduction_children,
+            "pillar_3a_deduction": deduction_pillar_3a,
+            "child_deduction": child_deduction,
+            "married_deduction": married_deduction,
+            "childcare_deduction": np.broadcast_to(childcare_deduction, employed.shape),
+            "total_federal_optional_deductions": total_federal_optional_deductions,
+        },
+        index=getattr(profiles, "index", None),
+    )
+
+
+def calculate_cantonal_optional_deductions_vectorized(profiles, rules=None):
+    """
+    Vectorized version of calculate_cantonal_optional_deductions().
+
+    Parameters:
+        profiles (pd.DataFrame or dict of arrays): profile batch with the fields
+            income_gross, employed, marital_status, number_of_children,
+            contribution_pillar_3a, total_insurance_expenses and optionally
+            travel_expenses_main_income, child_care_expenses_third_party,
+            is_two_income_couple, taxable_assets, child_education_expenses,
+            number_of_children_under_7, number_of_children_7_and_over.
+        rules (dict or None): parsed cantonal rules, defaults to get_deduction_rules("cantonal").
+
+    Returns:
+        pd.DataFrame: one column per deduction component and "total_cantonal_optional_deductions".
+    """
+
+    if rules is None:
+        rules = get_deduction_rules("cantonal")
+
+    # Read the profile fields as arrays (optional fields default to 0 / False like the scalar function)
+    employed = np.asarray(profiles["employed"], dtype=bool)
+    is_married = np.asarray(profiles["marital_status"]) == "married"
+    number_of_children = np.asarray(profiles["number_of_children"], dtype=float)
+    contribution_pillar_3a = np.asarray(profiles["contribution_pillar_3a"], dtype=float)
+    total_insurance_expenses = np.asarray(profiles["total_insurance_expenses"], dtype=float)
+    travel_expenses_main_income = _profile_column(profiles, "travel_expenses_main_income")
+    child_care_expenses_third_party = _profile_column(profiles, "child_care_expenses_third_party")
+    is_two_income_couple = _profile_column(profiles, "is_two_income_couple", False, bool)
+    taxable_assets = _profile_column(profiles, "taxable_assets")
+    child_education_expenses = _profile_column(profiles, "child_education_expenses")
+    number_of_children_under_7 = _profile_column(profiles, "number_of_children_under_7")
+    number_of_children_7_and_over = _profile_column(profiles, "number_of_children_7_and_over")
+
+    n = employed.shape
+
+    ### Travel expenses for main income
+    travel_deduction = np.minimum(travel_expenses_main_income, rules["travel"]["maximum"])
+
+    ### Insurance premiums (adults and per child)
+    has_3a_or_pension = employed | (contribution_pillar_3a > 0)
+    insurance_deduction_adults = np.minimum(
+        total_insurance_expenses,
+        get_insurance_maximum_vectorized(rules, is_married, has_3a_or_pension),
+    )
+    insurance_deduction_children = number_of_children * rules["insurance_child"]["maximum"]
+
+    ### Pillar 3a deduction (cantonal)
+    max_p3 = np.where(
+        employed,
+        rules["pillar_3a_with_pension"]["maximum"],
+        rules["pillar_3a_without_pension"]["maximum"],
+    )
+    pillar_3a_deduction = np.minimum(contribution_pillar_3a, max_p3)
+
+    ### Two-income couples deduction
+    two_income_deduction = np.where(
+        is_married & is_two_income_couple, rules["two_income"]["maximum"], 0.0
+    )
+
+    ### Asset management costs (percentage of assets, bounded)
+    raw_asset_deduction = taxable_assets * (rules["asset_management"]["percent"] / 100.0)
+    asset_management_deduction = cap_to_min_max_vectorized(
+        raw_asset_deduction,
+        rules["asset_management"]["minimum"],
+        rules["asset_management"]["maximum"],
+    )
+
+    ### Child care expenses by third parties
+    childcare_deduction = np.minimum(child_care_expenses_third_party, rules["childcare"]["maximum"])
+
+    ### Child education costs after the parents' own contribution
+    net_education_expenses = np.maximum(
+        0.0, child_education_expenses - rules["education_own_contribution"]["amount"]
+    )
+    child_education_deduction = np.minimum(net_education_expenses, rules["education"]["maximum"])
+
+    ### Child deductions by age group
+    child_deduction_age_based = (
+        (number_of_children_under_7 * rules["child_under_7"]["amount"])
+        + (number_of_children_7_and_over * rules["child_over_6"]["amount"])
+    )
+
+    ### Total cantonal optional deductions
+    total_cantonal_optional_deductions = (
+        travel_deduction
+        + insurance_deduction_adults
+        + insurance_deduction_children
+        + pillar_3a_deduction
+        + two_income_deduction
+        + asset_management_deduction
+        + childcare_deduction
+        + child_education_deduction
+        + child_deduction_age_based
+    )
+
+    # Columnar result with the same keys as the scalar function
+    return pd.DataFrame(
+        {
+            "travel_deduction": np.broadcast_to(travel_deduction, n),
+            "insurance_deduction_adults": insurance_deduction_adults,
+            "insurance_deduction_children": insurance_deduction_children,
+            "pillar_3a_deduction": pillar_3a_deduction,
+            "two_income_deduction": np.broadcast_to(two_income_deduction, n),
+            "asset_management_deduction": np.broadcast_to(asset_management_deduction, n),
+            "childcare_deduction": np.broadcast_to(childcare_deduction, n),
+            "child_education_deduction": np.broadcast_to(child_education_deduction, n),
+            "child_deduction_age_based": np.broadcast_to(child_deduction_age_based, n),
+            "total_cantonal_optional_deductions": total_cantonal_optional_deductions,
+        },
+        index=getattr(profiles, "index", None),
+    )
@@ -0,0 +1,170 @@
+# diagnostics/cold_start.py
+
+# Import libraries
+import argparse                 # command line options of the check
+import json                     # result of the measured child process
+import os                       # paths and environment of the child process
+import subprocess               # runs the cold start in a fresh interpreter
+import sys                      # interpreter path and loaded modules
+import time                     # wall clock time of the cold start
+
+
+##################################################################################################
+
+
+### Cold start check for the Streamlit entry point
+# Starts a fresh Python process with "-X importtime", renders the app once with Streamlit's
+# AppTest (no browser needed) and reports:
+#   - wall time of the whole cold start (interpreter + imports + first render)
+#   - time of the first render itself
+#   - the slowest imports, from the "-X importtime" output
+#   - heavy modules that should only be loaded on first use but were loaded anyway
+#
+# Usage (from the tax_calculator_app folder):
+#   python -m diagnostics.cold_start [--max-seconds 5] [--top 20] [--report import_times.txt]
+# Exits with status 1 if the cold start takes longer than --max-seconds or a deferred
+# module was loaded before the first render, so it can be used as a check in CI.
+
+# Entry point of the app, relative to the tax_calculator_app folder
+APP_FILE = "tax_calculator.py"
+
+# Modules that must not be loaded to render the input form
+DEFERRED_MODULES = ("plotly.express", "joblib", "sklearn")
+
+# Default cap for the cold start (seconds)
+DEFAULT_MAX_SECONDS = 5.0
+
+
+def _render_once():
+    """Child process: render the app once and print the timings as JSON."""
+    start = time.perf_counter()
+
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.abspath(APP_FILE), default_timeout=120)
+    app.run()
+
+    print(json.dumps({
+        "first_render_seconds": time.perf_counter() - start,
+        "exceptions": [str(e.value) for e in app.exception],
+        "deferred_modules_loaded": [m for m in DEFERRED_MODULES if m in sys.modules],
+    }))
+
+
+def parse_importtime(stderr_text):
+    """
+    Parse the output of "python -X importtime".
+
+    Parameters:
+        stderr_text (str): stderr of the child process.
+
+    Returns:
+        list of dict: one entry per imported module with "module", "self_us",
+        "cumulative_us" and "depth" (nesting level in the import tree).
+    """
+
+    imports = []
+    for line in stderr_text.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        imports.append({
+            "module": name.strip(),
+            "self_us": int(self_us),
+            "cumulative_us": int(cumulative_us),
+            "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+        })
+    return imports
+
+
+def measure_cold_start():
+    """
+    Render the app once in a fresh interpreter and measure the cold start.
+
+    Returns:
+        dict: "wall_seconds", "first_render_seconds", "exceptions",
+              "deferred_modules_loaded" and "imports" (parsed importtime output).
+    """
+
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "diagnostics.cold_start", "--child"],
+        capture_output=True,
+        text=True,
+        # Without the background warm-up (loaders/warmup.py), which loads the deferred modules on
+        # purpose: the check is about what the first render itself needs
+        env={**os.environ, "PYTHONPATH": os.getcwd(), "TAX_APP_WARMUP": "off"},
+    )
+    wall_seconds = time.perf_counter() - start
+
+    # The child prints its JSON result as the last line of stdout
+    output_lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not output_lines:
+        raise RuntimeError(f"Cold start run failed:\n{completed.stderr[-2000:]}")
+
+    result = json.loads(output_lines[-1])
+    result["wall_seconds"] = wall_seconds
+    result["imports"] = parse_importtime(completed.stderr)
+    return result
+
+
+def format_report(result, top=20):
+    """Build the text report: timings, slowest top-level packages and slowest single imports."""
+
+    # Packages imported directly (depth 0), by cumulative time
+    top_level = sorted(
+        (i for i in result["imports"] if i["depth"] == 0),
+        key=lambda i: i["cumulative_us"],
+        reverse=True,
+    )
+    # Individual modules, by their own import time
+    by_self = sorted(result["imports"], key=lambda i: i["self_us"], reverse=True)
+
+    lines = [
+        f"Cold start wall time:   {result['wall_seconds']:.2f} s",
+        f"First render:           {result['first_render_seconds']:.2f} s",
+        f"Deferred modules loaded before first render: {result['deferred_modules_loaded'] or 'none'}",
+        "",
+        f"### Top {top} top-level imports by cumulative time",
+    ]
+    lines += [f"{i['cumulative_us'] / 1000:9.1f} ms  {i['module']}" for i in top_level[:top]]
+    lines += ["", f"### Top {top} modules by own import time"]
+    lines += [f"{i['self_us'] / 1000:9.1f} ms  {i['module']}" for i in by_self[:top]]
+    if result["exceptions"]:
+        lines += ["", "### Exceptions during first render", *result["exceptions"]]
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the cold start of the Streamlit app.")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--max-seconds", type=float, default=DEFAULT_MAX_SECONDS,
+                        help="fail if the cold start (wall time) takes longer")
+    parser.add_argument("--top", type=int, default=20, help="number of imports listed in the report")
+    parser.add_argument("--report", default=None, help="also write the report to this file")
+    args = parser.parse_args()
+
+    if args.child:
+        _render_once()
+        sys.exit(0)
+
+    result = measure_cold_start()
+    report = format_report(result, top=args.top)
+    print(report)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+
+    # Gate: time cap, deferred modules and exceptions
+    failures = []
+    if result["wall_seconds"] > args.max_seconds:
+        failures.append(f"cold start took {result['wall_seconds']:.2f} s (cap {args.max_seconds:.2f} s)")
+    if result["deferred_modules_loaded"]:
+        failures.append(f"deferred modules loaded before first render: {result['deferred_modules_loaded']}")
+    if result["exceptions"]:
+        failures.append("the first render raised an exception")
+
+    if failures:
+        print("\nCold start check FAILED: " + "; ".join(failures))
+        sys.exit(1)
+    print("\nCold start check passed.")
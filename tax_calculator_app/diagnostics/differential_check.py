@@ -0,0 +1,683 @@
+# diagnostics/differential_check.py
+
+# Import libraries
+import argparse                 # command line options of the check
+import os                       # number of worker processes
+import sys                      # exit status for CI
+import time                     # run time and throughput
+from concurrent.futures import ProcessPoolExecutor   # chunks are checked in worker processes
+
+import numpy as np              # profile generation and differences
+import pandas as pd             # profile batches
+
+# Backend modules
+import data.constants as c
+import deductions.mandatory_deductions as md
+import deductions.optional_deductions as od
+import tax_calculations.batch_income_tax as bt
+import tax_calculations.commune_comparison as cc
+import tax_calculations.fused_tax_kernel as fk
+import tax_calculations.shared_tax_tables as stt
+import tax_calculations.total_income_tax as t
+
+
+##################################################################################################
+
+
+### Differential correctness check of the fast tax engines
+# Compares the fast (vectorized / table-driven) implementations with the scalar reference
+# functions in deductions/ and tax_calculations/ on randomized profile sets:
+#
+#   reference   the app's scalar pipeline, profile by profile (md.*, od.*, t.calculation_total_income_tax)
+#   fast paths  FAST_PATHS below, each called on a whole chunk of profiles
+#
+# The scalar reference takes about 5 ms per profile, too slow for millions of profiles. So:
+#   - every fast path is compared with the reference on a random sample of each chunk
+#     (--reference-share, default 0.2 %), and
+#   - every other fast path is compared with the primary fast path (batch_income_tax) on
+#     all profiles.
+#
+# About half of the profiles (--boundary-share) are placed on the edges where the logic
+# branches: federal and cantonal bracket thresholds (net income), the ALV income ceiling,
+# the BVG coordination bounds and age bands, and the pillar 3a / insurance / childcare caps,
+# each with a small offset (-1 ... +1 CHF). Chunks are generated inside the worker processes
+# from (seed, chunk number), so the same seed always checks the same profiles.
+#
+# The report lists the maximum absolute difference per comparison and tax component and,
+# for every comparison with differences above the tolerance, a few failing profiles reduced
+# to the fields that matter (all other fields set to simple values).
+#
+# Usage (from the tax_calculator_app folder):
+#   python -m diagnostics.differential_check [--profiles 10000000] [--workers 8]
+#          [--chunk-size 100000] [--reference-share 0.002] [--tolerance 0.01] [--seed 42]
+# Exits with status 1 if any difference exceeds the tolerance, so it can gate performance work.
+
+# Components compared (all amounts in CHF, taxes rounded to two decimals as in the app)
+COMPONENTS = [
+    "total_mandatory_deductions",
+    "total_federal_optional_deductions",
+    "total_cantonal_optional_deductions",
+    "income_net_federal",
+    "income_net_cantonal",
+    "federal_tax",
+    "cantonal_base_tax",
+    "cantonal_tax",
+    "municipal_tax",
+    "church_tax",
+    "total_cantonal_municipal_church_tax",
+    "total_income_tax",
+]
+
+# Fast path every other fast path is compared with on all profiles
+PRIMARY_FAST_PATH = "batch_income_tax"
+
+DEFAULT_TOLERANCE = 0.01            # CHF; one rounding step of the two-decimal results
+FLOAT_SLACK = 1e-6                  # differences of exactly one rounding step are accepted
+DEFAULT_CHUNK_SIZE = 100_000
+DEFAULT_REFERENCE_SHARE = 0.002     # 10M profiles -> 20'000 scalar reference runs
+DEFAULT_BOUNDARY_SHARE = 0.5
+DEFAULT_MAX_FAILURES = 3            # failing profiles kept (and minimized) per comparison
+
+# Offsets (CHF) around every boundary
+BOUNDARY_OFFSETS = np.array([-1.0, -0.01, 0.0, 0.01, 1.0])
+
+# Ages around the BVG age bands
+BOUNDARY_AGES = np.array([24, 25, 34, 35, 44, 45, 54, 55, 65, 66])
+
+
+##################################################################################################
+
+### Fast paths
+
+
+def _fast_batch_income_tax(profiles, context):
+    """Vectorized pipeline (tax_calculations/batch_income_tax.py), NumPy engine."""
+    result = bt.calculate_income_tax_batch(
+        profiles, context["tax_tables"], context["federal_deduction_rules"], context["cantonal_deduction_rules"],
+        engine="numpy",
+    )
+    return {key: result[key].to_numpy() for key in COMPONENTS}
+
+
+def _fast_fused_kernel(profiles, context):
+    """Vectorized pipeline with the Numba-compiled tax kernel (tax_calculations/fused_tax_kernel.py)."""
+    result = bt.calculate_income_tax_batch(
+        profiles, context["tax_tables"], context["federal_deduction_rules"], context["cantonal_deduction_rules"],
+        engine="numba",
+    )
+    return {key: result[key].to_numpy() for key in COMPONENTS}
+
+
+def _fast_deduplicated_batch(profiles, context):
+    """Vectorized pipeline with duplicate profiles calculated once (tax_calculations/batch_deduplication.py)."""
+    result, _ = bt.calculate_income_tax_batch_deduplicated(
+        profiles, context["tax_tables"], context["federal_deduction_rules"], context["cantonal_deduction_rules"],
+        engine="numpy",
+    )
+    return {key: result[key].to_numpy() for key in COMPONENTS}
+
+
+def _fast_commune_comparison(profiles, context):
+    """All-communes matrix (tax_calculations/commune_comparison.py), column of the profile's commune."""
+    components = cc.calculate_commune_tax_components(
+        profiles, context["tax_tables"], context["federal_deduction_rules"], context["cantonal_deduction_rules"]
+    )
+    column = pd.Index(components["commune"]).get_indexer(profiles["commune"])
+    rows = np.arange(len(profiles))
+
+    result = {
+        "federal_tax": components["federal_tax"],
+        "cantonal_base_tax": components["cantonal_base_tax"],
+        "cantonal_tax": components["cantonal_tax"][rows, column],
+        "municipal_tax": components["municipal_tax"][rows, column],
+        "church_tax": components["church_tax"][rows, column],
+        "total_income_tax": components["total_income_tax"][rows, column],
+    }
+    result["total_cantonal_municipal_church_tax"] = (
+        result["cantonal_tax"] + result["municipal_tax"] + result["church_tax"]
+    )
+    return {key: np.round(value, 2) for key, value in result.items()}
+
+
+# Fast implementations: name -> function(profiles, context) -> {component: array}
+# (components a path does not calculate are left out)
+FAST_PATHS = {
+    "batch_income_tax": _fast_batch_income_tax,
+    "commune_comparison": _fast_commune_comparison,
+    "deduplicated_batch": _fast_deduplicated_batch,
+}
+
+# The fused kernel is only checked where Numba is installed (otherwise it is the NumPy engine)
+if fk.numba_available():
+    FAST_PATHS["fused_kernel"] = _fast_fused_kernel
+
+
+##################################################################################################
+
+### Scalar reference
+
+
+def reference_income_tax(profile, context):
+    """
+    Calculate one profile with the scalar functions, in the same steps as the app.
+
+    Parameters:
+        profile (dict): profile fields (see batch_income_tax.py).
+        context (dict): app context from loaders/startup.load_app_context.
+
+    Returns:
+        dict: all COMPONENTS for the profile.
+    """
+
+    church_affiliation = profile["church_affiliation"]
+    if church_affiliation in (None, "none"):
+        church_affiliation = None
+
+    total_mandatory_deductions = md.get_total_mandatory_deductions(
+        profile["income_gross"], profile["age"], profile["employed"]
+    )
+    common = {
+        "income_gross": profile["income_gross"],
+        "employed": profile["employed"],
+        "marital_status": profile["marital_status"],
+        "number_of_children": profile["number_of_children"],
+        "contribution_pillar_3a": profile["contribution_pillar_3a"],
+        "total_insurance_expenses": profile["total_insurance_expenses"],
+        "travel_expenses_main_income": profile["travel_expenses_main_income"],
+        "child_care_expenses_third_party": profile["child_care_expenses_third_party"],
+    }
+    federal = od.calculate_federal_optional_deductions(**common)["total_federal_optional_deductions"]
+    cantonal = od.calculate_cantonal_optional_deductions(
+        **common,
+        is_two_income_couple=profile["is_two_income_couple"],
+        taxable_assets=profile["taxable_assets"],
+        child_education_expenses=profile["child_education_expenses"],
+        number_of_children_under_7=profile["number_of_children_under_7"],
+        number_of_children_7_and_over=profile["number_of_children_7_and_over"],
+    )["total_cantonal_optional_deductions"]
+
+    income_net_federal = profile["income_gross"] - (total_mandatory_deductions + federal)
+    income_net_cantonal = profile["income_gross"] - (total_mandatory_deductions + cantonal)
+
+    income_tax = t.calculation_total_income_tax(
+        context["tax_rates_federal"],
+        context["tax_rates_cantonal"],
+        context["tax_multiplicators_cantonal_municipal"],
+        marital_status=profile["marital_status"],
+        number_of_children=profile["number_of_children"],
+        income_net_federal=income_net_federal,
+        income_net_cantonal=income_net_cantonal,
+        commune=profile["commune"],
+        church_affiliation=church_affiliation,
+    )
+
+    return {
+        "total_mandatory_deductions": total_mandatory_deductions,
+        "total_federal_optional_deductions": federal,
+        "total_cantonal_optional_deductions": cantonal,
+        "income_net_federal": income_net_federal,
+        "income_net_cantonal": income_net_cantonal,
+        **income_tax,
+    }
+
+
+##################################################################################################
+
+### Profile generation
+
+
+def _profile_records(profiles):
+    """Profile batch as a list of plain Python dicts (for the scalar functions)."""
+    records = profiles.to_dict("records")
+    for record in records:
+        for key, value in record.items():
+            if isinstance(value, np.generic):
+                record[key] = value.item()
+    return records
+
+
+def random_profiles(rng, n, communes):
+    """
+    Draw random profiles over wide ranges (including zero incomes, ages outside the BVG
+    bands and amounts above the deduction caps).
+
+    Returns:
+        pd.DataFrame: profile batch (see batch_income_tax.py).
+    """
+
+    marital_status = rng.choice(np.array(["single", "married"], dtype=object), size=n)
+    number_of_children_under_7 = rng.integers(0, 4, size=n)
+    number_of_children_7_and_over = rng.integers(0, 4, size=n)
+    number_of_children = number_of_children_under_7 + number_of_children_7_and_over
+    employed = rng.random(n) < 0.7
+
+    return pd.DataFrame({
+        "income_gross": np.where(rng.random(n) < 0.03, 0.0, rng.uniform(0, 400_000, size=n).round(2)),
+        "age": rng.integers(18, 81, size=n),
+        "employed": employed,
+        "marital_status": marital_status,
+        "is_two_income_couple": (marital_status == "married") & (rng.random(n) < 0.5),
+        "number_of_children_under_7": number_of_children_under_7,
+        "number_of_children_7_and_over": number_of_children_7_and_over,
+        "number_of_children": number_of_children,
+        "commune": rng.choice(np.asarray(communes, dtype=object), size=n),
+        "church_affiliation": rng.choice(
+            np.array(["roman_catholic", "protestant", "christian_catholic", "none"], dtype=object), size=n
+        ),
+        "contribution_pillar_3a": np.where(
+            rng.random(n) < 0.2, 0.0, rng.uniform(0, np.where(employed, 10_000, 45_000)).round(2)
+        ),
+        "total_insurance_expenses": rng.uniform(0, 12_000, size=n).round(2),
+        "travel_expenses_main_income": rng.uniform(0, 15_000, size=n).round(2),
+        "child_care_expenses_third_party": np.where(
+            number_of_children > 0, rng.uniform(0, 40_000, size=n).round(2), 0.0
+        ),
+        "taxable_assets": rng.uniform(0, 1_000_000, size=n).round(2),
+        "child_education_expenses": np.where(
+            number_of_children_7_and_over > 0, rng.uniform(0, 30_000, size=n).round(2), 0.0
+        ),
+    })
+
+
+def _gross_income_for_net(profiles, target_net, level, context, iterations=6):
+    """
+    Gross incomes whose federal or cantonal net income is (close to) target_net, keeping the
+    other fields of the profiles. The deductions are piecewise linear in the gross income,
+    so a few fixed-point steps gross += target - net(gross) land on the target.
+    """
+
+    profiles = profiles.copy()
+    gross = np.maximum(np.asarray(target_net, dtype=float), 0.0)
+    for _ in range(iterations):
+        profiles["income_gross"] = gross
+        net = bt.calculate_net_incomes_batch(
+            profiles, context["federal_deduction_rules"], context["cantonal_deduction_rules"]
+        )[f"income_net_{level}"]
+        gross = np.maximum(gross + (target_net - net), 0.0)
+    return gross
+
+
+def boundary_profiles(rng, n, context):
+    """
+    Random profiles moved onto the edges where the calculation branches.
+
+    Every profile gets one boundary (chosen at random) plus a small offset:
+      - federal / cantonal bracket thresholds (as net incomes)
+      - ALV income ceiling, BVG coordination minimum and maximum (as gross incomes)
+      - pillar 3a, insurance and childcare caps (as deduction inputs)
+    and half of them an age next to a BVG age band limit.
+
+    Returns:
+        pd.DataFrame: profile batch (see batch_income_tax.py).
+    """
+
+    profiles = random_profiles(rng, n, context["communes"])
+    offsets = rng.choice(BOUNDARY_OFFSETS, size=n)
+    kind = rng.integers(0, 5, size=n)
+
+    ### Bracket thresholds of the federal tax classes and the cantonal base tax (net incomes)
+    federal_edges = np.unique(np.concatenate([
+        schedule["net_income"] for schedule in context["tax_tables"]["federal"].values()
+    ]))
+    cantonal_edges = np.unique(context["tax_tables"]["cantonal"]["lower_bound"])
+
+    for level, edges, selected in (("federal", federal_edges, kind == 0), ("cantonal", cantonal_edges, kind == 1)):
+        if selected.any():
+            target = rng.choice(edges, size=selected.sum()) + offsets[selected]
+            profiles.loc[selected, "income_gross"] = _gross_income_for_net(
+                profiles[selected], target, level, context
+            ).round(2)
+
+    ### Social security and BVG bounds (gross incomes)
+    gross_edges = np.array([
+        c.alv_income_ceiling,
+        c.coord_salary_min,
+        c.coordination_deduction + c.coord_salary_max,
+    ], dtype=float)
+    selected = kind == 2
+    profiles.loc[selected, "income_gross"] = rng.choice(gross_edges, size=selected.sum()) + offsets[selected]
+
+    ### Deduction caps (pillar 3a with/without pension solution, insurance, childcare)
+    federal_rules = context["federal_deduction_rules"]
+    selected = kind == 3
+    cap_3a = np.where(
+        profiles["employed"], federal_rules["pillar_3a_with_pension"]["maximum"],
+        federal_rules["pillar_3a_without_pension"]["maximum"],
+    )
+    profiles.loc[selected, "contribution_pillar_3a"] = np.maximum(cap_3a[selected] + offsets[selected], 0.0)
+
+    selected = kind == 4
+    insurance_caps = np.array([
+        rules[name]["maximum"]
+        for rules in (federal_rules, context["cantonal_deduction_rules"])
+        for name in ("insurance_single_with_pension", "insurance_married_with_pension")
+    ])
+    profiles.loc[selected, "total_insurance_expenses"] = np.maximum(
+        rng.choice(insurance_caps, size=selected.sum()) + offsets[selected], 0.0
+    )
+    childcare_cap = federal_rules["childcare"]["maximum"]
+    with_children = selected & (profiles["number_of_children"].to_numpy() > 0)
+    profiles.loc[with_children, "child_care_expenses_third_party"] = np.maximum(
+        childcare_cap + offsets[with_children], 0.0
+    )
+
+    ### Ages next to the BVG age band limits
+    at_age_edge = rng.random(n) < 0.5
+    profiles.loc[at_age_edge, "age"] = rng.choice(BOUNDARY_AGES, size=at_age_edge.sum())
+    return profiles
+
+
+def generate_chunk(seed, chunk_number, n, context, boundary_share=DEFAULT_BOUNDARY_SHARE):
+    """Profiles of one chunk: a seeded mix of random and boundary profiles, shuffled."""
+    rng = np.random.default_rng([seed, chunk_number])
+    n_boundary = int(round(n * boundary_share))
+    profiles = pd.concat(
+        [random_profiles(rng, n - n_boundary, context["communes"]), boundary_profiles(rng, n_boundary, context)],
+        ignore_index=True,
+    )
+    return profiles.iloc[rng.permutation(n)].reset_index(drop=True)
+
+
+##################################################################################################
+
+### Comparison
+
+
+def _differences(expected, actual):
+    """Absolute differences of the components both results have: {component: array}."""
+    return {
+        key: np.abs(np.asarray(actual[key], dtype=float) - np.asarray(expected[key], dtype=float))
+        for key in COMPONENTS if key in expected and key in actual
+    }
+
+
+def _record(summary, comparison, profiles, expected, actual, tolerance, max_failures):
+    """Add the differences of one comparison to the running summary."""
+    entry = summary.setdefault(comparison, {"rows": 0, "max_abs_diff": {}, "mismatches": 0, "failures": []})
+    differences = _differences(expected, actual)
+    failing = np.zeros(len(profiles), dtype=bool)
+    for key, diff in differences.items():
+        entry["max_abs_diff"][key] = max(entry["max_abs_diff"].get(key, 0.0), float(diff.max(initial=0.0)))
+        failing |= diff > tolerance + FLOAT_SLACK
+    entry["rows"] += len(profiles)
+    entry["mismatches"] += int(failing.sum())
+    for i in np.flatnonzero(failing)[: max(max_failures - len(entry["failures"]), 0)]:
+        entry["failures"].append(_profile_records(profiles.iloc[[i]])[0])
+
+
+def check_chunk(chunk_number, n, seed, context, tolerance=DEFAULT_TOLERANCE, reference_share=DEFAULT_REFERENCE_SHARE,
+                boundary_share=DEFAULT_BOUNDARY_SHARE, max_failures=DEFAULT_MAX_FAILURES):
+    """
+    Generate and check one chunk of profiles.
+
+    Returns:
+        dict: comparison name -> {"rows", "max_abs_diff" (per component), "mismatches", "failures"}.
+    """
+
+    profiles = generate_chunk(seed, chunk_number, n, context, boundary_share)
+    fast = {name: path(profiles, context) for name, path in FAST_PATHS.items()}
+    summary = {}
+
+    ### Every fast path against the primary one, on all profiles
+    for name, result in fast.items():
+        if name != PRIMARY_FAST_PATH:
+            _record(summary, f"{name} vs {PRIMARY_FAST_PATH}", profiles, fast[PRIMARY_FAST_PATH], result,
+                    tolerance, max_failures)
+
+    ### Every fast path against the scalar reference, on a sample
+    n_reference = min(n, int(np.ceil(n * reference_share))) if reference_share > 0 else 0
+    if n_reference:
+        rows = np.sort(np.random.default_rng([seed, chunk_number, 1]).choice(n, size=n_reference, replace=False))
+        sample = profiles.iloc[rows].reset_index(drop=True)
+        reference = pd.DataFrame([reference_income_tax(p, context) for p in _profile_records(sample)])
+        for name, result in fast.items():
+            _record(summary, f"{name} vs reference", sample, reference,
+                    {key: value[rows] for key, value in result.items()}, tolerance, max_failures)
+    return summary
+
+
+def _merge(total, summary):
+    """Merge the summary of one chunk into the total."""
+    for comparison, entry in summary.items():
+        merged = total.setdefault(comparison, {"rows": 0, "max_abs_diff": {}, "mismatches": 0, "failures": []})
+        merged["rows"] += entry["rows"]
+        merged["mismatches"] += entry["mismatches"]
+        merged["failures"] += entry["failures"]
+        for key, value in entry["max_abs_diff"].items():
+            merged["max_abs_diff"][key] = max(merged["max_abs_diff"].get(key, 0.0), value)
+
+
+def compare_profile(comparison, profile, context):
+    """Differences of one comparison ("<fast> vs reference" or "<fast> vs <fast>") for one profile."""
+    name, other = comparison.split(" vs ")
+    batch = pd.DataFrame([profile])
+    actual = {key: value[0] for key, value in FAST_PATHS[name](batch, context).items()}
+    if other == "reference":
+        expected = reference_income_tax(profile, context)
+    else:
+        expected = {key: value[0] for key, value in FAST_PATHS[other](batch, context).items()}
+    return {key: float(diff) for key, diff in _differences(expected, actual).items()}
+
+
+# Simple values a failing profile is reduced to, field by field (first that keeps the failure wins)
+SIMPLE_VALUES = {
+    "is_two_income_couple": [False],
+    "number_of_children_under_7": [0],
+    "number_of_children_7_and_over": [0],
+    "church_affiliation": ["none"],
+    "contribution_pillar_3a": [0.0],
+    "total_insurance_expenses": [0.0],
+    "travel_expenses_main_income": [0.0],
+    "child_care_expenses_third_party": [0.0],
+    "taxable_assets": [0.0],
+    "child_education_expenses": [0.0],
+    "marital_status": ["single"],
+    "employed": [True],
+    "age": [40],
+}
+
+
+def minimize_failure(comparison, profile, context, tolerance=DEFAULT_TOLERANCE):
+    """
+    Reduce a failing profile: set fields to simple values (SIMPLE_VALUES, first commune)
+    as long as the difference stays above the tolerance, and round the amounts to whole
+    francs where possible.
+
+    Returns:
+        dict: "profile" (minimized), "changed" (fields that still differ from the simple
+              values) and "differences" (components above the tolerance).
+    """
+
+    def fails(candidate):
+        return any(diff > tolerance + FLOAT_SLACK for diff in compare_profile(comparison, candidate, context).values())
+
+    simple_values = {**SIMPLE_VALUES, "commune": [context["communes"][0]]}
+    profile = dict(profile)
+    changed = True
+    while changed:
+        changed = False
+        for field, values in simple_values.items():
+            for value in values:
+                if profile[field] == value:
+                    break
+                candidate = {**profile, field: value}
+                candidate["number_of_children"] = (
+                    candidate["number_of_children_under_7"] + candidate["number_of_children_7_and_over"]
+                )
+                if candidate["marital_status"] != "married":
+                    candidate["is_two_income_couple"] = False
+                if fails(candidate):
+                    profile, changed = candidate, True
+                    break
+
+    # Whole francs make the case easier to read, if the failure does not depend on the cents
+    for field in ("income_gross", "contribution_pillar_3a", "total_insurance_expenses",
+                  "child_care_expenses_third_party"):
+        candidate = {**profile, field: float(round(profile[field]))}
+        if candidate[field] != profile[field] and fails(candidate):
+            profile = candidate
+
+    differences = compare_profile(comparison, profile, context)
+    return {
+        "profile": profile,
+        "changed": {
+            k: v for k, v in profile.items()
+            if k != "number_of_children" and (k not in simple_values or v not in simple_values[k])
+        },
+        "differences": {k: v for k, v in differences.items() if v > tolerance + FLOAT_SLACK},
+    }
+
+
+##################################################################################################
+
+### Parallel run
+# The compiled tax tables and deduction rules are published once into shared memory
+# (tax_calculations/shared_tax_tables.py) and attached by every worker; only the rest of the
+# check context (the raw tables of the scalar reference, the commune names) is sent to the workers.
+
+# Parts of the context the workers take from the shared tables
+SHARED_KEYS = ("tax_tables", "federal_deduction_rules", "cantonal_deduction_rules")
+
+# Context of a worker process, set once by _init_worker (without SHARED_KEYS if the tables are shared)
+_worker_context = None
+
+
+def _init_worker(context, tables_name=None):
+    global _worker_context
+    _worker_context = context
+    if tables_name is not None:
+        stt.init_worker(tables_name)
+
+
+def _check_chunk_in_worker(args):
+    context = _worker_context
+    if "tax_tables" not in context:
+        tables = stt.worker_tax_tables()
+        context = {**context, **{key: tables[key] for key in SHARED_KEYS}}
+    return check_chunk(*args[:3], context, *args[3:])
+
+
+def _check_context(context):
+    """The parts of the app context the check needs (sent to every worker once)."""
+    keys = ("tax_rates_federal", "tax_rates_cantonal", "tax_multiplicators_cantonal_municipal", "communes",
+            "federal_deduction_rules", "cantonal_deduction_rules", "tax_tables")
+    return {key: context[key] for key in keys}
+
+
+def run_check(n_profiles=1_000_000, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, seed=42,
+              tolerance=DEFAULT_TOLERANCE, reference_share=DEFAULT_REFERENCE_SHARE,
+              boundary_share=DEFAULT_BOUNDARY_SHARE, max_failures=DEFAULT_MAX_FAILURES, context=None):
+    """
+    Check all fast paths on n_profiles generated profiles, chunk by chunk in worker processes.
+
+    Parameters:
+        n_profiles (int): number of profiles checked by the fast paths.
+        workers (int or None): worker processes (default: number of CPUs, 0 = in this process).
+        chunk_size (int): profiles per chunk (one task per chunk).
+        seed (int): seed of the profile generation.
+        tolerance (float): largest accepted absolute difference (CHF).
+        reference_share (float): share of the profiles also run through the scalar reference.
+        boundary_share (float): share of boundary-targeted profiles.
+        max_failures (int): failing profiles kept and minimized per comparison.
+        context (dict or None): app context (default: loaders/startup.load_app_context()).
+
+    Returns:
+        dict: "comparisons" (per comparison rows, max_abs_diff, mismatches and minimized
+              "failures"), "profiles", "seconds" and "passed".
+    """
+
+    if context is None:
+        import loaders.startup as startup
+        context = startup.load_app_context()
+    context = _check_context(context)
+    workers = os.cpu_count() if workers is None else workers
+
+    chunks = [
+        (number, min(chunk_size, n_profiles - start), seed, tolerance, reference_share, boundary_share, max_failures)
+        for number, start in enumerate(range(0, n_profiles, chunk_size))
+    ]
+
+    start = time.perf_counter()
+    comparisons = {}
+    if workers:
+        publication = stt.publish_tax_tables(
+            context["tax_tables"], context["federal_deduction_rules"], context["cantonal_deduction_rules"]
+        )
+        worker_context = {key: value for key, value in context.items() if key not in SHARED_KEYS}
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(worker_context, publication["name"])) as pool:
+                for done, summary in enumerate(pool.map(_check_chunk_in_worker, chunks), start=1):
+                    _merge(comparisons, summary)
+                    print(f"chunk {done}/{len(chunks)} checked", end="\r", flush=True)
+        finally:
+            stt.unpublish_tax_tables(publication)
+    else:
+        _init_worker(context)
+        for done, args in enumerate(chunks, start=1):
+            _merge(comparisons, _check_chunk_in_worker(args))
+            print(f"chunk {done}/{len(chunks)} checked", end="\r", flush=True)
+    seconds = time.perf_counter() - start
+    print()
+
+    for comparison, entry in comparisons.items():
+        entry["failures"] = [
+            minimize_failure(comparison, profile, context, tolerance)
+            for profile in entry["failures"][:max_failures]
+        ]
+
+    return {
+        "comparisons": comparisons,
+        "profiles": n_profiles,
+        "seconds": seconds,
+        "passed": all(entry["mismatches"] == 0 for entry in comparisons.values()),
+    }
+
+
+def format_report(result, tolerance=DEFAULT_TOLERANCE):
+    """Build the text report: max abs difference per comparison and component, minimized failures."""
+
+    lines = [
+        f"Checked {result['profiles']:,} profiles in {result['seconds']:.1f} s "
+        f"({result['profiles'] / max(result['seconds'], 1e-9):,.0f} profiles/s), tolerance CHF {tolerance:g}",
+    ]
+    for comparison, entry in result["comparisons"].items():
+        lines += [
+            "",
+            f"### {comparison}: {entry['rows']:,} profiles, {entry['mismatches']:,} above tolerance",
+        ]
+        lines += [f"  {key:40} max abs diff {value:14.6f}" for key, value in entry["max_abs_diff"].items()]
+        for i, failure in enumerate(entry["failures"], start=1):
+            lines.append(f"  minimized failure {i}: {failure['changed']}")
+            lines.append(f"    differences: {failure['differences']}")
+    lines += ["", "Differential check passed." if result["passed"] else "Differential check FAILED."]
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the fast tax engines with the scalar reference.")
+    parser.add_argument("--profiles", type=int, default=1_000_000, help="number of profiles")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPUs, 0: none)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="profiles per chunk")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="accepted difference (CHF)")
+    parser.add_argument("--reference-share", type=float, default=DEFAULT_REFERENCE_SHARE,
+                        help="share of profiles also run through the scalar reference")
+    parser.add_argument("--boundary-share", type=float, default=DEFAULT_BOUNDARY_SHARE,
+                        help="share of boundary-targeted profiles")
+    parser.add_argument("--max-failures", type=int, default=DEFAULT_MAX_FAILURES,
+                        help="failing profiles minimized per comparison")
+    args = parser.parse_args()
+
+    result = run_check(
+        n_profiles=args.profiles,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        seed=args.seed,
+        tolerance=args.tolerance,
+        reference_share=args.reference_share,
+        boundary_share=args.boundary_share,
+        max_failures=args.max_failures,
+    )
+    print(format_report(result, args.tolerance))
+    sys.exit(0 if result["passed"] else 1)
@@ -0,0 +1,424 @@
+# diagnostics/load_test.py
+
+# Import libraries
+import argparse                 # command line options of the load test
+import os                       # app path and environment of the simulated sessions
+import threading                # one thread per simulated session, memory sampler
+import time                     # rerun latency and wall time
+
+import numpy as np              # random profiles and latency percentiles
+
+# Backend modules
+import diagnostics.metrics as metrics
+import diagnostics.memory as memory
+
+
+##################################################################################################
+
+### Concurrent-session load test for the Streamlit app
+# Simulates N advisors working in one server process at the same time. Every session is a
+# Streamlit AppTest of the real tax_calculator.py, driven from its own thread: it fills in the
+# form (one rerun per changed widget, as in the browser), presses "Calculate", and then tries a
+# few what-if changes (1-3 fields, then "Calculate" again). All sessions share the process, its
+# st.cache_resource objects and the GIL, exactly like the sessions of one `streamlit run` server.
+#
+# Per concurrency level the report shows:
+#   - p50 / p95 / p99 / max latency of the "Calculate" reruns and of the input reruns
+#   - throughput (calculations per second), CPU use (cores busy) and peak RSS
+#   - where the rerun time goes, from the metrics registry (diagnostics/metrics.py):
+#       loading       startup loads and the savings model load (cache_resource, first use only)
+#       calculation   the tax stages of the calculation pipeline
+#       ml            the savings predictions (prediction cache + models)
+#       charting      rendering the results: Plotly charts, tables and texts of the calculation
+#       script        everything else: the form, widget state and the Streamlit rerun itself
+#                     (including the input reruns before the calculation)
+# Throughput that stops growing with more sessions means the server is saturated; the phase
+# with the largest share at that point is the code path to optimize first.
+#
+# One unmeasured session runs first, so the levels measure the warm server (its cold start is
+# reported separately). The loading animation (4.5 s of sleep per calculation) is switched off
+# unless --animation is given.
+#
+# Usage (from the tax_calculator_app folder):
+#   python -m diagnostics.load_test [--sessions 1 2 4 8 16] [--calculations 5] [--seed 0] [--report load_test.txt]
+
+# Entry point of the app, relative to the tax_calculator_app folder
+APP_FILE = "tax_calculator.py"
+
+DEFAULT_SESSIONS = [1, 2, 4, 8, 16]
+DEFAULT_CALCULATIONS = 5
+
+PHASES = ("loading", "calculation", "ml", "charting", "script")
+
+# A level is saturated if its throughput is less than this factor above the previous level
+SATURATION_GAIN = 1.10
+
+# Widget labels of the form (see tax_calculator.py)
+MARITAL_STATUS = "What is your marital status?"
+TWO_INCOMES = "Do both spouses earn income?"
+AGE = "Age"
+EMPLOYMENT = "Are you employed or self-employed?"
+COMMUNE = "Municipality / commune"
+CONFESSION = "What is your confession?"
+INCOME = "Gross income 2025 in CHF"
+ASSETS = "Taxable assets in CHF"
+PILLAR_3A = "Pillar 3a contribution in CHF"
+INSURANCE = "Insurance premiums & savings interest in CHF"
+TRAVEL = "Commuting / travel expenses in CHF"
+CHILDREN = "Children?"
+CHILDREN_UNDER_7 = "How many children under 7 years old?"
+CHILDREN_7_AND_OVER = "How many children age 7 and older?"
+
+
+##################################################################################################
+
+
+### Simulated advisor sessions
+
+def random_profile(rng, communes):
+    """
+    Form entries of one client: (widget type, label, value) in the order an advisor fills them in.
+
+    The amounts are drawn on the step grid of the inputs, with shares similar to a client file
+    (most clients single or married without children, standard 3a and insurance amounts).
+    """
+    married = rng.random() < 0.45
+    children_under_7 = int(rng.choice([0, 1, 2], p=[0.75, 0.15, 0.10]))
+    children_7_and_over = int(rng.choice([0, 1, 2], p=[0.70, 0.18, 0.12]))
+    has_children = children_under_7 + children_7_and_over > 0
+
+    entries = [("selectbox", MARITAL_STATUS, "Married" if married else "Single")]
+    if married:
+        entries.append(("checkbox", TWO_INCOMES, bool(rng.random() < 0.5)))
+    entries += [
+        ("slider", AGE, int(rng.integers(25, 66))),
+        ("selectbox", EMPLOYMENT, "Employed" if rng.random() < 0.9 else "Self-employed"),
+        ("selectbox", COMMUNE, str(rng.choice(communes))),
+        ("selectbox", CONFESSION, str(rng.choice(["Roman Catholic", "Protestant", "Other/None"], p=[0.4, 0.25, 0.35]))),
+        ("number_input", INCOME, int(rng.choice(np.arange(40_000, 200_001, 5_000)))),
+        ("number_input", ASSETS, int(rng.choice([0, 50_000, 100_000]))),
+        ("number_input", PILLAR_3A, int(rng.choice([0, 7_258]))),
+        ("number_input", INSURANCE, int(rng.choice([0, 1_700, 3_400]))),
+        ("number_input", TRAVEL, int(rng.choice([0, 1_500, 3_000]))),
+        ("selectbox", CHILDREN, "Yes" if has_children else "No"),
+    ]
+    if has_children:
+        entries += [("number_input", CHILDREN_UNDER_7, children_under_7),
+                    ("number_input", CHILDREN_7_AND_OVER, children_7_and_over)]
+    return entries
+
+
+def what_if_changes(rng, communes):
+    """1-3 changes an advisor tries after a calculation (amounts and commune)."""
+    candidates = [
+        ("number_input", INCOME, int(rng.choice(np.arange(40_000, 200_001, 5_000)))),
+        ("number_input", PILLAR_3A, int(rng.choice([0, 3_000, 7_258]))),
+        ("number_input", INSURANCE, int(rng.choice([0, 1_700, 3_400]))),
+        ("number_input", TRAVEL, int(rng.choice([0, 1_500, 3_000, 5_000]))),
+        ("number_input", ASSETS, int(rng.choice([0, 50_000, 100_000, 250_000]))),
+        ("selectbox", COMMUNE, str(rng.choice(communes))),
+    ]
+    chosen = rng.choice(len(candidates), size=int(rng.integers(1, 4)), replace=False)
+    return [candidates[i] for i in chosen]
+
+
+def _share_server_state():
+    """
+    Let the AppTest sessions share one runtime and one compiled script, like the sessions of a server.
+
+    AppTest is written for one test at a time: every run installs its own (mock) Streamlit runtime
+    as the process-wide instance and removes it again when the run ends, and compiles the script
+    again. With concurrent sessions, one session would remove the runtime while another one is
+    still running, and concurrent compiles are not thread-safe on Python 3.11. A `streamlit run`
+    server has one runtime and one script cache for all sessions; this installs the same here.
+    """
+    from unittest.mock import MagicMock
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    import streamlit.testing.v1.app_test as app_test
+    import streamlit.testing.v1.local_script_runner as local_script_runner
+
+    if getattr(app_test.Runtime, "_load_test_slot", False):
+        return
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = app_test.MediaFileManager(app_test.MemoryMediaFileStorage("/mock/media"))
+    runtime.dataframe_source_mgr = app_test.DataframeSourceManager()
+    runtime.cache_storage_manager = app_test.MemoryCacheStorageManager()
+    components = app_test.BidiComponentManager()
+    components.discover_and_register_components(start_file_watching=False)
+    runtime.bidi_component_registry = components
+    Runtime._instance = runtime
+
+    # AppTest's own runtime (set and reset on every run) goes to a subclass attribute instead
+    app_test.Runtime = type("LoadTestRuntimeSlot", (Runtime,), {"_load_test_slot": True})
+
+    shared_cache = ScriptCache()
+    local_script_runner.ScriptCache = lambda: shared_cache
+
+
+def _find_widget(app, widget_type, label):
+    """Widget of the given type and label, or None if it is not shown (e.g. children inputs)."""
+    return next((w for w in getattr(app, widget_type) if w.label == label), None)
+
+
+def _timed_run(app, kind, latencies):
+    start = time.perf_counter()
+    app.run()
+    latencies.append((kind, time.perf_counter() - start))
+    if app.exception:
+        raise RuntimeError(f"{kind} rerun raised: {app.exception[0].value}")
+
+
+def simulate_session(session_number, n_calculations, seed, stream, latencies, errors):
+    """
+    One advisor: first render, fill in a client profile, calculate, then what-if calculations.
+
+    Parameters:
+        session_number (int): number of the session (part of its random seed).
+        n_calculations (int): "Calculate" clicks of the session.
+        seed (int): seed of the load test.
+        stream (int): number of the concurrency level (every level draws other profiles).
+        latencies (list): (kind, seconds) of every rerun are appended ("first_render", "input", "calculate").
+        errors (list): exceptions of the session are appended.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    rng = np.random.default_rng([seed, stream, session_number])
+    try:
+        app = AppTest.from_file(os.path.abspath(APP_FILE), default_timeout=600)
+        _timed_run(app, "first_render", latencies)
+        communes = _find_widget(app, "selectbox", COMMUNE).options
+
+        for calculation in range(n_calculations):
+            entries = random_profile(rng, communes) if calculation == 0 else what_if_changes(rng, communes)
+            # Every changed widget reruns the script, as in the browser
+            for widget_type, label, value in entries:
+                widget = _find_widget(app, widget_type, label)
+                if widget is None or widget.value == value:
+                    continue
+                widget.set_value(value)
+                _timed_run(app, "input", latencies)
+            app.button[0].click()
+            _timed_run(app, "calculate", latencies)
+    except Exception as e:
+        errors.append(f"session {session_number}: {e}")
+
+
+##################################################################################################
+
+
+### Measurement of one concurrency level
+
+def _sample_memory(stop, peak):
+    """Record the peak RSS (KiB) in peak[0] until stop is set."""
+    while not stop.is_set():
+        peak[0] = max(peak[0], memory.memory_usage_kib()["rss"])
+        stop.wait(0.05)
+
+
+def _histogram_seconds(snapshot, name, **labels):
+    """Sum of a histogram over the series matching the given labels."""
+    return sum(
+        value["sum"] for key, value in snapshot.get(name, {}).items()
+        if all((label, str(wanted)) in key for label, wanted in labels.items())
+    )
+
+
+def _phase_seconds(before, after, rerun_seconds):
+    """Seconds per phase (see module comment) between two metrics snapshots."""
+
+    def delta(name, **labels):
+        return _histogram_seconds(after, name, **labels) - _histogram_seconds(before, name, **labels)
+
+    loading = delta("tax_app_load_seconds", load="total") + delta("tax_app_load_seconds", load="savings_models")
+    stages = delta("tax_app_stage_seconds")
+    ml = delta("tax_app_stage_seconds", stage="ml_savings_predictions")
+    request = delta("tax_app_request_seconds", request="calculation")
+    return {
+        "loading": loading,
+        "calculation": stages - ml,
+        "ml": ml,
+        "charting": max(request - stages, 0.0),
+        "script": max(rerun_seconds - request - loading, 0.0),
+    }
+
+
+def _percentiles(values):
+    if not values:
+        return {"count": 0, "p50": None, "p95": None, "p99": None, "max": None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"count": len(values), "p50": p50, "p95": p95, "p99": p99, "max": max(values)}
+
+
+def run_level(n_sessions, n_calculations, seed, stream=0):
+    """
+    Run n_sessions simulated sessions at the same time (stream: see simulate_session).
+
+    Returns:
+        dict: "sessions", "wall_seconds", "latency" (per rerun kind: count, p50, p95, p99, max
+              in seconds), "calculations_per_second", "cpu_cores" (CPU seconds per wall second),
+              "cpu_seconds_per_calculation", "peak_rss_mib", "phases" (seconds per phase,
+              all sessions) and "errors".
+    """
+
+    latencies, errors = [], []
+    threads = [
+        threading.Thread(target=simulate_session, args=(n, n_calculations, seed, stream, latencies, errors),
+                         name=f"load-test-session-{n}")
+        for n in range(n_sessions)
+    ]
+
+    stop, peak = threading.Event(), [memory.memory_usage_kib()["rss"]]
+    sampler = threading.Thread(target=_sample_memory, args=(stop, peak), daemon=True)
+    sampler.start()
+
+    before = metrics.snapshot()
+    cpu_before = os.times()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    cpu_after = os.times()
+    after = metrics.snapshot()
+
+    stop.set()
+    sampler.join()
+
+    cpu = (cpu_after.user - cpu_before.user) + (cpu_after.system - cpu_before.system)
+    by_kind = {kind: [seconds for k, seconds in latencies if k == kind] for kind in ("first_render", "input", "calculate")}
+    calculations = len(by_kind["calculate"])
+    return {
+        "sessions": n_sessions,
+        "wall_seconds": wall,
+        "latency": {kind: _percentiles(values) for kind, values in by_kind.items()},
+        "calculations_per_second": calculations / wall if wall else 0.0,
+        "cpu_cores": cpu / wall if wall else 0.0,
+        "cpu_seconds_per_calculation": cpu / calculations if calculations else None,
+        "peak_rss_mib": peak[0] / 1024,
+        "phases": _phase_seconds(before, after, sum(seconds for _, seconds in latencies)),
+        "errors": errors,
+    }
+
+
+def run_load_test(sessions=DEFAULT_SESSIONS, n_calculations=DEFAULT_CALCULATIONS, seed=0, animation=False):
+    """
+    Warm the server with one unmeasured session, then measure every concurrency level.
+
+    Parameters:
+        sessions (list of int): numbers of concurrent sessions, in increasing order.
+        n_calculations (int): "Calculate" clicks per session.
+        seed (int): seed of the simulated profiles.
+        animation (bool): keep the loading animation of the app (4.5 s sleep per calculation).
+
+    Returns:
+        dict: "cold_start" (run_level() of the warm-up session), "levels" (one run_level() per
+              concurrency level), "saturated_at" (first level without a throughput gain of
+              SATURATION_GAIN, or None) and "bottleneck" (largest phase at that level, or at
+              the highest level).
+    """
+
+    if not animation:
+        os.environ["TAX_APP_LOADING_ANIMATION"] = "off"
+    # Slow calculations are expected under load; do not fill the slow request log
+    os.environ.setdefault("TAX_APP_SLOW_REQUEST_MS", "0")
+    _share_server_state()
+
+    cold_start = run_level(1, 1, seed)
+    levels = []
+    for stream, n_sessions in enumerate(sessions, start=1):
+        level = run_level(n_sessions, n_calculations, seed, stream)
+        levels.append(level)
+        calculate = level["latency"]["calculate"]
+        print(f"{n_sessions:3d} sessions: {level['calculations_per_second']:6.1f} calculations/s, "
+              f"p95 {calculate['p95'] * 1000 if calculate['count'] else float('nan'):8.1f} ms, "
+              f"CPU {level['cpu_cores']:.2f} cores")
+
+    saturated_at = None
+    for previous, level in zip(levels, levels[1:]):
+        if level["calculations_per_second"] < previous["calculations_per_second"] * SATURATION_GAIN:
+            saturated_at = level
+            break
+    reference = saturated_at or levels[-1]
+    return {
+        "cold_start": cold_start,
+        "levels": levels,
+        "saturated_at": saturated_at["sessions"] if saturated_at else None,
+        "bottleneck": max(PHASES, key=lambda phase: reference["phases"][phase]),
+    }
+
+
+##################################################################################################
+
+
+### Report
+
+def _ms(seconds):
+    return f"{seconds * 1000:8.1f}" if seconds is not None else f"{'-':>8}"
+
+
+def format_report(result):
+    """Text report of run_load_test(): latency, throughput and resources per level, then the phases."""
+
+    cold = result["cold_start"]
+    lines = [
+        f"Cold start (one session, first render + one calculation): first render "
+        f"{_ms(cold['latency']['first_render']['max']).strip()} ms, calculation "
+        f"{_ms(cold['latency']['calculate']['max']).strip()} ms, loading {cold['phases']['loading'] * 1000:.1f} ms",
+        "",
+        "### Latency per rerun (ms), throughput and resources",
+        f"{'sessions':>8} {'calc/s':>7} {'calc p50':>8} {'calc p95':>8} {'calc p99':>8} {'calc max':>8} "
+        f"{'input p50':>9} {'input p95':>9} {'CPU cores':>9} {'CPU ms/calc':>11} {'peak RSS':>9}",
+    ]
+    for level in result["levels"]:
+        calculate, inputs = level["latency"]["calculate"], level["latency"]["input"]
+        cpu_per_calculation = level["cpu_seconds_per_calculation"]
+        lines.append(
+            f"{level['sessions']:>8} {level['calculations_per_second']:>7.1f} "
+            f"{_ms(calculate['p50'])} {_ms(calculate['p95'])} {_ms(calculate['p99'])} {_ms(calculate['max'])} "
+            f"{_ms(inputs['p50']):>9} {_ms(inputs['p95']):>9} {level['cpu_cores']:>9.2f} "
+            f"{_ms(cpu_per_calculation):>11} {level['peak_rss_mib']:>6.0f} MiB"
+        )
+
+    lines += [
+        "",
+        "### Rerun time per calculation by phase (ms; share of all rerun time)",
+        f"{'sessions':>8} " + " ".join(f"{phase:>18}" for phase in PHASES),
+    ]
+    for level in result["levels"]:
+        count = max(level["latency"]["calculate"]["count"], 1)
+        total = sum(level["phases"].values()) or 1.0
+        lines.append(f"{level['sessions']:>8} " + " ".join(
+            f"{level['phases'][phase] / count * 1000:>10.1f} ({level['phases'][phase] / total:>4.0%})" for phase in PHASES
+        ))
+
+    errors = [error for level in result["levels"] for error in level["errors"]]
+    lines.append("")
+    if result["saturated_at"] is not None:
+        lines.append(f"Throughput stops growing at {result['saturated_at']} concurrent sessions; "
+                     f"largest phase there: {result['bottleneck']}.")
+    else:
+        lines.append(f"Throughput still grows at the highest level; largest phase there: {result['bottleneck']}.")
+    if errors:
+        lines += ["", f"### {len(errors)} session(s) failed", *errors]
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the Streamlit app with concurrent simulated sessions.")
+    parser.add_argument("--sessions", type=int, nargs="+", default=DEFAULT_SESSIONS,
+                        help="numbers of concurrent sessions, one level each")
+    parser.add_argument("--calculations", type=int, default=DEFAULT_CALCULATIONS,
+                        help="'Calculate' clicks per session")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the simulated profiles")
+    parser.add_argument("--animation", action="store_true", help="keep the loading animation of the app")
+    parser.add_argument("--report", default=None, help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = format_report(run_load_test(sorted(args.sessions), args.calculations, args.seed, args.animation))
+    print(report)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
@@ -0,0 +1,30 @@
+# diagnostics/memory.py
+
+# Import libraries
+import resource                 # peak memory (max RSS) if /proc is not available
+import sys                      # platform check for the max RSS unit
+
+
+##################################################################################################
+
+### Process memory
+# Used by the memory reports of the shared tax tables (tax_calculations/shared_tax_tables.py)
+# and by the load test (diagnostics/load_test.py).
+
+
+def memory_usage_kib():
+    """Current memory of this process in KiB: "rss", "rss_anon" (private) and "rss_shmem" (shared).
+
+    Read from /proc/self/status; elsewhere only the peak RSS is known ("rss", others None).
+    """
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return {
+            "rss": int(fields["VmRSS"].split()[0]),
+            "rss_anon": int(fields["RssAnon"].split()[0]),
+            "rss_shmem": int(fields["RssShmem"].split()[0]),
+        }
+    except (OSError, KeyError):
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {"rss": max_rss // 1024 if sys.platform == "darwin" else max_rss, "rss_anon": None, "rss_shmem": None}
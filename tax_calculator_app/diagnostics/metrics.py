@@ -0,0 +1,426 @@
+# diagnostics/metrics.py
+
+# Import libraries
+import json                     # one JSON line per slow request
+import math                     # +Inf bucket of the histograms
+import os                       # reads the exporter configuration from environment variables
+import threading                # one registry is shared by all sessions and exporter threads
+import time                     # latency measurement and export interval
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer   # local /metrics endpoint
+
+# Backend modules
+import loaders.paths as paths   # default folder of the slow request log (tax_calculator_app/logs)
+
+
+##################################################################################################
+
+### In-process metrics registry
+# Counters and latency histograms for the running app (and batch jobs), kept in one dictionary
+# per process. Updating a metric is a dictionary lookup under a lock, so the calls can stay in
+# the production code paths. The registry is exposed in the Prometheus text format, either on
+# a local HTTP port (GET /metrics, GET /ready for readiness probes) or written to a file at a fixed interval (e.g. for the node
+# exporter's textfile collector).
+#
+# Metrics (all names start with tax_app_):
+#   stage_runs_total{stage,result}          pipeline stage reused ("hit") or recomputed ("miss")
+#   stage_seconds{stage}                    time of a recomputed pipeline stage
+#   load_seconds{load}                      startup loads (loaders/startup.py), plus "total", and
+#                                           the savings models ("savings_models", first calculation)
+#   stada2_fetch_total{outcome}             multipliers from the API ("api") or the CSV because
+#                                           of a mismatch ("csv_mismatch") or an API error ("csv_api_error")
+#   prediction_cache_lookups_total{result}  prediction cache "hit", "miss", "bypass" or "warmup"
+#                                           (hit rate = hit / (hit + miss), warm-up excluded)
+#   model_inference_seconds{model}          one predict() call of a savings model
+#   request_seconds{request}                whole calculation of one app rerun
+#   slow_requests_total{request}            requests above the slow request threshold
+#   ready                                   1 once the warm-up has finished (loaders/warmup.py), else 0
+#
+# Configuration (environment variables, read by start_exporters_from_env()):
+#   TAX_APP_METRICS_PORT            serve http://127.0.0.1:<port>/metrics (empty = off)
+#   TAX_APP_METRICS_FILE            write the metrics to this file (empty = off)
+#   TAX_APP_METRICS_INTERVAL        seconds between two file writes (default: 15)
+#   TAX_APP_SLOW_REQUEST_MS         latency above which a request is logged (default: 2000, 0 = off)
+#   TAX_APP_SLOW_REQUEST_LOG        slow request log, one JSON line per request
+#                                   (default: tax_calculator_app/logs/slow_requests.jsonl)
+
+# Upper bounds (seconds) of the latency histograms; one more bucket (+Inf) holds everything above
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Name -> (type, help text) of the metrics listed above
+METRICS = {
+    "tax_app_stage_runs_total": ("counter", "Calculation pipeline stages reused (hit) or recomputed (miss)."),
+    "tax_app_stage_seconds": ("histogram", "Duration of a recomputed calculation pipeline stage."),
+    "tax_app_load_seconds": ("histogram", "Duration of the startup loads and of the savings model load."),
+    "tax_app_stada2_fetch_total": ("counter", "Source of the communal multipliers (STADA2 API or CSV fallback)."),
+    "tax_app_prediction_cache_lookups_total": ("counter", "Prediction cache lookups by result."),
+    "tax_app_model_inference_seconds": ("histogram", "Duration of one savings model prediction."),
+    "tax_app_request_seconds": ("histogram", "Duration of one calculation request."),
+    "tax_app_slow_requests_total": ("counter", "Requests above the slow request threshold."),
+    "tax_app_ready": ("gauge", "1 once the warm-up has finished, else 0."),
+}
+
+# Registry: name -> {labels (tuple of (name, value) pairs) -> value}; a counter or gauge value
+# is a number, a histogram value a dict with per-bucket counts, "sum" and "count"
+_registry = {}
+_registry_lock = threading.Lock()
+
+# Exporters started in this process ("http": server, "file": thread), started only once
+_exporters = {}
+_exporters_lock = threading.Lock()
+
+
+def _labels_key(labels):
+    """Hashable, sorted form of a label dictionary."""
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def increment(name, amount=1, **labels):
+    """
+    Add to a counter.
+
+    Parameters:
+        name (str): metric name (see METRICS).
+        amount (float): value added to the counter.
+        **labels: label values of the series, e.g. result="hit".
+    """
+    key = _labels_key(labels)
+    with _registry_lock:
+        series = _registry.setdefault(name, {})
+        series[key] = series.get(key, 0) + amount
+
+
+def set_gauge(name, value, **labels):
+    """
+    Set a gauge to a value.
+
+    Parameters:
+        name (str): metric name (see METRICS).
+        value (float): new value of the gauge.
+        **labels: label values of the series.
+    """
+    key = _labels_key(labels)
+    with _registry_lock:
+        _registry.setdefault(name, {})[key] = value
+
+
+def get_value(name, **labels):
+    """Current value of a counter or gauge (None if it was never set)."""
+    with _registry_lock:
+        return _registry.get(name, {}).get(_labels_key(labels))
+
+
+def observe(name, value, **labels):
+    """
+    Record one value (seconds) in a latency histogram.
+
+    Parameters:
+        name (str): metric name (see METRICS).
+        value (float): observed duration in seconds.
+        **labels: label values of the series, e.g. stage="federal_tax".
+    """
+    key = _labels_key(labels)
+    with _registry_lock:
+        series = _registry.setdefault(name, {})
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = {"buckets": [0] * (len(LATENCY_BUCKETS) + 1), "sum": 0.0, "count": 0}
+        # Counts per bucket (not cumulative); the first bound the value fits into
+        index = next((i for i, bound in enumerate(LATENCY_BUCKETS) if value <= bound), len(LATENCY_BUCKETS))
+        histogram["buckets"][index] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+
+@contextmanager
+def timed(name, **labels):
+    """
+    Context manager that records the duration of the enclosed block in a histogram.
+
+    Example:
+        with timed("tax_app_model_inference_seconds", model="delta_3a"):
+            model.predict(df_features)
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def snapshot():
+    """Copy of the registry: name -> {labels tuple -> counter value or histogram dict}."""
+    with _registry_lock:
+        return {
+            name: {key: dict(value, buckets=list(value["buckets"])) if isinstance(value, dict) else value
+                   for key, value in series.items()}
+            for name, series in _registry.items()
+        }
+
+
+def reset_metrics():
+    """Remove all recorded values (e.g. between two benchmark runs)."""
+    with _registry_lock:
+        _registry.clear()
+
+
+##################################################################################################
+
+
+### Prometheus text format
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus():
+    """
+    Return all metrics in the Prometheus text exposition format (version 0.0.4).
+
+    Returns:
+        str: HELP and TYPE lines and one line per series (histograms: cumulative _bucket
+             lines with the le label, _sum and _count).
+    """
+    lines = []
+    for name, series in sorted(snapshot().items()):
+        kind, help_text = METRICS.get(name, ("counter", ""))
+        if help_text:
+            lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for key, value in sorted(series.items()):
+            if kind != "histogram":
+                lines.append(f"{name}{_format_labels(key)} {_format_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + (math.inf,), value["buckets"]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(key, [('le', _format_number(bound))])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(key)} {_format_number(value['sum'])}")
+            lines.append(f"{name}_count{_format_labels(key)} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics_file(path):
+    """Write the metrics to a file; replaced atomically, so a reader never sees a partial file."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        f.write(render_prometheus())
+    os.replace(temporary, path)
+
+
+##################################################################################################
+
+
+### Exporters
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """Answers GET /metrics with the registry, GET /ready with 200 once the warm-up has
+    finished (503 before), everything else with 404."""
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/ready":
+            ready = get_value("tax_app_ready") == 1
+            self._send(200 if ready else 503, b"ready\n" if ready else b"warming up\n", "text/plain; charset=utf-8")
+        elif path in ("/metrics", "/"):
+            self._send(200, render_prometheus().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+        else:
+            self.send_error(404)
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # No access log on stderr for every scrape
+        pass
+
+
+def start_http_exporter(port, host="127.0.0.1"):
+    """
+    Serve the metrics on http://<host>:<port>/metrics from a daemon thread (once per process).
+
+    Returns:
+        ThreadingHTTPServer: the running server (server.server_address holds the bound port,
+        useful with port 0).
+    """
+    with _exporters_lock:
+        if "http" not in _exporters:
+            server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+            _exporters["http"] = server
+        return _exporters["http"]
+
+
+def start_file_exporter(path, interval=15.0):
+    """
+    Write the metrics to a file every `interval` seconds from a daemon thread (once per process).
+
+    Returns:
+        threading.Thread: the writer thread.
+    """
+
+    def write_periodically():
+        while True:
+            try:
+                write_metrics_file(path)
+            except OSError as e:
+                print(f"Writing metrics to {path} failed ({e})")
+            time.sleep(interval)
+
+    with _exporters_lock:
+        if "file" not in _exporters:
+            thread = threading.Thread(target=write_periodically, name="metrics-file", daemon=True)
+            thread.start()
+            _exporters["file"] = thread
+        return _exporters["file"]
+
+
+def start_exporters_from_env():
+    """
+    Start the exporters configured through TAX_APP_METRICS_PORT and TAX_APP_METRICS_FILE.
+
+    Returns:
+        dict: the started exporters ("http" and/or "file"); empty if none is configured.
+    """
+    started = {}
+    port = os.environ.get("TAX_APP_METRICS_PORT", "").strip()
+    if port:
+        try:
+            started["http"] = start_http_exporter(int(port))
+        except OSError as e:
+            # e.g. a second server process on the same port: the app keeps running without it
+            print(f"Metrics endpoint on port {port} not started ({e})")
+    path = os.environ.get("TAX_APP_METRICS_FILE", "").strip()
+    if path:
+        started["file"] = start_file_exporter(path, float(os.environ.get("TAX_APP_METRICS_INTERVAL", "15")))
+    return started
+
+
+##################################################################################################
+
+
+### Slow request log
+# Requests above the threshold are appended to the log with their inputs, so slow profiles can
+# be reproduced. The inputs are sanitized first: only known profile fields are kept, CHF amounts
+# are rounded to two significant digits and the age to its decade, so no exact personal
+# figures end up in the log.
+
+# Profile fields written to the log; all other inputs are dropped
+_LOGGED_AMOUNTS = (
+    "income_gross", "contribution_pillar_3a", "total_insurance_expenses", "travel_expenses_main_income",
+    "child_care_expenses_third_party", "taxable_assets", "child_education_expenses",
+)
+_LOGGED_FIELDS = (
+    "employed", "marital_status", "is_two_income_couple", "number_of_children",
+    "number_of_children_under_7", "number_of_children_7_and_over", "commune", "church_affiliation",
+    "exact_ml_estimates",
+)
+
+_slow_log_lock = threading.Lock()
+
+
+def _round_amount(value):
+    """Round a CHF amount to two significant digits (e.g. 87'350 -> 87'000)."""
+    value = float(value)
+    if value == 0 or not math.isfinite(value):
+        return value
+    return round(value, 1 - int(math.floor(math.log10(abs(value)))))
+
+
+def sanitize_inputs(inputs):
+    """
+    Coarse copy of a profile for the slow request log.
+
+    Parameters:
+        inputs (dict): calculation inputs (profile fields, see tax_calculator.py).
+
+    Returns:
+        dict: CHF amounts rounded to two significant digits, "age_band" (e.g. "30-39"),
+              the categorical fields and counts unchanged; every other key is dropped.
+    """
+    sanitized = {}
+    for field in _LOGGED_AMOUNTS:
+        if inputs.get(field) is not None:
+            sanitized[field] = _round_amount(inputs[field])
+    if inputs.get("age") is not None:
+        decade = int(inputs["age"]) // 10 * 10
+        sanitized["age_band"] = f"{decade}-{decade + 9}"
+    for field in _LOGGED_FIELDS:
+        if field in inputs:
+            value = inputs[field]
+            sanitized[field] = value if isinstance(value, (bool, str, type(None))) else int(value)
+    return sanitized
+
+
+def slow_request_threshold():
+    """Slow request threshold in seconds (TAX_APP_SLOW_REQUEST_MS; None if disabled)."""
+    milliseconds = float(os.environ.get("TAX_APP_SLOW_REQUEST_MS", "2000"))
+    return milliseconds / 1000 if milliseconds > 0 else None
+
+
+def record_request(request, seconds, inputs=None, details=None):
+    """
+    Record the latency of one request and log it if it is above the slow request threshold.
+
+    Parameters:
+        request (str): request type, e.g. "calculation".
+        seconds (float): latency of the request.
+        inputs (dict or None): calculation inputs, logged sanitized (see sanitize_inputs).
+        details (dict or None): extra values for the log, e.g. the stages that were recomputed.
+
+    Returns:
+        bool: True if the request was logged as slow.
+    """
+    observe("tax_app_request_seconds", seconds, request=request)
+
+    threshold = slow_request_threshold()
+    if threshold is None or seconds < threshold:
+        return False
+    increment("tax_app_slow_requests_total", request=request)
+
+    entry = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "request": request,
+        "milliseconds": round(seconds * 1000, 1),
+        "inputs": sanitize_inputs(inputs or {}),
+        **({"details": details} if details else {}),
+    }
+    path = os.environ.get("TAX_APP_SLOW_REQUEST_LOG") or os.path.join(paths.LOG_DIR, "slow_requests.jsonl")
+    try:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with _slow_log_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, default=str) + "\n")
+    except OSError as e:
+        print(f"Writing the slow request log {path} failed ({e})")
+    return True
+
+
+if __name__ == "__main__":
+    # Usage (from the tax_calculator_app folder): python -m diagnostics.metrics
+    # Loads the app context once and prints the resulting metrics (startup loads, STADA2 outcome)
+    import loaders.startup as startup
+    startup.load_app_context()
+    print(render_prometheus(), end="")
@@ -0,0 +1,318 @@
+# diagnostics/profiling.py
+
+# Import libraries
+import cProfile                 # collects per-function call counts and cumulative times
+import io                       # in-memory buffer for the pstats text summary
+import os                       # reads environment variables and builds output paths
+import pstats                   # sorts and prints the cProfile statistics
+import random                   # decides which runs are sampled
+import sys                      # command line arguments for the CLI switch
+import threading                # protects the shared session state
+import time                     # timestamps and wall clock duration of a run
+import tracemalloc              # tracks memory allocations per call site
+from contextlib import contextmanager
+
+# Backend modules
+import loaders.paths as paths   # default output folder (tax_calculator_app/profiles)
+
+
+##################################################################################################
+
+
+### Profiling configuration
+# Profiling is switched on through environment variables, so it can stay deployed in production:
+#   TAX_APP_PROFILE              "cprofile", "tracemalloc", "cprofile,tracemalloc" or "all" (empty = off)
+#   TAX_APP_PROFILE_DIR          directory for the dumps and summaries (default: tax_calculator_app/profiles)
+#   TAX_APP_PROFILE_SAMPLE_RATE  share of runs that are profiled, between 0 and 1 (default: 1.0)
+#   TAX_APP_PROFILE_TOP_N        number of hotspots listed in the summary (default: 25)
+
+PROFILE_MODES = ("cprofile", "tracemalloc")
+
+# Configuration is read once on first use; configure_profiling() can override it
+_config = None
+
+# Open sessions, used to clean up runs that were interrupted before stop_profiling() (e.g. Streamlit reruns)
+_open_sessions = []
+_sessions_lock = threading.Lock()
+
+
+def configure_profiling(modes=None, output_dir=None, sample_rate=None, top_n=None):
+    """
+    Set the profiling configuration, falling back to the environment variables
+    for every argument that is not given.
+
+    Parameters:
+        modes (str or iterable or None): "cprofile", "tracemalloc", "all" or a
+            comma separated combination. Empty disables profiling.
+        output_dir (str or None): directory where profile dumps and summaries are written.
+        sample_rate (float or None): probability that a single run is profiled.
+        top_n (int or None): number of hotspots listed in the summary.
+
+    Returns:
+        dict: the active profiling configuration.
+    """
+    global _config
+
+    # Read the requested modes from the arguments or the environment
+    if modes is None:
+        modes = os.environ.get("TAX_APP_PROFILE", "")
+    if isinstance(modes, str):
+        modes = [m.strip().lower() for m in modes.split(",") if m.strip()]
+    modes = list(modes)
+
+    # "all" / "1" / "true" switch on every mode, unknown names are rejected
+    if any(m in ("all", "1", "true", "yes") for m in modes):
+        modes = list(PROFILE_MODES)
+    unknown = [m for m in modes if m not in PROFILE_MODES]
+    if unknown:
+        raise ValueError(f"Unknown profiling mode(s): {unknown}. Use one of {PROFILE_MODES}.")
+
+    if output_dir is None:
+        output_dir = os.environ.get("TAX_APP_PROFILE_DIR") or paths.PROFILE_DIR
+    if sample_rate is None:
+        sample_rate = float(os.environ.get("TAX_APP_PROFILE_SAMPLE_RATE", "1.0"))
+    if top_n is None:
+        top_n = int(os.environ.get("TAX_APP_PROFILE_TOP_N", "25"))
+
+    _config = {
+        "modes": tuple(m for m in PROFILE_MODES if m in modes),
+        "output_dir": output_dir,
+        "sample_rate": min(max(sample_rate, 0.0), 1.0),
+        "top_n": top_n,
+    }
+    return _config
+
+
+def get_profiling_config():
+    """Return the active profiling configuration (read from the environment on first use)."""
+    if _config is None:
+        return configure_profiling()
+    return _config
+
+
+##################################################################################################
+
+
+### Start and stop a profiled run
+
+def _close_stale_sessions():
+    """
+    Discard sessions that were started but never stopped, e.g. because a
+    Streamlit rerun interrupted the script. A session is stale if the thread
+    that opened it has finished or is the thread that is starting a new run.
+    """
+    current = threading.current_thread()
+    with _sessions_lock:
+        stale = [
+            s for s in _open_sessions
+            if s["thread"] is current or not s["thread"].is_alive()
+        ]
+    for session in stale:
+        _finish_session(session)
+
+
+def start_profiling(run_name):
+    """
+    Start profiling a run if profiling is enabled and the run is sampled.
+
+    When profiling is disabled this only reads the cached configuration, so it
+    can stay in production code paths.
+
+    Parameters:
+        run_name (str): label used in the output file names (e.g. "streamlit_rerun").
+
+    Returns:
+        dict or None: the open profiling session, or None if the run is not profiled.
+    """
+    config = get_profiling_config()
+
+    # Disabled or not sampled -> nothing to do
+    if not config["modes"]:
+        return None
+    if config["sample_rate"] < 1.0 and random.random() >= config["sample_rate"]:
+        return None
+
+    _close_stale_sessions()
+
+    session = {
+        "run_name": run_name,
+        "thread": threading.current_thread(),
+        "started_at": time.time(),
+        "start_perf": time.perf_counter(),
+        "profiler": None,
+        "owns_tracemalloc": False,
+    }
+
+    # tracemalloc is process-wide: only the session that switched it on switches it off again
+    if "tracemalloc" in config["modes"]:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            session["owns_tracemalloc"] = True
+        tracemalloc.reset_peak()
+
+    # Only one cProfile profiler can be active at a time on newer Python versions
+    if "cprofile" in config["modes"]:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            session["profiler"] = profiler
+        except ValueError:
+            session["profiler"] = None
+
+    with _sessions_lock:
+        _open_sessions.append(session)
+
+    return session
+
+
+def _finish_session(session):
+    """Stop the profilers of a session without writing any output."""
+    with _sessions_lock:
+        if session not in _open_sessions:
+            return False
+        _open_sessions.remove(session)
+
+    if session["profiler"] is not None:
+        session["profiler"].disable()
+    if session["owns_tracemalloc"]:
+        tracemalloc.stop()
+    return True
+
+
+def stop_profiling(session):
+    """
+    Stop a profiling session and write its outputs to the configured directory:
+      - <run>_<timestamp>_<pid>.prof : cProfile dump (open with pstats or snakeviz)
+      - <run>_<timestamp>_<pid>.txt  : top-N hotspots by cumulative time and
+                                       top-N allocation sites (size, count, size per block)
+
+    Parameters:
+        session (dict or None): session returned by start_profiling().
+
+    Returns:
+        dict or None: paths of the written files, or None if nothing was profiled.
+    """
+    # Not profiled, or already discarded as stale
+    if session is None or session not in _open_sessions:
+        return None
+
+    # Take the memory snapshot before the profiler is switched off
+    snapshot = None
+    peak_memory = None
+    if tracemalloc.is_tracing():
+        snapshot = tracemalloc.take_snapshot()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+
+    if not _finish_session(session):
+        return None
+
+    duration = time.perf_counter() - session["start_perf"]
+    config = get_profiling_config()
+
+    # Build output file names
+    os.makedirs(config["output_dir"], exist_ok=True)
+    timestamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(session["started_at"]))
+    base_name = f"{session['run_name']}_{timestamp}_{os.getpid()}_{threading.get_ident()}"
+    base_path = os.path.join(config["output_dir"], base_name)
+
+    outputs = {}
+    lines = [
+        f"Run: {session['run_name']}",
+        f"Started: {timestamp}",
+        f"Wall time: {duration:.3f} s",
+    ]
+
+    # cProfile dump + cumulative time hotspots
+    if session["profiler"] is not None:
+        outputs["prof"] = base_path + ".prof"
+        session["profiler"].dump_stats(outputs["prof"])
+
+        buffer = io.StringIO()
+        stats = pstats.Stats(session["profiler"], stream=buffer)
+        stats.sort_stats("cumulative").print_stats(config["top_n"])
+        lines += ["", f"### Top {config['top_n']} functions by cumulative time", buffer.getvalue()]
+
+    # tracemalloc allocations per call site
+    if snapshot is not None:
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ])
+        lines += ["", f"### Top {config['top_n']} allocation sites (peak traced memory: {peak_memory / 1024:,.1f} KiB)"]
+        for stat in snapshot.statistics("lineno")[: config["top_n"]]:
+            frame = stat.traceback[0]
+            lines.append(
+                f"{frame.filename}:{frame.lineno}: "
+                f"size={stat.size / 1024:,.1f} KiB, count={stat.count}, "
+                f"per block={stat.size / max(stat.count, 1):,.0f} B"
+            )
+
+    outputs["summary"] = base_path + ".txt"
+    with open(outputs["summary"], "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+    return outputs
+
+
+@contextmanager
+def profiled(run_name):
+    """
+    Context manager that profiles the enclosed block (if enabled and sampled).
+
+    Example:
+        with profiled("generate_savings_dataset"):
+            main()
+    """
+    session = start_profiling(run_name)
+    try:
+        yield session
+    finally:
+        stop_profiling(session)
+
+
+##################################################################################################
+
+
+### CLI switch
+# Profiles the main() function of a module, independent of the environment variables:
+#   python -m diagnostics.profiling analysis.generate_savings_dataset [modes] [output_dir] [top_n]
+# Every run started from the command line is profiled (sample rate 1).
+
+def run_module_main(module_name, modes="all", output_dir=None, top_n=None):
+    """
+    Import a module and run its main() function under the profiler.
+
+    Parameters:
+        module_name (str): dotted module name, e.g. "analysis.training_savings_models".
+        modes (str): profiling modes, see configure_profiling().
+        output_dir (str or None): output directory for dumps and summaries.
+        top_n (int or None): number of hotspots listed in the summary.
+
+    Returns:
+        dict or None: paths of the written profile files.
+    """
+    import importlib
+
+    configure_profiling(modes=modes, output_dir=output_dir, sample_rate=1.0, top_n=top_n)
+    module = importlib.import_module(module_name)
+
+    session = start_profiling(module_name.rsplit(".", 1)[-1])
+    try:
+        module.main()
+    finally:
+        outputs = stop_profiling(session)
+    return outputs
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m diagnostics.profiling <module> [modes] [output_dir] [top_n]")
+        sys.exit(1)
+
+    written = run_module_main(
+        sys.argv[1],
+        modes=sys.argv[2] if len(sys.argv) > 2 else "all",
+        output_dir=sys.argv[3] if len(sys.argv) > 3 else None,
+        top_n=int(sys.argv[4]) if len(sys.argv) > 4 else None,
+    )
+    print(f"Profile written to: {written}")
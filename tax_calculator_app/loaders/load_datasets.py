@@ -2,11 +2,38 @@
 
 # Import libraries
 import pandas as pd
-import requests 
-from io import StringIO
-import urllib3
-import zipfile
-import io
+# requests, zipfile and io are only needed for the STADA2 API and are imported in
+# load_municipal_multipliers_api(), so the app does not pay for them at startup
+
+# Backend modules
+import diagnostics.metrics as metrics   # STADA2 outcome (API or CSV fallback)
+import loaders.paths as paths           # data files relative to the package, not the working directory
+
+### Helpers for the ESTV exports
+# The ESTV exports start with a few title rows, followed by the header row and the data.
+# They are several hundred columns wide, but only the first few columns contain data,
+# so the loaders read only the columns they need, with declared dtypes.
+
+# Thousands separators used in the ESTV exports (apostrophe and typographic apostrophe)
+THOUSANDS_SEPARATORS = r"['’]"
+
+
+def _find_header_row(path, first_column="Canton ID"):
+    """
+    Return the line number of the header row, i.e. the first line starting with first_column.
+    Only the title rows above the header are read.
+    """
+    with open(path, encoding="utf-8-sig") as f:
+        for line_number, line in enumerate(f):
+            if line.startswith(first_column):
+                return line_number
+    raise ValueError(f"No header row starting with '{first_column}' found in {path}")
+
+
+def _to_number(column):
+    """Convert a text column with thousands separators (' or ’) to float."""
+    return column.str.replace(THOUSANDS_SEPARATORS, "", regex=True).astype(float)
+
 
 ### Import datasets as csv
 # Federal income tax 
@@ -16,19 +43,33 @@ def load_federal_tax_rates():
     Load and clean the federal income tax rate dataset.
 
     This function:
-      - imports the raw ESTV federal tax CSV,
-      - applies the correct header row,
+      - locates the header row of the raw ESTV federal tax CSV,
+      - reads only the needed columns (text columns as categoricals),
       - cleans and standardizes column names,
       - splits marital status / children information,
-      - converts numeric fields,
-      - drops irrelevant metadata columns.
+      - converts numeric fields (thousands separators removed).
 
     Returns:
         pd.DataFrame: cleaned federal tax rate table.
     """
-    tax_rates_federal = pd.read_csv('data/2025_estv_tax_rates_confederation.csv', sep=',', skiprows=4) # Imports the set and skips the first rows (empty)
-
-    tax_rates_federal.columns = tax_rates_federal.iloc[0] # Selecting row that will hold column titles
+    path = paths.data_path('2025_estv_tax_rates_confederation.csv')
+
+    # Read only the relevant columns; numbers as text first because of the thousands separators
+    tax_rates_federal = pd.read_csv(
+        path,
+        sep=',',
+        skiprows=_find_header_row(path),
+        usecols=["Type of tax", "Taxable entity", "Tax authority",
+                 "Taxable income for federal tax", "Additional %", "Base amount CHF"],
+        dtype={
+            "Type of tax": "category",
+            "Taxable entity": "category",
+            "Tax authority": "category",
+            "Taxable income for federal tax": str,
+            "Additional %": str,
+            "Base amount CHF": str,
+        },
+    )
     tax_rates_federal = tax_rates_federal.rename(columns={
         "Type of tax": "tax_type",
         "Taxable entity": "taxable_entity",
@@ -38,26 +79,21 @@ def load_federal_tax_rates():
         "Base amount CHF": "base_amount_CHF"
     }) # Renaming column titles
 
-    tax_rates_federal = tax_rates_federal[1:]                                       # Delete old titles
-    tax_rates_federal = tax_rates_federal.loc[:, tax_rates_federal.columns.notna()] # Delete empty columns
-    tax_rates_federal = tax_rates_federal.drop(columns=["Canton ID", "Canton"])     # Delete irrelevant columns
-    tax_rates_federal["net_income"] = tax_rates_federal["net_income"].str.replace("'", "").astype(float)            # Deleting "'" in the net income column and converting to float 
-    tax_rates_federal["base_amount_CHF"] = tax_rates_federal["base_amount_CHF"].str.replace("'", "").astype(float)  # Deleting "'" in the base_amount_CHF column and converting to float 
-    split_taxable_entity = tax_rates_federal["taxable_entity"].str.split(",", expand=True)
+    # Convert numeric columns to float (deleting "'" and "’")
+    for col in ["net_income", "additional_%", "base_amount_CHF"]:
+        tax_rates_federal[col] = _to_number(tax_rates_federal[col])
 
-    # Splitting up taxable_entity column into two columns "marital status" and "childern"
-    column_index = tax_rates_federal.columns.get_loc("taxable_entity")
-    for i, col in enumerate(split_taxable_entity.columns):
-        tax_rates_federal.insert(column_index + i, col, split_taxable_entity[col])
-    tax_rates_federal.rename(columns={0: "marital_status", 1: "children"}, inplace=True)
+    # Splitting up taxable_entity ("Single, no children") into "marital_status" and "children".
+    # Done on the categories only, so the string operations run once per distinct value.
+    entities = tax_rates_federal["taxable_entity"].cat.categories.to_series()
+    split_taxable_entity = entities.str.split(",", n=1, expand=True)
+    marital_status = split_taxable_entity[0].str.strip().str.lower()
+    children = split_taxable_entity[1].str.strip().str.replace("no children", "no").str.replace("with children", "yes")
 
+    tax_rates_federal.insert(1, "marital_status", tax_rates_federal["taxable_entity"].map(marital_status).astype("category"))
+    tax_rates_federal.insert(2, "children", tax_rates_federal["taxable_entity"].map(children).astype("category"))
     tax_rates_federal = tax_rates_federal.drop(columns=["taxable_entity"]) # Drop old taxable entity column 
 
-    tax_rates_federal["children"] = tax_rates_federal["children"].str.replace("no children", "no").str.replace("with children", "yes") # Renaming child column values to yes / no 
-    tax_rates_federal["marital_status"] = tax_rates_federal["marital_status"].str.lower()
-
-    tax_rates_federal.iloc[:, 4:] = tax_rates_federal.iloc[:, 4:].astype(float) # Convert columns to float 
-
     return tax_rates_federal
 
 
@@ -68,21 +104,31 @@ def load_cantonal_base_tax_rates():
     Load and clean the St. Gallen cantonal base income tax rate dataset.
 
     Steps:
-      - import the raw ESTV CSV,
-      - strip metadata rows,
+      - locate the header row of the raw ESTV CSV,
+      - read only the needed columns (text columns as categoricals),
       - standardize column names,
-      - convert numeric values,
-      - drop unused metadata columns.
+      - convert numeric values (thousands separators removed).
 
     Returns:
         pd.DataFrame: cleaned cantonal income tax table.
     '''
-        
-    tax_rates_cantonal = pd.read_csv('data/2025_estv_tax_rates_sg.csv', sep=',', skiprows=4) # Imports the set and skips the first rows (empty)
-
-    tax_rates_cantonal.columns = tax_rates_cantonal.iloc[0] # Selecting row that will hold column titles
-    tax_rates_cantonal = tax_rates_cantonal[1:]             # Delete old titles
-    tax_rates_cantonal = tax_rates_cantonal.loc[:, tax_rates_cantonal.columns.notna()]  # Drop NaN columns
+    path = paths.data_path('2025_estv_tax_rates_sg.csv')
+
+    # Read only the relevant columns; numbers as text first because of the thousands separators
+    tax_rates_cantonal = pd.read_csv(
+        path,
+        sep=',',
+        skiprows=_find_header_row(path),
+        usecols=["Canton", "Type of tax", "Taxable entity", "Tax authority", "For the next CHF", "Additional %"],
+        dtype={
+            "Canton": "category",
+            "Type of tax": "category",
+            "Taxable entity": "category",
+            "Tax authority": "category",
+            "For the next CHF": str,
+            "Additional %": str,
+        },
+    )
     tax_rates_cantonal = tax_rates_cantonal.rename(columns={                            
         "Type of tax": "tax_type",
         "Taxable entity": "taxable_entity",
@@ -91,10 +137,9 @@ def load_cantonal_base_tax_rates():
         "Additional %": "additional_%"
     }) # Renaming column titles
 
-    tax_rates_cantonal = tax_rates_cantonal.drop(columns=["Canton ID"]) # Delete irrelevant columns
-    tax_rates_cantonal["for_the_next_amount_CHF"] = tax_rates_cantonal["for_the_next_amount_CHF"].str.replace("'", "") # Deleting "'" in the for_the_next_amount_CHF column and converting to float 
-
-    tax_rates_cantonal.iloc[:, 4:] = tax_rates_cantonal.iloc[:, 4:].astype(float) # Converting numeric columns to float 
+    # Convert numeric columns to float (deleting "'" and "’")
+    for col in ["for_the_next_amount_CHF", "additional_%"]:
+        tax_rates_cantonal[col] = _to_number(tax_rates_cantonal[col])
 
     # Returns clean dataset 
     return tax_rates_cantonal
@@ -118,6 +163,11 @@ def load_municipal_multipliers_api():
         pd.DataFrame: municipal income tax multipliers for St. Gallen communes.
     """
 
+    # Network and ZIP handling are only imported when the API is actually called
+    import requests
+    import zipfile
+    import io
+
     # Defining download URL
     url = (
         "https://stada2.sg.ch/webapp/gpsg/GPSG"
@@ -190,28 +240,33 @@ def load_cantonal_municipal_church_multipliers():
     Load and clean the combined canton/commune/church tax multiplier table.
 
     Includes:
-      - extracting correct header row,
-      - removing metadata columns,
-      - normalizing header names,
+      - locating the header row,
+      - reading only the income tax multiplier columns,
+      - naming the columns,
       - converting multiplier fields to numeric.
 
     Returns:
         pd.DataFrame: cleaned tax multiplier dataset.
     """
-    tax_multiplicators_cantonal_municipal = pd.read_csv('data/2025_estv_tax_multipliers_sg.csv', sep=',', header=None) # Importing dataset.not selecting header row yet as there are duplicates in column titles
-    header_row = tax_multiplicators_cantonal_municipal.iloc[3] # Select future header row and save it seperately
-    tax_multiplicators_cantonal_municipal = tax_multiplicators_cantonal_municipal.iloc[4:]  # Remove header & first rows from set
-    tax_multiplicators_cantonal_municipal.columns = header_row # Properly assign header 
-    tax_multiplicators_cantonal_municipal.columns.values[4] = "canton_multiplier" # Adding "multiplier" for easier understanding  
-    tax_multiplicators_cantonal_municipal.columns.values[5] = "commune_multiplier" # Adding "multiplier" for easier understanding  
-
-    tax_multiplicators_cantonal_municipal = tax_multiplicators_cantonal_municipal.iloc[:, 1:9]   # Select relevant column range
-    tax_multiplicators_cantonal_municipal = tax_multiplicators_cantonal_municipal.drop(columns={'SFO Commune ID'}) # Dropping irrelevant column 
-
-    tax_multiplicators_cantonal_municipal.columns = tax_multiplicators_cantonal_municipal.columns.str.lower() # Headers: remove capitalization
-    tax_multiplicators_cantonal_municipal.columns = tax_multiplicators_cantonal_municipal.columns.str.replace(",", "").str.replace(" ", "_") # Adjusting headers
+    path = paths.data_path('2025_estv_tax_multipliers_sg.csv')
+
+    # The header repeats "Canton" / "Commune" for every tax type, so the income tax
+    # columns are selected by position: canton, commune name, canton, commune and the three church multipliers
+    tax_multiplicators_cantonal_municipal = pd.read_csv(
+        path,
+        sep=',',
+        skiprows=_find_header_row(path) + 1,  # skip the header row itself
+        header=None,
+        usecols=[1, 3, 4, 5, 6, 7, 8],
+        names=["canton", "commune", "canton_multiplier", "commune_multiplier",
+               "church_protestant", "church_roman_catholic", "church_christian_catholic"],
+        dtype={"canton": "category", "commune": str, "canton_multiplier": str, "commune_multiplier": str,
+               "church_protestant": str, "church_roman_catholic": str, "church_christian_catholic": str},
+    )
 
-    tax_multiplicators_cantonal_municipal.iloc[:, 2:] = tax_multiplicators_cantonal_municipal.iloc[:, 2:].astype(float) # Convering numeric columns to float
+    # Convert multiplier columns to float (deleting "'" and "’")
+    for col in tax_multiplicators_cantonal_municipal.columns[2:]:
+        tax_multiplicators_cantonal_municipal[col] = _to_number(tax_multiplicators_cantonal_municipal[col])
 
     return tax_multiplicators_cantonal_municipal
 
@@ -221,7 +276,7 @@ def load_cantonal_municipal_church_multipliers():
 # We prefer to use data from STADA2 API, but fall back to the local .csv dataset if the API fails or a multiplier in the list differs between both sets 
 # Returns a DataFrame featuring the commune and its income tax multiplier 
     
-def load_communal_multipliers_validated():
+def load_communal_multipliers_validated(base_df=None, fetch_api=None):
     """
     Validate and return the final municipal income tax multiplier table.
 
@@ -232,18 +287,29 @@ def load_communal_multipliers_validated():
           → If mismatched or API fails, fall back to CSV.
           → Otherwise, trust the API output.
 
+    Parameters:
+        base_df (pd.DataFrame or None): multiplier table from
+            load_cantonal_municipal_church_multipliers(), if it was already loaded.
+        fetch_api (callable or None): returns the API multipliers (default:
+            load_municipal_multipliers_api). Lets the startup loader pass in the
+            result of a fetch that was started in the background.
+
     Returns:
         pd.DataFrame: DataFrame with columns ["commune", "commune_multiplier"].
     """
 
-    # Assigning CSV-based multipliers as base 
-    base_df = load_cantonal_municipal_church_multipliers()
+    # Assigning CSV-based multipliers as base (loaded here only if not passed in)
+    if base_df is None:
+        base_df = load_cantonal_municipal_church_multipliers()
     base_communal = base_df[["commune", "commune_multiplier"]].copy()
 
+    if fetch_api is None:
+        fetch_api = load_municipal_multipliers_api
+
     # Try to fetch data from API
     try:
         # API-based multipliers (already cleaned, 2 columns)
-        api_communal = load_municipal_multipliers_api()
+        api_communal = fetch_api()
 
         # Inner merge on commune
         merged = base_communal.merge(
@@ -262,14 +328,17 @@ def load_communal_multipliers_validated():
         if not mismatches.empty:
             print(mismatches.head())
             print("CSV used")
+            metrics.increment("tax_app_stada2_fetch_total", outcome="csv_mismatch")
             return base_communal
         # Print that API was used and return the API dataset 
         print("API used")
+        metrics.increment("tax_app_stada2_fetch_total", outcome="api")
         return api_communal
 
     # Run exception should API fail -> return the base .csv dataset 
     except Exception as e:
         print(f"API municipal multipliers failed ({e}), using CSV instead.")
+        metrics.increment("tax_app_stada2_fetch_total", outcome="csv_api_error")
         return base_communal
 
 # Federal and cantonal tax deductions 
@@ -294,9 +363,9 @@ def load_tax_deductions(tax_level):
     """
     # If the input varibale == "federal", reading federal .csv file and assinging it to variable. Otherwise do the same for the cantonal dataset
     if tax_level == "federal":
-        tax_deductions = pd.read_csv('data/2025_estv_deductions_federal.csv', sep=',') # Importing federal dataset
+        tax_deductions = pd.read_csv(paths.data_path('2025_estv_deductions_federal.csv'), sep=',') # Importing federal dataset
     else:
-        tax_deductions  = pd.read_csv('data/2025_estv_deductions_SG.csv', sep=',') # Importing cantonal dataset
+        tax_deductions  = pd.read_csv(paths.data_path('2025_estv_deductions_SG.csv'), sep=',') # Importing cantonal dataset
     
     header_row = tax_deductions.iloc[3]         # Save row at index 3 to variable 
     tax_deductions = tax_deductions.iloc[4:]    # Skip the first lines 
@@ -0,0 +1,48 @@
+# loaders/paths.py
+
+# Import libraries
+import os                       # builds file paths that work in multiple operating systems
+
+
+##################################################################################################
+
+### Package-relative file locations
+# The bundled data files, the savings dataset and the models are found relative to the
+# tax_calculator_app folder, so the app, the scripts, process-pool workers and other tools find
+# them from any working directory. Nothing is read here; the functions only build paths.
+#
+# TAX_APP_DATA_DIR points the loaders to another folder of input tables with the same file
+# names (e.g. synthetic exports for benchmarks); data_dir() reads it on every call, so it can be
+# changed at run time. Generated files (the savings dataset and its chunk folder) always stay
+# in tax_calculator_app/data (generated_data_path), so paths built from it at import are stable.
+# The default outputs of the scripts (scores, result store, logs, profiles) are also in the
+# tax_calculator_app folder; paths given on the command line stay relative to the working directory.
+
+# tax_calculator_app folder, its data folder and its model folder
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DATA_DIR = os.path.join(APP_DIR, "data")
+MODEL_DIR = os.path.join(APP_DIR, "models")
+
+# Default output folders of the diagnostics (slow request log, profiling dumps)
+LOG_DIR = os.path.join(APP_DIR, "logs")
+PROFILE_DIR = os.path.join(APP_DIR, "profiles")
+
+
+def data_dir():
+    """Data folder: TAX_APP_DATA_DIR, or tax_calculator_app/data."""
+    return os.environ.get("TAX_APP_DATA_DIR") or APP_DATA_DIR
+
+
+def data_path(file_name):
+    """Path of a file in the data folder (e.g. data_path("2025_estv_tax_rates_sg.csv"))."""
+    return os.path.join(data_dir(), file_name)
+
+
+def generated_data_path(file_name):
+    """Path of a generated file in tax_calculator_app/data (not affected by TAX_APP_DATA_DIR)."""
+    return os.path.join(APP_DATA_DIR, file_name)
+
+
+def model_path(file_name):
+    """Path of a file in tax_calculator_app/models (e.g. model_path("savings_delta_3a.pkl"))."""
+    return os.path.join(MODEL_DIR, file_name)
@@ -0,0 +1,113 @@
+# loaders/startup.py
+
+# Import libraries
+import time                     # time spent in each load
+from concurrent.futures import ThreadPoolExecutor   # runs the independent loads at the same time
+
+# Backend modules
+import diagnostics.metrics as metrics
+import loaders.load_datasets as datasets
+import deductions.optional_deductions as od
+import tax_calculations.total_income_tax as t
+
+
+##################################################################################################
+
+### Startup loader
+# Loads everything the app needs before the first calculation and returns it as one context
+# dictionary. The loads are independent of each other, so they run on a thread pool: the
+# STADA2 download (network) overlaps with parsing the local CSV files. Every file is loaded
+# exactly once; the multiplier table is shared by the calculation and the STADA2 validation.
+#
+# Context keys:
+#   tax_rates_federal, tax_rates_cantonal, tax_multiplicators_cantonal_municipal  (DataFrames)
+#   communal_multipliers, communes          validated commune multipliers and commune names
+#   federal_deduction_rules, cantonal_deduction_rules   parsed deduction rules
+#   tax_tables                              compiled tables (total_income_tax.compile_tax_tables)
+#   load_timings                            seconds per load, plus "total" (wall time)
+
+
+def _timed(timings, name, load, *args, **kwargs):
+    """Run one load and record its duration (seconds) under the given name."""
+    start = time.perf_counter()
+    try:
+        return load(*args, **kwargs)
+    finally:
+        timings[name] = time.perf_counter() - start
+
+
+def load_app_context(max_workers=6):
+    """
+    Load all datasets concurrently and build the app context.
+
+    Parameters:
+        max_workers (int): number of threads (one per independent load is enough).
+
+    Returns:
+        dict: context with the loaded tables, deduction rules, compiled tax tables
+              and the time spent in each load (see module comment).
+    """
+
+    start = time.perf_counter()
+    timings = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="startup-load") as pool:
+        # Network first, so the round-trip runs while the local files are parsed
+        api_future = pool.submit(_timed, timings, "stada2_api", datasets.load_municipal_multipliers_api)
+
+        federal_future = pool.submit(_timed, timings, "tax_rates_federal", datasets.load_federal_tax_rates)
+        cantonal_future = pool.submit(_timed, timings, "tax_rates_cantonal", datasets.load_cantonal_base_tax_rates)
+        multipliers_future = pool.submit(
+            _timed, timings, "tax_multiplicators_cantonal_municipal",
+            datasets.load_cantonal_municipal_church_multipliers,
+        )
+        federal_rules_future = pool.submit(_timed, timings, "federal_deduction_rules", od.get_deduction_rules, "federal")
+        cantonal_rules_future = pool.submit(_timed, timings, "cantonal_deduction_rules", od.get_deduction_rules, "cantonal")
+
+        tax_multiplicators_cantonal_municipal = multipliers_future.result()
+
+        # Validation waits for the download; a failed download falls back to the CSV as before
+        communal_multipliers = _timed(
+            timings, "communal_multipliers_validated",
+            datasets.load_communal_multipliers_validated,
+            base_df=tax_multiplicators_cantonal_municipal,
+            fetch_api=api_future.result,
+        )
+
+        context = {
+            "tax_rates_federal": federal_future.result(),
+            "tax_rates_cantonal": cantonal_future.result(),
+            "tax_multiplicators_cantonal_municipal": tax_multiplicators_cantonal_municipal,
+            "communal_multipliers": communal_multipliers,
+            "communes": communal_multipliers["commune"].tolist(),
+            "federal_deduction_rules": federal_rules_future.result(),
+            "cantonal_deduction_rules": cantonal_rules_future.result(),
+        }
+
+    context["tax_tables"] = _timed(
+        timings, "tax_tables",
+        t.compile_tax_tables,
+        context["tax_rates_federal"],
+        context["tax_rates_cantonal"],
+        context["tax_multiplicators_cantonal_municipal"],
+    )
+
+    timings["total"] = time.perf_counter() - start
+    context["load_timings"] = timings
+    for name, seconds in timings.items():
+        metrics.observe("tax_app_load_seconds", seconds, load=name)
+    return context
+
+
+def format_load_timings(context):
+    """Return the load timings of a context as readable lines, slowest first."""
+    timings = context["load_timings"]
+    lines = [f"{name:40} {seconds * 1000:8.1f} ms" for name, seconds in sorted(
+        timings.items(), key=lambda item: item[1], reverse=True) if name != "total"]
+    lines.append(f"{'total (wall time)':40} {timings['total'] * 1000:8.1f} ms")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # Usage (from the tax_calculator_app folder): python -m loaders.startup
+    print(format_load_timings(load_app_context()))
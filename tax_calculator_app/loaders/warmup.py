@@ -0,0 +1,251 @@
+# loaders/warmup.py
+
+# Import libraries
+import argparse                 # command line options of the warm-up
+import sys                      # exit status of the CLI (ready or not)
+import threading                # background warm-up and the shared status
+import time                     # duration of every step
+
+# Backend modules
+import diagnostics.metrics as metrics
+import loaders.startup as startup
+import tax_calculations.calculation_pipeline as cp
+
+
+##################################################################################################
+
+### Warm-up and readiness
+# Without a warm-up, the first request of a fresh process pays for everything that is done on
+# first use: parsing the CSV files and the STADA2 fetch, compiling the tax tables, unpickling
+# the models (sklearn import), the first pandas / sklearn calls, and the Plotly import and
+# template initialization. warm_up() does all of this once, in this order:
+#
+#   context    tax tables, multipliers and deduction rules (loaders/startup.py)
+#   models     savings models
+#   cache      prediction cache
+#   pipeline   a few representative profiles through every stage of the calculation pipeline
+#              (deductions, taxes, marginal savings, ML predictions, commune comparison)
+#   charts     the app's pie and bar chart, serialized like st.plotly_chart (app only)
+#   batch      the batch income tax and, if Numba is used, the compiled fused kernel (batch jobs)
+#
+# and then sets the readiness flag (is_ready(), the tax_app_ready metric and GET /ready of the
+# metrics endpoint, see diagnostics/metrics.py). The loads are passed in as functions, so the
+# app can warm up its st.cache_resource objects and a batch job its own ones.
+#
+# The app starts the warm-up in a background thread on its first run (TAX_APP_WARMUP=off
+# disables it): the form is shown immediately, and the first calculation finds everything loaded.
+#
+# Usage (from the tax_calculator_app folder):
+#   python -m loaders.warmup [--no-charts] [--batch]
+# Exits with status 1 if the warm-up failed.
+
+# Representative profiles (commune and church are added from the loaded context): a single
+# employee, a two-income family, a self-employed high earner and a low income pensioner
+REPRESENTATIVE_PROFILES = [
+    {"income_gross": 85_000, "age": 35, "employed": True, "marital_status": "single",
+     "is_two_income_couple": False, "number_of_children_under_7": 0, "number_of_children_7_and_over": 0,
+     "contribution_pillar_3a": 7_258, "total_insurance_expenses": 1_700, "travel_expenses_main_income": 1_500,
+     "child_care_expenses_third_party": 0, "taxable_assets": 50_000, "child_education_expenses": 0},
+    {"income_gross": 140_000, "age": 42, "employed": True, "marital_status": "married",
+     "is_two_income_couple": True, "number_of_children_under_7": 1, "number_of_children_7_and_over": 1,
+     "contribution_pillar_3a": 7_258, "total_insurance_expenses": 3_400, "travel_expenses_main_income": 3_000,
+     "child_care_expenses_third_party": 8_000, "taxable_assets": 100_000, "child_education_expenses": 2_000},
+    {"income_gross": 250_000, "age": 55, "employed": False, "marital_status": "married",
+     "is_two_income_couple": False, "number_of_children_under_7": 0, "number_of_children_7_and_over": 2,
+     "contribution_pillar_3a": 30_000, "total_insurance_expenses": 3_400, "travel_expenses_main_income": 0,
+     "child_care_expenses_third_party": 0, "taxable_assets": 800_000, "child_education_expenses": 5_000},
+    {"income_gross": 30_000, "age": 68, "employed": True, "marital_status": "single",
+     "is_two_income_couple": False, "number_of_children_under_7": 0, "number_of_children_7_and_over": 0,
+     "contribution_pillar_3a": 0, "total_insurance_expenses": 1_700, "travel_expenses_main_income": 0,
+     "child_care_expenses_third_party": 0, "taxable_assets": 0, "child_education_expenses": 0},
+]
+
+# Church affiliation of the profiles, in turn
+_CHURCHES = ("roman_catholic", "protestant", "none", "christian_catholic")
+
+# Status of the warm-up in this process
+_status = {"started": False, "ready": False, "error": None, "timings": {}, "seconds": None}
+_status_lock = threading.Lock()
+
+
+def representative_inputs(context):
+    """Calculation inputs (as built by tax_calculator.py) of the representative profiles."""
+    communes = context["communes"]
+    inputs = []
+    for i, profile in enumerate(REPRESENTATIVE_PROFILES):
+        inputs.append({
+            **profile,
+            "number_of_children": profile["number_of_children_under_7"] + profile["number_of_children_7_and_over"],
+            "commune": communes[i * len(communes) // len(REPRESENTATIVE_PROFILES)],
+            "church_affiliation": _CHURCHES[i % len(_CHURCHES)],
+            "exact_ml_estimates": False,
+        })
+    return inputs
+
+
+def _load_models():
+    """Savings models as loaded by the batch scoring (models/savings_<target>.pkl)."""
+    import analysis.score_portfolio as sp
+    return sp.load_models()
+
+
+def _create_prediction_cache():
+    import analysis.prediction_cache as pc
+    return pc.create_prediction_cache()
+
+
+def _warm_up_charts(stage_results, commune):
+    """Build and serialize the app's charts once (Plotly import, templates, JSON encoder)."""
+    import pandas as pd
+    import plotly.express as px
+    import plotly.io
+
+    income_tax = stage_results["income_tax"]
+    components = ["federal_tax", "cantonal_tax", "municipal_tax", "church_tax"]
+    pie = px.pie(
+        pd.DataFrame({"component": components, "amount": [float(income_tax[k]) for k in components]}),
+        names="component", values="amount", title="Tax breakdown", hole=0.3,
+    )
+    pie.update_traces(textposition="inside", textinfo="percent")
+
+    comparison = stage_results["commune_comparison"].assign(
+        selection=lambda df: df["commune"].eq(commune).map({True: "Your commune", False: "Other communes"})
+    )
+    bar = px.bar(comparison, x="commune", y="total_income_tax", color="selection",
+                 color_discrete_map={"Your commune": "#d62728", "Other communes": "#2ca02c"})
+    bar.update_layout(yaxis_tickprefix="CHF ", xaxis={"categoryorder": "total ascending"})
+
+    for figure in (pie, bar):
+        plotly.io.to_json(figure, validate=False)
+
+
+def _warm_up_batch(context, inputs):
+    """Run the batch income tax on the profiles, and compile the fused kernel if it is used."""
+    import pandas as pd
+    import tax_calculations.batch_income_tax as bt
+    import tax_calculations.fused_tax_kernel as fk
+
+    profiles = pd.DataFrame(inputs).drop(columns=["exact_ml_estimates"])
+    bt.calculate_income_tax_batch(
+        profiles, context["tax_tables"], context["federal_deduction_rules"], context["cantonal_deduction_rules"]
+    )
+    if fk.select_engine(fk.FUSED_MIN_ROWS) == "numba":
+        bt.calculate_income_tax_batch(
+            profiles, context["tax_tables"], context["federal_deduction_rules"], context["cantonal_deduction_rules"],
+            engine="numba",
+        )
+
+
+def warm_up(load_context=None, load_models=None, load_prediction_cache=None, charts=True, batch=False):
+    """
+    Load and prime everything the first request needs, then set the readiness flag.
+
+    Parameters:
+        load_context (callable or None): returns the app context (default: startup.load_app_context).
+        load_models (callable or None): returns target -> savings model (default: models/savings_*.pkl).
+        load_prediction_cache (callable or None): returns the prediction cache (default: a new cache).
+        charts (bool): also build the app's charts (Plotly).
+        batch (bool): also run the batch income tax (and compile the fused kernel).
+
+    Returns:
+        dict: warm-up status, see warmup_status().
+    """
+
+    with _status_lock:
+        _status.update(started=True, ready=False, error=None, timings={}, seconds=None)
+    metrics.set_gauge("tax_app_ready", 0)
+
+    timings = {}
+    start = time.perf_counter()
+
+    def step(name, function, *args):
+        step_start = time.perf_counter()
+        result = function(*args)
+        timings[name] = time.perf_counter() - step_start
+        metrics.observe("tax_app_load_seconds", timings[name], load=f"warmup_{name}")
+        return result
+
+    try:
+        context = step("context", load_context or startup.load_app_context)
+        models = step("models", load_models or _load_models)
+        prediction_cache = step("cache", load_prediction_cache or _create_prediction_cache)
+        # The cache is primed without counting the warm-up lookups in its hit rate
+        ml_context = {**context, "savings_models": models, "prediction_cache": prediction_cache,
+                      "prime_prediction_cache": True}
+
+        # Every stage of the pipeline, with a fresh state per profile (no memoized results)
+        inputs = representative_inputs(context)
+        stage_results = step("pipeline", lambda: [cp.run_pipeline(profile, ml_context) for profile in inputs])
+
+        if charts:
+            step("charts", _warm_up_charts, stage_results[0], inputs[0]["commune"])
+        if batch:
+            step("batch", _warm_up_batch, context, inputs)
+    except Exception as e:
+        print(f"Warm-up failed ({e}); the remaining data is loaded on first use.")
+        with _status_lock:
+            _status.update(error=str(e), timings=timings, seconds=time.perf_counter() - start)
+        return warmup_status()
+
+    seconds = time.perf_counter() - start
+    metrics.observe("tax_app_load_seconds", seconds, load="warmup")
+    with _status_lock:
+        _status.update(ready=True, timings=timings, seconds=seconds)
+    metrics.set_gauge("tax_app_ready", 1)
+    print(f"Warm-up finished in {seconds:.2f} s, ready.")
+    return warmup_status()
+
+
+def start_warm_up(**kwargs):
+    """
+    Run warm_up() in a daemon thread (once per process; later calls return None).
+
+    Returns:
+        threading.Thread or None: the warm-up thread.
+    """
+    with _status_lock:
+        if _status["started"]:
+            return None
+        _status["started"] = True
+    thread = threading.Thread(target=warm_up, kwargs=kwargs, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def is_ready():
+    """True once the warm-up has finished without errors."""
+    with _status_lock:
+        return _status["ready"]
+
+
+def warmup_status():
+    """
+    Status of the warm-up in this process.
+
+    Returns:
+        dict: "started", "ready", "error" (message or None), "timings" (seconds per finished
+              step) and "seconds" (total duration, None while running).
+    """
+    with _status_lock:
+        return {**_status, "timings": dict(_status["timings"])}
+
+
+def format_warmup_status(status):
+    """Readable summary of warmup_status()."""
+    if status["seconds"] is None:
+        return "Warm-up running" if status["started"] else "Warm-up not started"
+    lines = [f"{name:10} {seconds * 1000:9.1f} ms" for name, seconds in status["timings"].items()]
+    lines.append(f"{'total':10} {status['seconds'] * 1000:9.1f} ms")
+    lines.append("Ready" if status["ready"] else f"Not ready: {status['error']}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warm up the tax calculator and report the duration of every step.")
+    parser.add_argument("--no-charts", action="store_true", help="skip the Plotly charts")
+    parser.add_argument("--batch", action="store_true", help="also warm up the batch income tax (and the fused kernel)")
+    args = parser.parse_args()
+
+    status = warm_up(charts=not args.no_charts, batch=args.batch)
+    print(format_warmup_status(status))
+    sys.exit(0 if status["ready"] else 1)
@@ -0,0 +1,153 @@
+# tax_calculations/batch_deduplication.py
+
+# Import libraries
+import numpy as np              # group codes and scatter indices
+import pandas as pd             # hash-based factorization of the columns
+
+
+##################################################################################################
+
+### Deduplicating batch executor
+# Client files often contain many rows that are identical in every tax-relevant field (e.g.
+# salaried singles in the same commune with standard deductions). The executor groups the
+# rows on these fields, calls the batch function once per distinct profile and scatters the
+# results back to the original rows, in the original order. Rows of a group have exactly the
+# same inputs, so the output is the same as without deduplication.
+#
+# Grouping: every field is factorized (hash table, one pass) into integer codes, and the codes
+# are combined field by field into one int64 key per row (re-factorized whenever the key range
+# would overflow). Equal keys mean equal values in every field; there are no hash collisions.
+# Once every row has its own key, the remaining fields are skipped (no duplicates).
+#
+#   result, stats = run_deduplicated(bt.calculate_income_tax_batch, profiles, TAX_INPUT_FIELDS,
+#                                    tax_tables, federal_rules, cantonal_rules)
+
+# Profile fields the income tax depends on (see batch_income_tax.py)
+TAX_INPUT_FIELDS = (
+    "income_gross", "age", "employed", "marital_status", "number_of_children",
+    "contribution_pillar_3a", "total_insurance_expenses", "travel_expenses_main_income",
+    "child_care_expenses_third_party", "is_two_income_couple", "taxable_assets",
+    "child_education_expenses", "number_of_children_under_7", "number_of_children_7_and_over",
+    "commune", "church_affiliation",
+)
+
+# Largest key range before the combined key is re-factorized
+_MAX_KEY_RANGE = 2**62
+
+
+def group_duplicate_rows(profiles, fields=TAX_INPUT_FIELDS):
+    """
+    Group the rows of a batch that are equal in all given fields.
+
+    Parameters:
+        profiles (pd.DataFrame or dict of arrays): profile batch.
+        fields (iterable of str): fields that define a distinct profile (missing fields are ignored).
+
+    Returns:
+        tuple: (representatives, inverse): position of the first row of every distinct profile,
+        and per row the number of its group (row i equals row representatives[inverse[i]]).
+    """
+
+    columns = [field for field in fields if field in profiles]
+    n_rows = len(profiles[columns[0]]) if columns else len(profiles)
+
+    key = np.zeros(n_rows, dtype=np.int64)
+    key_range = 1
+    for field in columns:
+        codes, uniques = pd.factorize(np.asarray(profiles[field]), use_na_sentinel=False)
+        if key_range * len(uniques) >= _MAX_KEY_RANGE:
+            key, key_uniques = pd.factorize(key)
+            key_range = len(key_uniques)
+            if key_range == n_rows:
+                break               # every row is distinct already
+        key = key * len(uniques) + codes
+        key_range *= len(uniques)
+
+    # Group numbers in order of first appearance: a row starts a new group where the
+    # running maximum of the group numbers increases
+    inverse = pd.factorize(key)[0]
+    representatives = np.flatnonzero(np.diff(np.maximum.accumulate(inverse), prepend=-1) > 0)
+    return representatives, inverse
+
+
+def duplicate_stats(inverse):
+    """
+    Duplicate statistics of a grouping (see group_duplicate_rows).
+
+    Returns:
+        dict: "rows", "distinct_profiles", "duplicate_rows", "duplicate_share" (share of rows
+              that are not calculated) and "largest_group" (rows of the most frequent profile).
+    """
+
+    rows = len(inverse)
+    counts = np.bincount(inverse) if rows else np.zeros(0, dtype=np.int64)
+    distinct = len(counts)
+    return {
+        "rows": rows,
+        "distinct_profiles": distinct,
+        "duplicate_rows": rows - distinct,
+        "duplicate_share": (rows - distinct) / rows if rows else 0.0,
+        "largest_group": int(counts.max()) if rows else 0,
+    }
+
+
+def take_rows(profiles, positions):
+    """Rows of a batch (DataFrame or dict of arrays) at the given positions, with a new RangeIndex."""
+    if isinstance(profiles, pd.DataFrame):
+        return profiles.iloc[positions].reset_index(drop=True)
+    return {key: np.asarray(values)[positions] for key, values in profiles.items()}
+
+
+def scatter_rows(result, inverse, index=None):
+    """
+    Expand a result of the distinct profiles back to all rows.
+
+    Parameters:
+        result (pd.DataFrame, np.ndarray or dict of arrays): one row (first axis) per distinct
+            profile; in a dict every value must have one row per distinct profile.
+        inverse (np.ndarray): group number per row (group_duplicate_rows).
+        index (pd.Index or None): index of the original batch (DataFrame results).
+
+    Returns:
+        the result with one row per original row, same type as the input.
+    """
+
+    if isinstance(result, pd.DataFrame):
+        scattered = result.iloc[inverse]
+        scattered.index = index if index is not None else pd.RangeIndex(len(inverse))
+        return scattered
+    if isinstance(result, dict):
+        return {key: scatter_rows(value, inverse, index) for key, value in result.items()}
+    return np.asarray(result)[inverse]
+
+
+def run_deduplicated(function, profiles, fields=TAX_INPUT_FIELDS, *args, **kwargs):
+    """
+    Call a batch function once per distinct profile and scatter its result back to all rows.
+
+    Parameters:
+        function (callable): batch function function(profiles, *args, **kwargs) whose result has
+            one row per profile (DataFrame, array or dict of arrays).
+        profiles (pd.DataFrame or dict of arrays): profile batch.
+        fields (iterable of str): all fields the function's result depends on.
+
+    Returns:
+        tuple: (result, stats): the same result as function(profiles, ...) and the duplicate
+        statistics (see duplicate_stats).
+    """
+
+    representatives, inverse = group_duplicate_rows(profiles, fields)
+    stats = duplicate_stats(inverse)
+
+    # No duplicates: the grouping was the only extra work
+    if stats["duplicate_rows"] == 0:
+        return function(profiles, *args, **kwargs), stats
+
+    result = function(take_rows(profiles, representatives), *args, **kwargs)
+    return scatter_rows(result, inverse, getattr(profiles, "index", None)), stats
+
+
+def format_duplicate_stats(stats):
+    """One-line summary of duplicate_stats()."""
+    return (f"{stats['rows']:,} rows, {stats['distinct_profiles']:,} distinct profiles "
+            f"({stats['duplicate_share']:.1%} duplicates, largest group {stats['largest_group']:,} rows)")
@@ -0,0 +1,115 @@
+# tax_calculations/batch_income_tax.py
+
+# Import libraries
+import numpy as np              # array-based calculation for profile batches
+import pandas as pd             # columnar result for batches
+
+# Backend modules
+import deductions.mandatory_deductions as md
+import deductions.optional_deductions as od
+import tax_calculations.fused_tax_kernel as fk
+import tax_calculations.batch_deduplication as dedup
+
+
+##################################################################################################
+
+### Batch income tax calculation
+# The same steps as the Streamlit app (mandatory deductions -> optional deductions ->
+# net incomes -> total income tax), for a whole batch of profiles in one pass.
+#
+# A profile batch is a DataFrame (or dict of arrays) with the fields used by the app:
+#   income_gross, age, employed, marital_status, number_of_children,
+#   contribution_pillar_3a, total_insurance_expenses, travel_expenses_main_income,
+#   child_care_expenses_third_party, is_two_income_couple, taxable_assets,
+#   child_education_expenses, number_of_children_under_7, number_of_children_7_and_over,
+#   commune, church_affiliation
+#
+# The tax breakdown uses the fused kernel for large batches if Numba is installed and the
+# NumPy engine otherwise, with identical results (see fused_tax_kernel.py).
+
+
+def calculate_net_incomes_batch(profiles, federal_rules=None, cantonal_rules=None):
+    """
+    Calculate the federal and cantonal net incomes for a profile batch.
+
+    Parameters:
+        profiles (pd.DataFrame or dict of arrays): profile batch (see above).
+        federal_rules (dict or None): parsed federal deduction rules (default: loaded once).
+        cantonal_rules (dict or None): parsed cantonal deduction rules (default: loaded once).
+
+    Returns:
+        dict: arrays "total_mandatory_deductions", "total_federal_optional_deductions",
+              "total_cantonal_optional_deductions", "income_net_federal", "income_net_cantonal".
+    """
+
+    income_gross = np.asarray(profiles["income_gross"], dtype=float)
+    employed = np.asarray(profiles["employed"], dtype=bool)
+
+    total_mandatory_deductions = md.get_total_mandatory_deductions_vectorized(
+        income_gross, profiles["age"], employed
+    )
+    total_federal_optional_deductions = od.calculate_federal_optional_deductions_vectorized(
+        profiles, federal_rules
+    )["total_federal_optional_deductions"].to_numpy()
+    total_cantonal_optional_deductions = od.calculate_cantonal_optional_deductions_vectorized(
+        profiles, cantonal_rules
+    )["total_cantonal_optional_deductions"].to_numpy()
+
+    return {
+        "total_mandatory_deductions": total_mandatory_deductions,
+        "total_federal_optional_deductions": total_federal_optional_deductions,
+        "total_cantonal_optional_deductions": total_cantonal_optional_deductions,
+        "income_net_federal": income_gross - (total_mandatory_deductions + total_federal_optional_deductions),
+        "income_net_cantonal": income_gross - (total_mandatory_deductions + total_cantonal_optional_deductions),
+    }
+
+
+def calculate_income_tax_batch(profiles, tax_tables, federal_rules=None, cantonal_rules=None, decimals=2,
+                               engine=None):
+    """
+    Calculate the total income tax for a profile batch.
+
+    Parameters:
+        profiles (pd.DataFrame or dict of arrays): profile batch (see above).
+        tax_tables (dict): compiled tax tables from total_income_tax.compile_tax_tables.
+        federal_rules (dict or None): parsed federal deduction rules (default: loaded once).
+        cantonal_rules (dict or None): parsed cantonal deduction rules (default: loaded once).
+        decimals (int or None): rounding of the tax amounts (None = unrounded).
+        engine (str or None): "auto", "numba" or "numpy" (see fused_tax_kernel.select_engine).
+
+    Returns:
+        pd.DataFrame: one row per profile with the net incomes and the same tax
+        components as total_income_tax.calculation_total_income_tax().
+    """
+
+    net_incomes = calculate_net_incomes_batch(profiles, federal_rules, cantonal_rules)
+
+    income_tax = fk.calculation_total_income_tax_auto(
+        tax_tables,
+        marital_status=profiles["marital_status"],
+        number_of_children=profiles["number_of_children"],
+        income_net_federal=net_incomes["income_net_federal"],
+        income_net_cantonal=net_incomes["income_net_cantonal"],
+        commune=profiles["commune"],
+        church_affiliation=profiles["church_affiliation"],
+        decimals=decimals,
+        engine=engine,
+    )
+
+    return pd.DataFrame({**net_incomes, **income_tax}, index=getattr(profiles, "index", None))
+
+
+def calculate_income_tax_batch_deduplicated(profiles, tax_tables, federal_rules=None, cantonal_rules=None,
+                                            decimals=2, engine=None):
+    """
+    calculate_income_tax_batch() with every distinct profile calculated once (see
+    batch_deduplication.py). Pays off for client files with many identical profiles.
+
+    Returns:
+        tuple: (result, stats): the same DataFrame as calculate_income_tax_batch() and the
+        duplicate statistics (batch_deduplication.duplicate_stats).
+    """
+    return dedup.run_deduplicated(
+        calculate_income_tax_batch, profiles, dedup.TAX_INPUT_FIELDS,
+        tax_tables, federal_rules, cantonal_rules, decimals, engine,
+    )
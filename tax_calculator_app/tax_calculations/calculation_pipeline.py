@@ -0,0 +1,297 @@
+# tax_calculations/calculation_pipeline.py
+
+# Import libraries
+import time                     # time spent per stage
+
+# Backend modules
+import diagnostics.metrics as metrics
+import deductions.mandatory_deductions as md
+import deductions.optional_deductions as od
+import tax_calculations.federal_tax as fed
+import tax_calculations.canton_base_tax as base
+import tax_calculations.canton_municipal_church_tax as can
+import tax_calculations.total_income_tax as t
+import tax_calculations.marginal_savings as ms
+import tax_calculations.commune_comparison as cc
+
+
+##################################################################################################
+
+### Calculation pipeline as a graph of memoized stages
+# The app's calculation, split into stages that declare their inputs: profile fields
+# (e.g. "income_gross") or the results of earlier stages. A stage is recomputed only if one
+# of its inputs changed since the last run; otherwise its previous result is reused (hit).
+# If a recomputed stage returns the same value as before (e.g. a capped deduction), the
+# stages after it are not recomputed either.
+#
+#   social_deductions ──┐
+#   pension_contribution┴─ total_mandatory_deductions ─┬─ income_net_federal ── federal_tax ──────────┐
+#   federal_optional_deductions ───────────────────────┘                                              ├─ income_tax
+#   cantonal_optional_deductions ───── income_net_cantonal ── cantonal_base_tax ─┐                    │
+#   commune_multipliers (commune, church only) ────────────────────────────────┴─ cantonal_municipal_church_tax
+#   marginal_savings, commune_comparison, ml_savings_predictions (all profile fields)
+#
+# The results are the same as the straight-line calculation (same functions, same order of
+# operations). A pipeline state holds the last result of every stage and the hit/miss
+# statistics; use one state per session. The context (tax tables, models) must not change
+# while a state is used.
+#
+# Inputs (profile fields, as in the features of the savings models):
+#   income_gross, age, employed, marital_status ("single"/"married"), is_two_income_couple,
+#   number_of_children_under_7, number_of_children_7_and_over, number_of_children, commune,
+#   church_affiliation ("none" for no church), contribution_pillar_3a, total_insurance_expenses,
+#   travel_expenses_main_income, child_care_expenses_third_party, taxable_assets,
+#   child_education_expenses, exact_ml_estimates (bypass of the prediction cache)
+#
+# Context keys: tax_rates_federal, tax_rates_cantonal, tax_multiplicators_cantonal_municipal,
+#   tax_tables (see loaders/startup.py); for the ML stage also savings_models and prediction_cache
+#   (and optionally prime_prediction_cache=True: warm-up lookups, not counted in the cache statistics).
+
+# Profile fields passed to the savings models (analysis/dataset_io.py FEATURE_COLS order)
+ML_FEATURES = (
+    "income_gross", "age", "employed", "marital_status", "is_two_income_couple",
+    "number_of_children_under_7", "number_of_children_7_and_over", "number_of_children",
+    "commune", "church_affiliation", "contribution_pillar_3a", "total_insurance_expenses",
+    "travel_expenses_main_income", "child_care_expenses_third_party", "taxable_assets",
+    "child_education_expenses",
+)
+
+# Inputs of the optional deduction functions
+FEDERAL_DEDUCTION_FIELDS = (
+    "income_gross", "employed", "marital_status", "number_of_children", "contribution_pillar_3a",
+    "total_insurance_expenses", "travel_expenses_main_income", "child_care_expenses_third_party",
+)
+CANTONAL_DEDUCTION_FIELDS = FEDERAL_DEDUCTION_FIELDS + (
+    "is_two_income_couple", "taxable_assets", "child_education_expenses",
+    "number_of_children_under_7", "number_of_children_7_and_over",
+)
+
+
+def _church_or_none(church_affiliation):
+    """Church affiliation as expected by the scalar tax functions (None for no church)."""
+    return None if church_affiliation in (None, "none") else church_affiliation
+
+
+### Stage functions: called with the context and their declared inputs as keyword arguments
+
+def _ml_savings_predictions(context, exact_ml_estimates, **features):
+    # Imported here: the prediction cache is only needed once the models are used
+    import analysis.prediction_cache as pc
+    return pc.predict_cached(
+        context["prediction_cache"], context["savings_models"], features, bypass=exact_ml_estimates,
+        prime=context.get("prime_prediction_cache", False),
+    )
+
+
+# Stage name -> (inputs, function), in an order where every stage comes after its inputs
+STAGES = {
+    "social_deductions": (
+        ("income_gross", "employed"),
+        lambda context, income_gross, employed: md.get_total_social_deductions(income_gross, employed),
+    ),
+    "pension_contribution": (
+        ("income_gross", "age"),
+        lambda context, income_gross, age: md.get_mandatory_pension_contribution(income_gross, age),
+    ),
+    "total_mandatory_deductions": (
+        ("social_deductions", "pension_contribution"),
+        lambda context, social_deductions, pension_contribution: social_deductions + pension_contribution,
+    ),
+    "federal_optional_deductions": (
+        FEDERAL_DEDUCTION_FIELDS,
+        lambda context, **fields: od.calculate_federal_optional_deductions(**fields),
+    ),
+    "cantonal_optional_deductions": (
+        CANTONAL_DEDUCTION_FIELDS,
+        lambda context, **fields: od.calculate_cantonal_optional_deductions(**fields),
+    ),
+    "income_net_federal": (
+        ("income_gross", "total_mandatory_deductions", "federal_optional_deductions"),
+        lambda context, income_gross, total_mandatory_deductions, federal_optional_deductions: income_gross - (
+            total_mandatory_deductions + federal_optional_deductions.get("total_federal_optional_deductions", 0)
+        ),
+    ),
+    "income_net_cantonal": (
+        ("income_gross", "total_mandatory_deductions", "cantonal_optional_deductions"),
+        lambda context, income_gross, total_mandatory_deductions, cantonal_optional_deductions: income_gross - (
+            total_mandatory_deductions + cantonal_optional_deductions.get("total_cantonal_optional_deductions", 0)
+        ),
+    ),
+    "federal_tax": (
+        ("marital_status", "number_of_children", "income_net_federal"),
+        lambda context, marital_status, number_of_children, income_net_federal: fed.calculation_income_tax_federal(
+            context["tax_rates_federal"],
+            marital_status=marital_status,
+            number_of_children=number_of_children,
+            income_net=income_net_federal,
+        ),
+    ),
+    "cantonal_base_tax": (
+        ("income_net_cantonal",),
+        lambda context, income_net_cantonal: base.calculation_income_tax_base_SG(
+            context["tax_rates_cantonal"], income_net_cantonal
+        ),
+    ),
+    "commune_multipliers": (
+        ("commune", "church_affiliation"),
+        lambda context, commune, church_affiliation: can.get_commune_multipliers(
+            context["tax_multiplicators_cantonal_municipal"], commune, _church_or_none(church_affiliation)
+        ),
+    ),
+    "cantonal_municipal_church_tax": (
+        ("cantonal_base_tax", "commune_multipliers"),
+        lambda context, cantonal_base_tax, commune_multipliers: can.apply_commune_multipliers(
+            cantonal_base_tax, commune_multipliers
+        ),
+    ),
+    "income_tax": (
+        ("federal_tax", "cantonal_base_tax", "cantonal_municipal_church_tax"),
+        lambda context, federal_tax, cantonal_base_tax, cantonal_municipal_church_tax: t.combine_income_tax_components(
+            federal_tax, cantonal_base_tax, cantonal_municipal_church_tax
+        ),
+    ),
+    "marginal_savings": (
+        ML_FEATURES,
+        lambda context, **profile: ms.calculate_marginal_savings(context["tax_tables"], **profile),
+    ),
+    "commune_comparison": (
+        ML_FEATURES,
+        lambda context, **profile: cc.compare_communes(context["tax_tables"], **profile),
+    ),
+    "ml_savings_predictions": (
+        ML_FEATURES + ("exact_ml_estimates",),
+        _ml_savings_predictions,
+    ),
+}
+
+
+def _check_stage_order(stages):
+    """Make sure every stage input is a profile field or an earlier stage (no cycles)."""
+    seen = set()
+    for name, (inputs, _) in stages.items():
+        for item in inputs:
+            if item in stages and item not in seen:
+                raise ValueError(f"Stage {name} uses {item} before it is calculated")
+        seen.add(name)
+
+
+_check_stage_order(STAGES)
+
+
+##################################################################################################
+
+### Running the pipeline
+
+
+def create_pipeline_state():
+    """
+    Create an empty pipeline state (one per session).
+
+    Returns:
+        dict: "results" (stage -> (key, value, version)) and "stats"
+              (stage -> {"hits", "misses", "seconds"}).
+    """
+    return {
+        "results": {},
+        "stats": {name: {"hits": 0, "misses": 0, "seconds": 0.0} for name in STAGES},
+    }
+
+
+def _required_stages(targets):
+    """The target stages and every stage they depend on, in pipeline order."""
+    required = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name in required:
+            continue
+        if name not in STAGES:
+            raise ValueError(f"Unknown stage: {name}")
+        required.add(name)
+        pending += [item for item in STAGES[name][0] if item in STAGES]
+    return [name for name in STAGES if name in required]
+
+
+def _same_value(a, b):
+    """True if a recomputed stage returned the same value (DataFrames compared by content)."""
+    if hasattr(a, "equals"):
+        return type(a) is type(b) and a.equals(b)
+    try:
+        return bool(a == b)
+    except (TypeError, ValueError):
+        return False
+
+
+def run_pipeline(inputs, context, state=None, targets=None):
+    """
+    Run the calculation, recomputing only the stages whose inputs changed.
+
+    Parameters:
+        inputs (dict): profile fields (see module comment).
+        context (dict): tax tables and models (see module comment).
+        state (dict or None): pipeline state from create_pipeline_state() (None: no memoization).
+        targets (list of str or None): stages needed by the caller (default: all stages).
+
+    Returns:
+        dict: stage name -> result, for the target stages and the stages they depend on.
+    """
+
+    if state is None:
+        state = create_pipeline_state()
+
+    values = {}
+    for name in _required_stages(targets or list(STAGES)):
+        stage_inputs, function = STAGES[name]
+
+        # Key: the values of the profile fields and the versions of the upstream stages
+        key = tuple(
+            ("stage", state["results"][item][2]) if item in STAGES else ("field", inputs[item])
+            for item in stage_inputs
+        )
+        stats = state["stats"][name]
+        previous = state["results"].get(name)
+
+        if previous is not None and previous[0] == key:
+            stats["hits"] += 1
+            metrics.increment("tax_app_stage_runs_total", stage=name, result="hit")
+            values[name] = previous[1]
+            continue
+
+        start = time.perf_counter()
+        value = function(context, **{item: values[item] if item in STAGES else inputs[item] for item in stage_inputs})
+        seconds = time.perf_counter() - start
+        stats["seconds"] += seconds
+        stats["misses"] += 1
+        metrics.increment("tax_app_stage_runs_total", stage=name, result="miss")
+        metrics.observe("tax_app_stage_seconds", seconds, stage=name)
+
+        # Unchanged result: keep the version, so the stages after it are not recomputed
+        if previous is not None and _same_value(previous[1], value):
+            version = previous[2]
+        else:
+            version = previous[2] + 1 if previous is not None else 0
+        state["results"][name] = (key, value, version)
+        values[name] = value
+
+    return values
+
+
+def pipeline_stats(state):
+    """
+    Hit/miss statistics per stage.
+
+    Returns:
+        list of dict: per stage "stage", "hits", "misses", "hit_rate" and "seconds" (total
+        time spent recomputing the stage), in pipeline order.
+    """
+    rows = []
+    for name, stats in state["stats"].items():
+        runs = stats["hits"] + stats["misses"]
+        rows.append({
+            "stage": name,
+            "hits": stats["hits"],
+            "misses": stats["misses"],
+            "hit_rate": stats["hits"] / runs if runs else 0.0,
+            "seconds": stats["seconds"],
+        })
+    return rows
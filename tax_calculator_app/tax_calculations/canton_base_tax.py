@@ -2,6 +2,7 @@
 
 # Importing libraries
 import pandas as pd
+import numpy as np              # used for the compiled (array-based) tax schedule
 
 
 ##################################################################################################
@@ -57,3 +58,85 @@ def calculation_income_tax_base_SG(tax_rates_cantonal, income_net):
         remaining_income_net -= taxable_amount_in_band
 
     return base_income_tax_cantonal
+
+
+##################################################################################################
+### Compiled cantonal tax schedule
+# The progressive brackets as cumulative arrays: the tax for an income in bracket k is
+#   base_tax[k] + (income - lower_bound[k]) * rate[k]
+# which gives the same result as iterating over the brackets.
+
+
+def compile_cantonal_tax_schedule(tax_rates_cantonal):
+    """
+    Convert the cantonal tax table (bracket widths) into cumulative bracket arrays.
+
+    Parameters:
+        tax_rates_cantonal (DataFrame):
+            Progressive cantonal tax table with "for_the_next_amount_CHF" and "additional_%".
+
+    Returns:
+        dict: arrays "lower_bound", "upper_bound", "additional_%" and "base_tax"
+              (tax accumulated in all brackets below the lower bound).
+    """
+
+    band_width = tax_rates_cantonal["for_the_next_amount_CHF"].to_numpy(dtype=float)
+    tax_rate_band = tax_rates_cantonal["additional_%"].to_numpy(dtype=float)
+
+    upper_bound = np.cumsum(band_width)
+    lower_bound = upper_bound - band_width
+    base_tax = np.concatenate(([0.0], np.cumsum(band_width * tax_rate_band / 100.0)[:-1]))
+
+    return {
+        "lower_bound": lower_bound,
+        "upper_bound": upper_bound,
+        "additional_%": tax_rate_band,
+        "base_tax": base_tax,
+    }
+
+
+def get_cantonal_marginal_rate_vectorized(schedule, income_net):
+    """
+    Marginal cantonal base tax rate (%) that applies to the last franc of net income.
+
+    For an income exactly on a bracket boundary the rate of the bracket below applies
+    (the rate saved by one more franc of deduction). Incomes of 0 or below have rate 0.
+
+    Parameters:
+        schedule (dict): compiled schedule from compile_cantonal_tax_schedule
+        income_net (array-like of float): net taxable income for cantonal tax
+
+    Returns:
+        np.ndarray: marginal cantonal base tax rate in percent (before multipliers)
+    """
+
+    income_net = np.asarray(income_net, dtype=float)
+
+    # Bracket k contains the incomes in (lower_bound[k], upper_bound[k]]
+    idx = np.searchsorted(schedule["upper_bound"], income_net, side="left")
+    idx = np.clip(idx, 0, len(schedule["upper_bound"]) - 1)
+
+    return np.where(income_net > 0, schedule["additional_%"][idx], 0.0)
+
+
+def calculation_income_tax_base_SG_vectorized(schedule, income_net):
+    """
+    Vectorized version of calculation_income_tax_base_SG() on the compiled schedule.
+
+    Parameters:
+        schedule (dict): compiled schedule from compile_cantonal_tax_schedule
+        income_net (array-like of float): net taxable income for cantonal tax
+
+    Returns:
+        np.ndarray: cantonal base income tax per profile (unrounded, before multipliers)
+    """
+
+    # Like the bracket loop: nothing is taxed below 0 or above the last bracket
+    income_net = np.clip(np.asarray(income_net, dtype=float), 0.0, schedule["upper_bound"][-1])
+
+    idx = np.searchsorted(schedule["upper_bound"], income_net, side="left")
+    idx = np.clip(idx, 0, len(schedule["upper_bound"]) - 1)
+
+    return schedule["base_tax"][idx] + (income_net - schedule["lower_bound"][idx]) * (
+        schedule["additional_%"][idx] / 100.0
+    )
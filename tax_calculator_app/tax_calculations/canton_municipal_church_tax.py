@@ -1,5 +1,9 @@
 # tax_calculations/canton_municipal_church_tax.py
 
+# Import libraries
+import numpy as np              # used for the compiled (array-based) multiplier table
+import pandas as pd             # used to map commune names to table positions
+
 ##################################################################################################
 ### Calculate cantonal, municipal, and church tax  
 # Uses multipliers applied to the cantonal base tax.
@@ -36,6 +40,30 @@ def calculation_cantonal_municipal_church_tax(
             (total_tax, cantonal_tax, municipal_tax, church_tax)
     """
 
+    multipliers = get_commune_multipliers(tax_multiplicators_cantonal_municipal, commune, church_affiliation)
+    return apply_commune_multipliers(base_income_tax_cantonal, multipliers)
+
+
+def get_commune_multipliers(tax_multiplicators_cantonal_municipal, commune, church_affiliation):
+    """
+    Look up the canton, commune and church multipliers of one commune.
+
+    They do not depend on the income, so they can be looked up once and reused while
+    only the income changes.
+
+    Parameters:
+        tax_multiplicators_cantonal_municipal (DataFrame):
+            Table containing canton, commune and church multipliers for all communes.
+        commune (str):
+            Name of the commune selected by the user.
+        church_affiliation (str or None):
+            One of {"protestant", "roman_catholic", "christian_catholic"} or None.
+
+    Returns:
+        tuple:
+            (canton_multiplier, commune_multiplier, church_multiplier) as decimals
+    """
+
     ### Access multiplier dataset
     df = tax_multiplicators_cantonal_municipal
 
@@ -58,6 +86,20 @@ def calculation_cantonal_municipal_church_tax(
     else:
         church_multiplier = 0.0
 
+    return canton_multiplier, commune_multiplier, church_multiplier
+
+
+def apply_commune_multipliers(base_income_tax_cantonal, multipliers):
+    """
+    Apply the multipliers of get_commune_multipliers() to the cantonal base tax.
+
+    Returns:
+        tuple:
+            (total_tax, cantonal_tax, municipal_tax, church_tax)
+    """
+
+    canton_multiplier, commune_multiplier, church_multiplier = multipliers
+
     ### Compute individual tax components by applying multipliers
     income_tax_canton = base_income_tax_cantonal * canton_multiplier
     income_tax_commune = base_income_tax_cantonal * commune_multiplier
@@ -78,3 +120,124 @@ def calculation_cantonal_municipal_church_tax(
     )
 
     return data_income_tax_canton_municipal_church
+
+
+##################################################################################################
+### Compiled multiplier table
+# Canton, commune and church multipliers as arrays indexed by commune position,
+# so batch calculations can look up many communes at once.
+
+# Church affiliation -> multiplier column (same mapping as in the scalar function)
+CHURCH_MULTIPLIER_COLUMNS = {
+    "protestant": "church_protestant",
+    "roman_catholic": "church_roman_catholic",
+    "christian_catholic": "church_christian_catholic",
+}
+
+
+def compile_multiplier_table(tax_multiplicators_cantonal_municipal):
+    """
+    Convert the multiplier table into arrays (multipliers in percent).
+
+    Parameters:
+        tax_multiplicators_cantonal_municipal (DataFrame):
+            Table containing canton, commune and church multipliers for all communes.
+
+    Returns:
+        dict: "commune" (names), "canton_multiplier", "commune_multiplier" and one
+              array per church multiplier column, all in table order.
+    """
+
+    df = tax_multiplicators_cantonal_municipal
+
+    table = {"commune": df["commune"].to_numpy(dtype=object)}
+    for col in ["canton_multiplier", "commune_multiplier", *CHURCH_MULTIPLIER_COLUMNS.values()]:
+        table[col] = df[col].to_numpy(dtype=float)
+    return table
+
+
+def get_commune_index_vectorized(multiplier_table, commune):
+    """
+    Return the position of each commune in the compiled multiplier table.
+
+    Raises:
+        ValueError: if a commune is not part of the multiplier table.
+    """
+
+    commune = np.asarray(commune, dtype=object)
+    idx = pd.Index(multiplier_table["commune"]).get_indexer(commune.ravel()).reshape(commune.shape)
+    if (idx < 0).any():
+        unknown = sorted(set(commune[idx < 0].tolist()))
+        raise ValueError(f"Unknown commune(s): {unknown}")
+    return idx
+
+
+def get_church_multiplier_vectorized(multiplier_table, commune_idx, church_affiliation):
+    """
+    Church multiplier (%) per profile; 0 for profiles without church affiliation
+    (None, NaN or "none").
+    """
+
+    church_affiliation = np.asarray(church_affiliation, dtype=object)
+    church_multiplier = np.zeros(np.shape(commune_idx))
+    for affiliation, col in CHURCH_MULTIPLIER_COLUMNS.items():
+        mask = church_affiliation == affiliation
+        church_multiplier[mask] = multiplier_table[col][commune_idx[mask]]
+    return church_multiplier
+
+
+def get_multiplier_sum_vectorized(multiplier_table, commune, church_affiliation):
+    """
+    Sum of canton, commune and church multipliers as decimal factor per profile,
+    i.e. the factor applied to the cantonal base tax.
+
+    Parameters:
+        multiplier_table (dict): compiled table from compile_multiplier_table
+        commune (array-like of str): commune per profile
+        church_affiliation (array-like): church affiliation per profile or None/"none"
+
+    Returns:
+        np.ndarray: (canton + commune + church multiplier) / 100 per profile
+    """
+
+    commune_idx = get_commune_index_vectorized(multiplier_table, commune)
+    return (
+        multiplier_table["canton_multiplier"][commune_idx]
+        + multiplier_table["commune_multiplier"][commune_idx]
+        + get_church_multiplier_vectorized(multiplier_table, commune_idx, church_affiliation)
+    ) / 100.0
+
+
+def calculation_cantonal_municipal_church_tax_vectorized(
+    multiplier_table,
+    base_income_tax_cantonal,
+    commune,
+    church_affiliation):
+    """
+    Vectorized version of calculation_cantonal_municipal_church_tax().
+
+    Parameters:
+        multiplier_table (dict): compiled table from compile_multiplier_table
+        base_income_tax_cantonal (array-like of float): cantonal base tax per profile
+        commune (array-like of str): commune per profile
+        church_affiliation (array-like): church affiliation per profile or None/"none"
+
+    Returns:
+        tuple of np.ndarray:
+            (total_tax, cantonal_tax, municipal_tax, church_tax)
+    """
+
+    base_income_tax_cantonal = np.asarray(base_income_tax_cantonal, dtype=float)
+    commune_idx = get_commune_index_vectorized(multiplier_table, commune)
+
+    ### Multipliers per profile (convert % → decimal)
+    canton_multiplier = multiplier_table["canton_multiplier"][commune_idx] / 100.0
+    commune_multiplier = multiplier_table["commune_multiplier"][commune_idx] / 100.0
+    church_multiplier = get_church_multiplier_vectorized(multiplier_table, commune_idx, church_affiliation) / 100.0
+
+    return (
+        base_income_tax_cantonal * (canton_multiplier + commune_multiplier + church_multiplier),
+        base_income_tax_cantonal * canton_multiplier,
+        base_income_tax_cantonal * commune_multiplier,
+        base_income_tax_cantonal * church_multiplier,
+    )
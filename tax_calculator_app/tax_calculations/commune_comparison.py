@@ -0,0 +1,216 @@
+# tax_calculations/commune_comparison.py
+
+# Import libraries
+import numpy as np              # broadcasting of the base taxes across all communes
+import pandas as pd             # ranked comparison tables
+
+# Backend modules
+import tax_calculations.batch_income_tax as bt
+import tax_calculations.canton_municipal_church_tax as can
+import tax_calculations.federal_tax as fed
+import tax_calculations.canton_base_tax as base
+
+
+##################################################################################################
+
+### Compare the income tax of a profile across all communes
+# Federal tax and cantonal base tax do not depend on the commune, so they are calculated
+# once per profile. Only the multipliers differ between communes:
+#
+#   total tax[profile, commune] = federal tax[profile]
+#                               + cantonal base tax[profile] * (canton + commune + church multiplier)[commune]
+#
+# Batches are processed in chunks of profiles, so at most chunk_size x number of communes
+# values are held in memory at a time.
+
+# Default number of profiles per chunk (10'000 x 75 communes x 8 bytes ≈ 6 MB per matrix)
+DEFAULT_CHUNK_SIZE = 10_000
+
+
+def _church_multipliers_per_commune(multiplier_table, church_affiliation):
+    """
+    Church multiplier (%) of every commune for each profile.
+
+    Returns:
+        np.ndarray: shape (profiles, communes), 0 for profiles without church affiliation.
+    """
+
+    church_affiliation = np.asarray(church_affiliation, dtype=object)
+    n_communes = len(multiplier_table["commune"])
+    church_multiplier = np.zeros((len(church_affiliation), n_communes))
+    for affiliation, col in can.CHURCH_MULTIPLIER_COLUMNS.items():
+        mask = church_affiliation == affiliation
+        church_multiplier[mask] = multiplier_table[col]
+    return church_multiplier
+
+
+def calculate_commune_tax_components(profiles, tax_tables, federal_rules=None, cantonal_rules=None):
+    """
+    Calculate the tax components of every profile in every commune.
+
+    Parameters:
+        profiles (pd.DataFrame or dict of arrays): profile batch (see batch_income_tax.py);
+            the commune field is not needed.
+        tax_tables (dict): compiled tax tables from total_income_tax.compile_tax_tables.
+        federal_rules (dict or None): parsed federal deduction rules (default: loaded once).
+        cantonal_rules (dict or None): parsed cantonal deduction rules (default: loaded once).
+
+    Returns:
+        dict: "commune" (names), "federal_tax" and "cantonal_base_tax" (one value per profile),
+              "cantonal_tax", "municipal_tax", "church_tax" and "total_income_tax"
+              (shape profiles x communes), all unrounded.
+    """
+
+    multiplier_table = tax_tables["multipliers"]
+
+    ### Commune-independent part: once per profile
+    net_incomes = bt.calculate_net_incomes_batch(profiles, federal_rules, cantonal_rules)
+    federal_tax = fed.calculation_income_tax_federal_vectorized(
+        tax_tables["federal"],
+        profiles["marital_status"],
+        profiles["number_of_children"],
+        net_incomes["income_net_federal"],
+    )
+    base_income_tax_cantonal = base.calculation_income_tax_base_SG_vectorized(
+        tax_tables["cantonal"], net_incomes["income_net_cantonal"]
+    )
+
+    ### Multipliers: broadcast the base tax across all communes
+    base_column = base_income_tax_cantonal[:, None]
+    tax_canton = base_column * (multiplier_table["canton_multiplier"][None, :] / 100.0)
+    tax_commune = base_column * (multiplier_table["commune_multiplier"][None, :] / 100.0)
+    tax_church = base_column * (
+        _church_multipliers_per_commune(multiplier_table, profiles["church_affiliation"]) / 100.0
+    )
+
+    return {
+        "commune": multiplier_table["commune"],
+        "federal_tax": federal_tax,
+        "cantonal_base_tax": base_income_tax_cantonal,
+        "cantonal_tax": tax_canton,
+        "municipal_tax": tax_commune,
+        "church_tax": tax_church,
+        "total_income_tax": federal_tax[:, None] + tax_canton + tax_commune + tax_church,
+    }
+
+
+def compare_communes(tax_tables, **profile):
+    """
+    Rank all communes by the total income tax of one profile.
+
+    Parameters:
+        tax_tables (dict): compiled tax tables from total_income_tax.compile_tax_tables.
+        **profile: profile fields as used by the app (see batch_income_tax.py). If a
+            commune is given, the table also shows the difference to that commune.
+
+    Returns:
+        pd.DataFrame: one row per commune, cheapest first, with the columns
+        "rank", "commune", the tax components of calculation_total_income_tax()
+        (rounded to two decimals) and "difference_to_cheapest" (plus
+        "difference_to_current" if a commune was given).
+    """
+
+    batch = {key: [value] for key, value in profile.items()}
+    components = calculate_commune_tax_components(batch, tax_tables)
+    n_communes = len(components["commune"])
+
+    comparison = pd.DataFrame({
+        "commune": components["commune"],
+        "federal_tax": np.repeat(components["federal_tax"], n_communes),
+        "cantonal_base_tax": np.repeat(components["cantonal_base_tax"], n_communes),
+        "cantonal_tax": components["cantonal_tax"][0],
+        "municipal_tax": components["municipal_tax"][0],
+        "church_tax": components["church_tax"][0],
+        "total_cantonal_municipal_church_tax": (
+            components["cantonal_tax"][0] + components["municipal_tax"][0] + components["church_tax"][0]
+        ),
+        "total_income_tax": components["total_income_tax"][0],
+    }).round(2)
+
+    ### Rank: cheapest commune first (ties in alphabetical order)
+    comparison = comparison.sort_values(["total_income_tax", "commune"], kind="stable").reset_index(drop=True)
+    comparison.insert(0, "rank", np.arange(1, n_communes + 1))
+    comparison["difference_to_cheapest"] = (
+        comparison["total_income_tax"] - comparison["total_income_tax"].iloc[0]
+    ).round(2)
+
+    current_commune = profile.get("commune")
+    if current_commune is not None:
+        current_total = comparison.loc[comparison["commune"] == current_commune, "total_income_tax"]
+        if current_total.empty:
+            raise ValueError(f"Unknown commune: {current_commune}")
+        comparison["difference_to_current"] = (comparison["total_income_tax"] - current_total.iloc[0]).round(2)
+
+    return comparison
+
+
+##################################################################################################
+
+### Batch form: many profiles x all communes, in chunks
+
+
+def iter_commune_comparison_chunks(profiles, tax_tables, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield the total income tax of every profile in every commune, chunk by chunk.
+
+    Parameters:
+        profiles (pd.DataFrame): profile batch (see batch_income_tax.py).
+        tax_tables (dict): compiled tax tables from total_income_tax.compile_tax_tables.
+        chunk_size (int): number of profiles per chunk.
+
+    Yields:
+        pd.DataFrame: profiles of the chunk (index) x communes (columns), unrounded totals.
+    """
+
+    for start in range(0, len(profiles), chunk_size):
+        chunk = profiles.iloc[start:start + chunk_size]
+        components = calculate_commune_tax_components(chunk, tax_tables)
+        yield pd.DataFrame(components["total_income_tax"], index=chunk.index, columns=components["commune"])
+
+
+def compare_communes_batch(profiles, tax_tables, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Find the cheapest commune for every profile of a batch.
+
+    Only one chunk of the profiles x communes matrix exists at a time, and the result
+    has one row per profile, so memory grows with the number of profiles only.
+
+    Parameters:
+        profiles (pd.DataFrame): profile batch (see batch_income_tax.py), including the
+            commune the profile currently lives in.
+        tax_tables (dict): compiled tax tables from total_income_tax.compile_tax_tables.
+        chunk_size (int): number of profiles per chunk.
+
+    Returns:
+        pd.DataFrame: per profile "current_total_income_tax", "cheapest_commune",
+        "cheapest_total_income_tax" and "potential_saving" (rounded to two decimals).
+    """
+
+    current_communes = profiles["commune"].to_numpy(dtype=object)
+
+    summaries = []
+    offset = 0
+    for totals in iter_commune_comparison_chunks(profiles, tax_tables, chunk_size):
+        values = totals.to_numpy()
+        communes = totals.columns.to_numpy()
+
+        current_idx = can.get_commune_index_vectorized(
+            tax_tables["multipliers"], current_communes[offset:offset + len(values)]
+        )
+        offset += len(values)
+        current_total = values[np.arange(len(values)), current_idx]
+        cheapest_idx = values.argmin(axis=1)
+        cheapest_total = values[np.arange(len(values)), cheapest_idx]
+
+        summaries.append(pd.DataFrame({
+            "current_total_income_tax": current_total,
+            "cheapest_commune": communes[cheapest_idx],
+            "cheapest_total_income_tax": cheapest_total,
+            "potential_saving": current_total - cheapest_total,
+        }, index=totals.index).round(2))
+
+    if not summaries:
+        return pd.DataFrame(columns=[
+            "current_total_income_tax", "cheapest_commune", "cheapest_total_income_tax", "potential_saving",
+        ])
+    return pd.concat(summaries)
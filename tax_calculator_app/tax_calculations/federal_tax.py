@@ -2,6 +2,7 @@
 
 # Import libraries
 import pandas as pd
+import numpy as np              # used for the compiled (array-based) tax schedule
 
 
 ##################################################################################################
@@ -91,3 +92,118 @@ def calculation_income_tax_federal(tax_rates_federal, marital_status, number_of_
     income_tax_federal = base_amount_chf + (taxable_excess * (federal_tax_rate / 100.0))
 
     return income_tax_federal
+
+
+##################################################################################################
+
+### Compiled federal tax schedule
+# The federal tax table as plain NumPy arrays per tax class, so batch calculations
+# can look up brackets with np.searchsorted instead of filtering the DataFrame per profile.
+
+
+def compile_federal_tax_schedule(tax_rates_federal):
+    """
+    Convert the federal tax rate table into arrays per federal tax class.
+
+    Parameters:
+        tax_rates_federal (DataFrame): federal income tax rate table
+
+    Returns:
+        dict: tax class ("single", "married/single") -> dict with the arrays
+              "net_income" (bracket thresholds), "base_amount_CHF" and "additional_%"
+    """
+
+    ### Same rows as used by calculation_income_tax_federal
+    df = tax_rates_federal[
+        (tax_rates_federal["tax_type"] == "Income tax")
+        & (tax_rates_federal["tax_authority"] == "Federal tax")
+    ]
+
+    schedule = {}
+    for tax_class in ("single", "married/single"):
+        rows = df[df["marital_status"] == tax_class]
+        schedule[tax_class] = {
+            "net_income": rows["net_income"].to_numpy(dtype=float),
+            "base_amount_CHF": rows["base_amount_CHF"].to_numpy(dtype=float),
+            "additional_%": rows["additional_%"].to_numpy(dtype=float),
+        }
+    return schedule
+
+
+def get_federal_tax_class_vectorized(marital_status, number_of_children):
+    """
+    Vectorized version of map_marital_status_and_children_for_federal_tax().
+
+    Returns:
+        np.ndarray of bool: True where the "married/single" tax class applies.
+    """
+    return (np.asarray(number_of_children) > 0) | (np.asarray(marital_status) == "married")
+
+
+def get_federal_marginal_rate_vectorized(schedule, marital_status, number_of_children, income_net):
+    """
+    Marginal federal tax rate (%) that applies to the last franc of net income.
+
+    This is the rate saved by one more franc of deduction: for an income exactly on
+    a bracket threshold the rate of the bracket below applies. Incomes at or below
+    the lowest threshold pay the flat base amount, so their marginal rate is 0.
+
+    Parameters:
+        schedule (dict): compiled schedule from compile_federal_tax_schedule
+        marital_status (array-like of str): "single" or "married"
+        number_of_children (array-like of int): number of dependent children
+        income_net (array-like of float): net taxable income after deductions
+
+    Returns:
+        np.ndarray: marginal federal tax rate in percent per profile
+    """
+
+    income_net = np.asarray(income_net, dtype=float)
+    is_married_class = get_federal_tax_class_vectorized(marital_status, number_of_children)
+    marginal_rate = np.zeros(income_net.shape)
+
+    for tax_class, mask in (("single", ~is_married_class), ("married/single", is_married_class)):
+        brackets = schedule[tax_class]
+        # Last bracket whose threshold lies strictly below the income
+        idx = np.searchsorted(brackets["net_income"], income_net[mask], side="left") - 1
+        marginal_rate[mask] = np.where(
+            idx >= 0, brackets["additional_%"][np.clip(idx, 0, None)], 0.0
+        )
+
+    return marginal_rate
+
+
+def calculation_income_tax_federal_vectorized(schedule, marital_status, number_of_children, income_net):
+    """
+    Vectorized version of calculation_income_tax_federal() on the compiled schedule.
+
+    Same rule per profile: base amount of the last bracket whose threshold is at or
+    below the income + the excess above that threshold * the bracket rate. Incomes at or
+    below the lowest threshold pay the base amount of the first bracket.
+
+    Parameters:
+        schedule (dict): compiled schedule from compile_federal_tax_schedule
+        marital_status (array-like of str): "single" or "married"
+        number_of_children (array-like of int): number of dependent children
+        income_net (array-like of float): net taxable income after deductions
+
+    Returns:
+        np.ndarray: federal income tax per profile (unrounded)
+    """
+
+    income_net = np.asarray(income_net, dtype=float)
+    is_married_class = get_federal_tax_class_vectorized(marital_status, number_of_children)
+    is_married_class = np.broadcast_to(is_married_class, income_net.shape)
+    income_tax_federal = np.zeros(income_net.shape)
+
+    for tax_class, mask in (("single", ~is_married_class), ("married/single", is_married_class)):
+        brackets = schedule[tax_class]
+        income = income_net[mask]
+        # Last bracket whose threshold is at or below the income (first bracket below the minimum)
+        idx = np.clip(np.searchsorted(brackets["net_income"], income, side="right") - 1, 0, None)
+        taxable_excess = np.maximum(income - brackets["net_income"][idx], 0.0)
+        income_tax_federal[mask] = (
+            brackets["base_amount_CHF"][idx] + taxable_excess * (brackets["additional_%"][idx] / 100.0)
+        )
+
+    return income_tax_federal
@@ -0,0 +1,235 @@
+# tax_calculations/fused_tax_kernel.py
+
+# Import libraries
+import os                       # engine selection through an environment variable
+
+import numpy as np              # kernel inputs and outputs
+
+# Backend modules
+import tax_calculations.federal_tax as fed
+import tax_calculations.canton_municipal_church_tax as can
+import tax_calculations.total_income_tax as t
+
+
+##################################################################################################
+
+### Fused tax kernel (optional, compiled with Numba)
+# calculation_total_income_tax_vectorized() evaluates the federal brackets, the cantonal
+# brackets and the multipliers one NumPy operation at a time, so every step allocates
+# temporary arrays of the batch size. The kernel below computes the whole breakdown row by
+# row in one pass: bracket lookup (binary search with the same side as np.searchsorted),
+# caps, multipliers and rounding, written directly into one preallocated output block.
+#
+# The kernel is compiled with Numba if it is installed (imported on the first large batch,
+# compiled code cached in __pycache__); otherwise the NumPy engine is used. Both engines
+# perform the same floating point operations in the same order, so the results are identical.
+# Only the string columns (tax class, commune, church) are mapped to integer codes beforehand.
+#
+# Engine selection (environment variable TAX_APP_TAX_ENGINE, or the engine argument):
+#   auto    fused kernel for batches of at least FUSED_MIN_ROWS rows if Numba is installed,
+#           NumPy otherwise (default; small batches such as the app's single profiles do not
+#           pay the Numba import and JIT warm-up)
+#   numba   fused kernel for every batch (falls back to NumPy if Numba is missing)
+#   numpy   always the NumPy engine
+#
+# Benchmarks: python -m analysis.benchmark_tax_engines
+
+FUSED_MIN_ROWS = 50_000
+
+# Output rows of the kernel, in the order of calculation_total_income_tax_vectorized()
+OUTPUT_KEYS = (
+    "federal_tax",
+    "cantonal_base_tax",
+    "cantonal_tax",
+    "municipal_tax",
+    "church_tax",
+    "total_cantonal_municipal_church_tax",
+    "total_income_tax",
+)
+
+
+def _tax_breakdown_rows(
+    is_married_class, income_net_federal, income_net_cantonal, commune_idx, church_idx,
+    single_threshold, single_base, single_rate, married_threshold, married_base, married_rate,
+    cantonal_lower, cantonal_upper, cantonal_rate, cantonal_base_tax,
+    canton_multiplier, commune_multiplier, church_multiplier,
+    decimals, out,
+):
+    """Row loop of the fused kernel (compiled by Numba; see module comment).
+
+    Writes out[k, i] for the OUTPUT_KEYS k of every row i. decimals < 0: no rounding.
+    """
+
+    scale = 10.0 ** decimals if decimals >= 0 else 1.0
+    n_cantonal = cantonal_upper.shape[0]
+    cantonal_max = cantonal_upper[n_cantonal - 1]
+
+    for i in range(income_net_federal.shape[0]):
+
+        ### Federal tax: last bracket whose threshold is at or below the income
+        if is_married_class[i]:
+            threshold, base, rate = married_threshold, married_base, married_rate
+        else:
+            threshold, base, rate = single_threshold, single_base, single_rate
+        income = income_net_federal[i]
+        lo, hi = 0, threshold.shape[0]
+        while lo < hi:                  # np.searchsorted(side="right")
+            mid = (lo + hi) // 2
+            if threshold[mid] <= income:
+                lo = mid + 1
+            else:
+                hi = mid
+        k = lo - 1 if lo > 0 else 0
+        excess = income - threshold[k]
+        if excess < 0.0:
+            excess = 0.0
+        federal_tax = base[k] + excess * (rate[k] / 100.0)
+
+        ### Cantonal base tax: nothing is taxed below 0 or above the last bracket
+        income = income_net_cantonal[i]
+        if income < 0.0:
+            income = 0.0
+        elif income > cantonal_max:
+            income = cantonal_max
+        lo, hi = 0, n_cantonal
+        while lo < hi:                  # np.searchsorted(side="left")
+            mid = (lo + hi) // 2
+            if cantonal_upper[mid] < income:
+                lo = mid + 1
+            else:
+                hi = mid
+        k = lo if lo < n_cantonal else n_cantonal - 1
+        cantonal_base = cantonal_base_tax[k] + (income - cantonal_lower[k]) * (cantonal_rate[k] / 100.0)
+
+        ### Cantonal, municipal and church tax (multipliers in percent)
+        c = commune_idx[i]
+        canton = canton_multiplier[c] / 100.0
+        commune = commune_multiplier[c] / 100.0
+        church = church_multiplier[c, church_idx[i]] / 100.0 if church_idx[i] >= 0 else 0.0
+        total_cantonal = cantonal_base * (canton + commune + church)
+
+        values = (
+            federal_tax,
+            cantonal_base,
+            cantonal_base * canton,
+            cantonal_base * commune,
+            cantonal_base * church,
+            total_cantonal,
+            federal_tax + total_cantonal,
+        )
+        for j in range(7):
+            # Same rounding as np.round(value, decimals): rint(value * 10^decimals) / 10^decimals
+            out[j, i] = np.rint(values[j] * scale) / scale if decimals >= 0 else values[j]
+
+
+# Compiled kernel: None until the first use, False if Numba is not available
+_compiled_kernel = None
+
+
+def load_kernel():
+    """The compiled kernel, or None if Numba is not installed (imported and compiled once)."""
+    global _compiled_kernel
+    if _compiled_kernel is None:
+        try:
+            import numba
+        except ImportError:
+            _compiled_kernel = False
+        else:
+            _compiled_kernel = numba.njit(cache=True, nogil=True)(_tax_breakdown_rows)
+    return _compiled_kernel or None
+
+
+def numba_available():
+    """True if the fused kernel can be compiled."""
+    return load_kernel() is not None
+
+
+def select_engine(n_rows, engine=None):
+    """
+    Engine for a batch of n_rows profiles.
+
+    Parameters:
+        n_rows (int): batch size.
+        engine (str or None): "auto", "numba" or "numpy" (default: TAX_APP_TAX_ENGINE or "auto").
+
+    Returns:
+        str: "numba" or "numpy".
+    """
+    if engine is None:
+        engine = os.environ.get("TAX_APP_TAX_ENGINE", "auto").strip().lower()
+    if engine not in ("auto", "numba", "numpy"):
+        raise ValueError(f"Unknown tax engine: {engine}. Use 'auto', 'numba' or 'numpy'.")
+    if engine == "numpy" or (engine == "auto" and n_rows < FUSED_MIN_ROWS):
+        return "numpy"
+    return "numba" if numba_available() else "numpy"
+
+
+def calculation_total_income_tax_fused(
+    tax_tables,
+    marital_status,
+    number_of_children,
+    income_net_federal,
+    income_net_cantonal,
+    commune,
+    church_affiliation,
+    decimals=2,
+    ):
+    """
+    Fused-kernel version of total_income_tax.calculation_total_income_tax_vectorized()
+    (same arguments, identical results). Requires Numba (see numba_available()).
+
+    Returns:
+        dict: same keys as calculation_total_income_tax_vectorized(), one NumPy array per key.
+    """
+
+    kernel = load_kernel()
+    if kernel is None:
+        raise ImportError("The fused tax kernel requires numba")
+
+    income_net_federal = np.ascontiguousarray(income_net_federal, dtype=float)
+    income_net_cantonal = np.ascontiguousarray(income_net_cantonal, dtype=float)
+    is_married_class = np.ascontiguousarray(
+        np.broadcast_to(fed.get_federal_tax_class_vectorized(marital_status, number_of_children), income_net_federal.shape)
+    )
+
+    ### String columns -> positions in the multiplier table
+    multipliers = tax_tables["multipliers"]
+    commune_idx = np.ascontiguousarray(can.get_commune_index_vectorized(multipliers, commune), dtype=np.int64)
+    church_affiliation = np.asarray(church_affiliation, dtype=object)
+    church_idx = np.full(income_net_federal.shape, -1, dtype=np.int64)
+    for j, affiliation in enumerate(can.CHURCH_MULTIPLIER_COLUMNS):
+        church_idx[church_affiliation == affiliation] = j
+    church_multiplier = np.column_stack(
+        [np.asarray(multipliers[col], dtype=float) for col in can.CHURCH_MULTIPLIER_COLUMNS.values()]
+    )
+
+    federal = tax_tables["federal"]
+    cantonal = tax_tables["cantonal"]
+    out = np.empty((len(OUTPUT_KEYS), income_net_federal.shape[0]))
+    kernel(
+        is_married_class, income_net_federal, income_net_cantonal, commune_idx, church_idx,
+        federal["single"]["net_income"], federal["single"]["base_amount_CHF"], federal["single"]["additional_%"],
+        federal["married/single"]["net_income"], federal["married/single"]["base_amount_CHF"],
+        federal["married/single"]["additional_%"],
+        cantonal["lower_bound"], cantonal["upper_bound"], cantonal["additional_%"], cantonal["base_tax"],
+        np.asarray(multipliers["canton_multiplier"], dtype=float),
+        np.asarray(multipliers["commune_multiplier"], dtype=float),
+        church_multiplier,
+        -1 if decimals is None else int(decimals),
+        out,
+    )
+    return dict(zip(OUTPUT_KEYS, out))
+
+
+def calculation_total_income_tax_auto(tax_tables, marital_status, number_of_children, income_net_federal,
+                                      income_net_cantonal, commune, church_affiliation, decimals=2, engine=None):
+    """
+    Total income tax breakdown with the engine chosen by select_engine() (same arguments and
+    results as calculation_total_income_tax_vectorized(), plus engine).
+    """
+
+    arguments = (tax_tables, marital_status, number_of_children, income_net_federal,
+                 income_net_cantonal, commune, church_affiliation, decimals)
+    if select_engine(np.size(income_net_federal), engine) == "numba":
+        return calculation_total_income_tax_fused(*arguments)
+    return t.calculation_total_income_tax_vectorized(*arguments)
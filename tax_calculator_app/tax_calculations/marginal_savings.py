@@ -0,0 +1,177 @@
+# tax_calculations/marginal_savings.py
+
+# Import libraries
+import numpy as np              # array-based calculation for single profiles and batches
+import pandas as pd             # columnar result for batches
+
+# Backend modules
+import deductions.optional_deductions as od
+import tax_calculations.batch_income_tax as bt
+import tax_calculations.federal_tax as fed
+import tax_calculations.canton_base_tax as base
+import tax_calculations.canton_municipal_church_tax as can
+
+
+##################################################################################################
+
+### Marginal tax savings per deductible input
+# How much tax does one more franc of a deductible input save at the current position?
+#
+# Every deduction is a capped linear function of its input, and the taxes are piecewise
+# linear in the net income, so the saving per franc is exact:
+#
+#   saving = slope_federal  * federal marginal rate
+#          + slope_cantonal * cantonal marginal base rate * (canton + commune + church multipliers)
+#
+# where the slope is 1 while the deduction is below its cap (0 once the cap is reached)
+# and the marginal rates are those of the last franc of net income.
+#
+# Note: for self-employed persons without pillar 3a contributions, the first franc paid into
+# pillar 3a also switches the insurance premium maximum to the "with contributions" variant.
+# That is a one-off jump and not a per-franc saving, so it is not included.
+
+# Deductible inputs covered by the report
+MARGINAL_SAVINGS_INPUTS = [
+    "contribution_pillar_3a",
+    "total_insurance_expenses",
+    "travel_expenses_main_income",
+    "child_care_expenses_third_party",
+    "child_education_expenses",
+    "taxable_assets",
+]
+
+
+def _below_cap(amount, maximum):
+    """Slope of min(amount, maximum): 1 while one more franc is still deductible, else 0."""
+    return (amount < maximum).astype(float)
+
+
+def calculate_marginal_savings_batch(
+    profiles,
+    tax_tables,
+    federal_rules=None,
+    cantonal_rules=None,
+    ):
+    """
+    Calculate the tax saved by one more franc of each deductible input for a profile batch.
+
+    Parameters:
+        profiles (pd.DataFrame or dict of arrays): profile batch with the same fields
+            as the optional deduction functions plus age, commune and church_affiliation.
+        tax_tables (dict): compiled tax tables from total_income_tax.compile_tax_tables.
+        federal_rules (dict or None): parsed federal deduction rules (default: loaded once).
+        cantonal_rules (dict or None): parsed cantonal deduction rules (default: loaded once).
+
+    Returns:
+        pd.DataFrame: one column per input in MARGINAL_SAVINGS_INPUTS (CHF saved per
+        additional CHF), plus "federal_marginal_rate" and "cantonal_marginal_rate"
+        (effective rate incl. multipliers), both as decimal fractions.
+    """
+
+    if federal_rules is None:
+        federal_rules = od.get_deduction_rules("federal")
+    if cantonal_rules is None:
+        cantonal_rules = od.get_deduction_rules("cantonal")
+
+    ### Current position: deductions and net incomes (same steps as the main calculation)
+    income_gross = np.asarray(profiles["income_gross"], dtype=float)
+    employed = np.asarray(profiles["employed"], dtype=bool)
+    is_married = np.asarray(profiles["marital_status"]) == "married"
+    contribution_pillar_3a = np.asarray(profiles["contribution_pillar_3a"], dtype=float)
+    total_insurance_expenses = np.asarray(profiles["total_insurance_expenses"], dtype=float)
+    travel_expenses_main_income = np.asarray(profiles["travel_expenses_main_income"], dtype=float)
+    child_care_expenses_third_party = np.asarray(profiles["child_care_expenses_third_party"], dtype=float)
+    child_education_expenses = np.asarray(profiles["child_education_expenses"], dtype=float)
+    taxable_assets = np.asarray(profiles["taxable_assets"], dtype=float)
+
+    net_incomes = bt.calculate_net_incomes_batch(profiles, federal_rules, cantonal_rules)
+    income_net_federal = net_incomes["income_net_federal"]
+    income_net_cantonal = net_incomes["income_net_cantonal"]
+
+    ### Marginal tax rates at the current position
+    federal_marginal_rate = fed.get_federal_marginal_rate_vectorized(
+        tax_tables["federal"],
+        profiles["marital_status"],
+        profiles["number_of_children"],
+        income_net_federal,
+    ) / 100.0
+
+    cantonal_marginal_rate = (
+        base.get_cantonal_marginal_rate_vectorized(tax_tables["cantonal"], income_net_cantonal) / 100.0
+        * can.get_multiplier_sum_vectorized(
+            tax_tables["multipliers"], profiles["commune"], profiles["church_affiliation"]
+        )
+    )
+
+    ### Active cap state: slope of each deduction with respect to its input
+    has_3a_or_pension = employed | (contribution_pillar_3a > 0)
+
+    def slopes_shared(rules):
+        # Deductions that exist on federal and cantonal level, each with its own caps
+        max_p3 = np.where(
+            employed,
+            rules["pillar_3a_with_pension"]["maximum"],
+            rules["pillar_3a_without_pension"]["maximum"],
+        )
+        max_ins = od.get_insurance_maximum_vectorized(rules, is_married, has_3a_or_pension)
+        return {
+            "contribution_pillar_3a": _below_cap(contribution_pillar_3a, max_p3),
+            "total_insurance_expenses": _below_cap(total_insurance_expenses, max_ins),
+            "travel_expenses_main_income": _below_cap(travel_expenses_main_income, rules["travel"]["maximum"]),
+            "child_care_expenses_third_party": _below_cap(child_care_expenses_third_party, rules["childcare"]["maximum"]),
+        }
+
+    slopes_federal = slopes_shared(federal_rules)
+    slopes_cantonal = slopes_shared(cantonal_rules)
+
+    # Education costs (cantonal only): deductible above the own contribution, up to the maximum
+    own_contribution = cantonal_rules["education_own_contribution"]["amount"]
+    slopes_federal["child_education_expenses"] = np.zeros(income_gross.shape)
+    slopes_cantonal["child_education_expenses"] = (
+        (child_education_expenses >= own_contribution)
+        & (child_education_expenses - own_contribution < cantonal_rules["education"]["maximum"])
+    ).astype(float)
+
+    # Taxable assets (cantonal only): percentage deduction between its minimum and maximum
+    asset_rule = cantonal_rules["asset_management"]
+    asset_percent = asset_rule["percent"] / 100.0
+    raw_asset_deduction = taxable_assets * asset_percent
+    asset_active = np.ones(income_gross.shape, dtype=bool)
+    if asset_rule["minimum"] > 0:
+        asset_active &= raw_asset_deduction >= asset_rule["minimum"]
+    if asset_rule["maximum"] > 0:
+        asset_active &= raw_asset_deduction < asset_rule["maximum"]
+    slopes_federal["taxable_assets"] = np.zeros(income_gross.shape)
+    slopes_cantonal["taxable_assets"] = asset_active * asset_percent
+
+    ### Combine slopes with the marginal rates
+    result = {
+        name: slopes_federal[name] * federal_marginal_rate + slopes_cantonal[name] * cantonal_marginal_rate
+        for name in MARGINAL_SAVINGS_INPUTS
+    }
+    result["federal_marginal_rate"] = federal_marginal_rate
+    result["cantonal_marginal_rate"] = cantonal_marginal_rate
+
+    return pd.DataFrame(result, index=getattr(profiles, "index", None))
+
+
+def calculate_marginal_savings(tax_tables, **profile):
+    """
+    Calculate the tax saved by one more franc of each deductible input for one profile.
+
+    Parameters:
+        tax_tables (dict): compiled tax tables from total_income_tax.compile_tax_tables.
+        **profile: profile fields (income_gross, age, employed, marital_status,
+            number_of_children, contribution_pillar_3a, total_insurance_expenses,
+            travel_expenses_main_income, child_care_expenses_third_party,
+            is_two_income_couple, taxable_assets, child_education_expenses,
+            number_of_children_under_7, number_of_children_7_and_over,
+            commune, church_affiliation).
+
+    Returns:
+        dict: input name -> CHF saved per additional CHF, plus the marginal rates.
+    """
+
+    batch = {key: [value] for key, value in profile.items()}
+    row = calculate_marginal_savings_batch(batch, tax_tables).iloc[0]
+    return {key: float(value) for key, value in row.items()}
@@ -0,0 +1,492 @@
+# tax_calculations/shared_tax_tables.py
+
+# Import libraries
+import argparse                 # command line options (workers, profiles per worker)
+import json                     # layout of the segment, stored in its header
+import multiprocessing          # parent process check, barrier for the memory report
+import os                       # process id in the segment names
+import threading                # barrier timeout
+from concurrent.futures import ProcessPoolExecutor   # workers of the memory report
+from multiprocessing import resource_tracker, shared_memory   # shared segments
+
+import numpy as np              # zero-copy views on the shared segment
+
+# Backend modules
+import diagnostics.memory as memory
+
+
+##################################################################################################
+
+### Compiled tax tables in shared memory
+# Every process of a process pool (dataset generation, batch jobs) or every Streamlit server
+# process otherwise loads the CSV files, parses the deduction tables and compiles its own copy
+# of the tax tables. Instead, one process publishes the compiled tables once into a
+# multiprocessing.shared_memory segment and the other processes attach to it: the numeric
+# arrays are read-only NumPy views on the segment (no copy, no pandas, no CSV parsing).
+#
+# Segment layout (one segment per version, named "<prefix>_v<version>"):
+#   int64 version | int64 retired flag | int64 header length | header (JSON) | float64 arrays
+# The JSON header holds the offset and shape of every array and the non-numeric parts: the
+# commune names of the multiplier table and the names of the deduction rules. The deduction
+# rules (amount, percent, minimum, maximum per rule) are stored as one array per tax level and
+# turned back into the dicts expected by the vectorized deduction functions.
+#
+# Segments are named after the publishing process ("tax_tables_<pid>_v1", ...), so independent
+# jobs do not collide; the publisher owns the segments and removes them (unpublish_tax_tables).
+#
+# A small control segment per publication ("<prefix>_current", one int64) names the current
+# version. Workers look it up when they attach (init_worker), so a worker that the pool starts
+# after a reload gets the current tables, not the version the pool was created with.
+#
+# Reload: republish_tax_tables() writes the new tables into a new segment (version + 1), then
+# sets the current version in the control segment, and only then marks the old segment as
+# retired and removes its name. Processes that still use the old views keep a valid mapping;
+# refresh_tax_tables() moves them straight to the current version, also when they missed
+# several reloads (the versions in between may already be removed).
+# reload_tax_tables() reads the data files again (also the deduction rules, whose parse cache
+# is cleared first) and republishes them.
+#
+# Memory report with 16 workers (RSS per worker, before/after loading the tables and a batch):
+#   python -m tax_calculations.shared_tax_tables --workers 16
+
+DEFAULT_PREFIX = "tax_tables"
+FORMAT_VERSION = 1
+
+# Fixed part of the header: version, retired flag, header length (int64 each)
+_FIXED_HEADER_BYTES = 24
+_ALIGNMENT = 64
+
+# Fields of a parsed deduction rule (see optional_deductions.parse_deduction_rules)
+RULE_FIELDS = ("amount", "percent", "minimum", "maximum")
+
+
+# Segments published by this process (attaching to them must not touch their registration)
+_published = set()
+
+
+def segment_name(version, prefix):
+    """Name of the shared memory segment of one version of the tables."""
+    return f"{prefix}_v{version}"
+
+
+def control_name(prefix):
+    """Name of the control segment that holds the current version of a publication."""
+    return f"{prefix}_current"
+
+
+def _prefix(name):
+    """Publication prefix of a segment name ("tax_tables_123_v2" -> "tax_tables_123")."""
+    return name.rsplit("_v", 1)[0]
+
+
+def _set_current(control, version):
+    np.ndarray((1,), dtype=np.int64, buffer=control.buf)[0] = version
+
+
+def _numeric_arrays(tax_tables, federal_rules, cantonal_rules):
+    """Flatten the compiled tables and rules to path (tuple of keys) -> float64 array,
+    plus the non-numeric parts (commune names, rule names)."""
+    arrays = {}
+    for tax_class, schedule in tax_tables["federal"].items():
+        for key, values in schedule.items():
+            arrays[("federal", tax_class, key)] = values
+    for key, values in tax_tables["cantonal"].items():
+        arrays[("cantonal", key)] = values
+    for key, values in tax_tables["multipliers"].items():
+        if key != "commune":
+            arrays[("multipliers", key)] = values
+
+    rule_names = {}
+    for level, rules in (("federal", federal_rules), ("cantonal", cantonal_rules)):
+        rule_names[level] = list(rules)
+        arrays[("rules", level)] = np.array(
+            [[rules[name][field] for field in RULE_FIELDS] for name in rules], dtype=float
+        ).reshape(len(rules), len(RULE_FIELDS))
+
+    arrays = {path: np.ascontiguousarray(values, dtype=np.float64) for path, values in arrays.items()}
+    return arrays, [str(c) for c in tax_tables["multipliers"]["commune"]], rule_names
+
+
+def _create_segment(version, prefix, tax_tables, federal_rules, cantonal_rules):
+    """Create the segment of one version and copy the tables into it."""
+
+    arrays, communes, rule_names = _numeric_arrays(tax_tables, federal_rules, cantonal_rules)
+
+    # Offsets relative to the start of the data area
+    layout = []
+    offset = 0
+    for path, values in arrays.items():
+        layout.append({"path": list(path), "offset": offset, "shape": list(values.shape)})
+        offset += -(-values.nbytes // _ALIGNMENT) * _ALIGNMENT
+
+    header = json.dumps({
+        "format": FORMAT_VERSION,
+        "arrays": layout,
+        "communes": communes,
+        "rule_names": rule_names,
+        "rule_fields": list(RULE_FIELDS),
+    }).encode("utf-8")
+    data_start = -(-(_FIXED_HEADER_BYTES + len(header)) // _ALIGNMENT) * _ALIGNMENT
+
+    shm = shared_memory.SharedMemory(name=segment_name(version, prefix), create=True, size=data_start + max(offset, 1))
+    fixed = np.ndarray((3,), dtype=np.int64, buffer=shm.buf)
+    fixed[:] = (version, 0, len(header))
+    shm.buf[_FIXED_HEADER_BYTES:_FIXED_HEADER_BYTES + len(header)] = header
+    for entry, values in zip(layout, arrays.values()):
+        np.ndarray(entry["shape"], dtype=np.float64, buffer=shm.buf, offset=data_start + entry["offset"])[...] = values
+    del fixed
+    return shm
+
+
+def publish_tax_tables(tax_tables, federal_rules, cantonal_rules, version=1, prefix=None):
+    """
+    Publish the compiled tax tables and deduction rules into a new shared memory segment.
+
+    Parameters:
+        tax_tables (dict): compiled tables (total_income_tax.compile_tax_tables).
+        federal_rules, cantonal_rules (dict): parsed deduction rules (optional_deductions.get_deduction_rules).
+        version (int): version tag of this publication.
+        prefix (str or None): segment name prefix (default: "tax_tables_<pid>").
+
+    Returns:
+        dict: publication with "name" (pass it to attach_tax_tables or init_worker), "version",
+              "prefix", "shm" (the segment) and "control" (the control segment), both owned by
+              the publishing process.
+    """
+    if prefix is None:
+        prefix = f"{DEFAULT_PREFIX}_{os.getpid()}"
+    shm = _create_segment(version, prefix, tax_tables, federal_rules, cantonal_rules)
+    _published.add(shm.name)
+    control = shared_memory.SharedMemory(name=control_name(prefix), create=True, size=8)
+    _published.add(control.name)
+    _set_current(control, version)
+    return {"name": shm.name, "version": version, "prefix": prefix, "shm": shm, "control": control}
+
+
+def _retire(shm):
+    """Mark a segment as retired, then close it and remove its name."""
+    np.ndarray((3,), dtype=np.int64, buffer=shm.buf)[1] = 1
+    shm.close()
+    shm.unlink()
+    _published.discard(shm.name)
+
+
+def republish_tax_tables(publication, tax_tables, federal_rules, cantonal_rules):
+    """
+    Publish reloaded tables as the next version and retire the previous segment.
+
+    The new segment is complete and named in the control segment before the old one is
+    marked as retired, so a process that sees the retired flag always finds the current version.
+
+    Returns:
+        dict: the new publication (see publish_tax_tables).
+    """
+    version = publication["version"] + 1
+    shm = _create_segment(version, publication["prefix"], tax_tables, federal_rules, cantonal_rules)
+    _published.add(shm.name)
+    _set_current(publication["control"], version)
+    _retire(publication["shm"])
+    return {**publication, "name": shm.name, "version": version, "shm": shm}
+
+
+def reload_tax_tables(publication):
+    """
+    Read the tax tables and deduction rules from the data files again and republish them.
+
+    Returns:
+        dict: the new publication (see republish_tax_tables).
+    """
+    import deductions.optional_deductions as od
+
+    od.clear_deduction_rules_cache()
+    tables = _load_private_tables()
+    return republish_tax_tables(
+        publication, tables["tax_tables"], tables["federal_deduction_rules"], tables["cantonal_deduction_rules"]
+    )
+
+
+def unpublish_tax_tables(publication):
+    """Retire the segment and remove the control segment of a publication (call once the workers are done)."""
+    _retire(publication["shm"])
+    control = publication["control"]
+    control.close()
+    control.unlink()
+    _published.discard(control.name)
+
+
+##################################################################################################
+
+### Attaching from worker processes
+
+
+def _open_segment(name):
+    """Open an existing segment (FileNotFoundError if it was removed)."""
+    shm = shared_memory.SharedMemory(name=name)
+
+    # A process that is not a child of the publisher has its own resource tracker, which would
+    # remove the segment when this process exits; the publisher owns the segment
+    if multiprocessing.parent_process() is None and shm.name not in _published:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def current_version(prefix):
+    """Current version of a publication, read from its control segment."""
+    control = _open_segment(control_name(prefix))
+    version = int(np.ndarray((1,), dtype=np.int64, buffer=control.buf)[0])
+    control.close()
+    return version
+
+
+def attach_current_tax_tables(prefix):
+    """
+    Attach to the current version of a publication (see attach_tax_tables).
+
+    If that version is retired and removed between the lookup and the attach, the lookup is
+    repeated; FileNotFoundError once the publication itself was removed.
+    """
+    while True:
+        version = current_version(prefix)
+        try:
+            return attach_tax_tables(segment_name(version, prefix))
+        except FileNotFoundError:
+            continue
+
+
+def attach_tax_tables(name):
+    """
+    Attach to a published segment and return the tables as read-only views on it.
+
+    Parameters:
+        name (str): segment name (publication["name"]).
+
+    Returns:
+        dict: "tax_tables" (same structure as compile_tax_tables), "federal_deduction_rules",
+              "cantonal_deduction_rules", "version", "prefix", "name" and "shm".
+    """
+
+    shm = _open_segment(name)
+    version, _, header_length = (int(v) for v in np.ndarray((3,), dtype=np.int64, buffer=shm.buf))
+    header = json.loads(bytes(shm.buf[_FIXED_HEADER_BYTES:_FIXED_HEADER_BYTES + header_length]))
+    if header["format"] != FORMAT_VERSION:
+        shm.close()
+        raise ValueError(f"Unsupported shared tax table format: {header['format']}")
+    data_start = -(-(_FIXED_HEADER_BYTES + header_length) // _ALIGNMENT) * _ALIGNMENT
+
+    views = {}
+    for entry in header["arrays"]:
+        view = np.ndarray(entry["shape"], dtype=np.float64, buffer=shm.buf, offset=data_start + entry["offset"])
+        view.flags.writeable = False
+        views[tuple(entry["path"])] = view
+
+    tax_tables = {"federal": {}, "cantonal": {}, "multipliers": {"commune": np.array(header["communes"], dtype=object)}}
+    for path, view in views.items():
+        if path[0] == "federal":
+            tax_tables["federal"].setdefault(path[1], {})[path[2]] = view
+        elif path[0] in ("cantonal", "multipliers"):
+            tax_tables[path[0]][path[1]] = view
+
+    rules = {
+        level: {
+            rule: dict(zip(header["rule_fields"], (float(v) for v in views[("rules", level)][i])))
+            for i, rule in enumerate(names)
+        }
+        for level, names in header["rule_names"].items()
+    }
+
+    return {
+        "name": name,
+        "version": version,
+        "prefix": _prefix(name),
+        "tax_tables": tax_tables,
+        "federal_deduction_rules": rules["federal"],
+        "cantonal_deduction_rules": rules["cantonal"],
+        "shm": shm,
+    }
+
+
+def detach_tax_tables(attached):
+    """
+    Release the views and the mapping of an attached segment.
+
+    The mapping stays open if the caller still holds views (e.g. a tax_tables dict); it is
+    then released once those are gone.
+    """
+    shm = attached.pop("shm", None)
+    attached.pop("tax_tables", None)
+    if shm is not None:
+        try:
+            shm.close()
+        except BufferError:
+            pass
+
+
+def is_retired(attached):
+    """True if a newer version of the tables was published."""
+    return bool(np.ndarray((3,), dtype=np.int64, buffer=attached["shm"].buf)[1])
+
+
+def refresh_tax_tables(attached):
+    """
+    Move to the current version (control segment) if the attached one was retired.
+
+    Returns:
+        dict: the attached tables (the same dict if they are still current).
+    """
+    while is_retired(attached):
+        newer = attach_current_tax_tables(attached["prefix"])
+        detach_tax_tables(attached)
+        attached = newer
+    return attached
+
+
+# Tables of a worker process, set once by init_worker
+_worker_tables = None
+
+
+def init_worker(name):
+    """
+    Process pool initializer: attach to the published tables once per worker.
+
+    name is the name of any version of the publication (e.g. publication["name"] when the
+    pool was created); the worker attaches to the version that is current when it starts.
+    """
+    global _worker_tables
+    _worker_tables = attach_current_tax_tables(_prefix(name))
+
+
+def worker_tax_tables():
+    """The current tables of a worker process (after a reload: the new version)."""
+    global _worker_tables
+    _worker_tables = refresh_tax_tables(_worker_tables)
+    return _worker_tables
+
+
+##################################################################################################
+
+### Memory report: per-worker RSS with private tables vs. shared tables
+
+
+def _load_private_tables():
+    """What every worker does without shared memory: load the CSV files, parse and compile."""
+    import loaders.load_datasets as datasets
+    import deductions.optional_deductions as od
+    import tax_calculations.total_income_tax as t
+
+    return {
+        "tax_tables": t.compile_tax_tables(
+            datasets.load_federal_tax_rates(),
+            datasets.load_cantonal_base_tax_rates(),
+            datasets.load_cantonal_municipal_church_multipliers(),
+        ),
+        "federal_deduction_rules": od.get_deduction_rules("federal"),
+        "cantonal_deduction_rules": od.get_deduction_rules("cantonal"),
+    }
+
+
+# Memory of a report worker, set by _init_report_worker
+_report_worker = {}
+
+
+def _init_report_worker(mode, name, barrier):
+    _report_worker["before"] = memory.memory_usage_kib()
+    if mode == "shared":
+        init_worker(name)
+        _report_worker["tables"] = _worker_tables
+    else:
+        _report_worker["tables"] = _load_private_tables()
+    _report_worker["after_tables"] = memory.memory_usage_kib()
+    _report_worker["barrier"] = barrier
+
+
+def _report_task(profiles):
+    import tax_calculations.batch_income_tax as bt
+
+    tables = _report_worker["tables"]
+    bt.calculate_income_tax_batch(
+        profiles, tables["tax_tables"], tables["federal_deduction_rules"], tables["cantonal_deduction_rules"]
+    )
+    after_batch = memory.memory_usage_kib()
+
+    # Every worker takes exactly one task: wait until all workers have one
+    try:
+        _report_worker["barrier"].wait(timeout=60)
+    except threading.BrokenBarrierError:
+        pass
+    return {
+        "pid": os.getpid(),
+        "before": _report_worker["before"],
+        "after_tables": _report_worker["after_tables"],
+        "after_batch": after_batch,
+    }
+
+
+def measure_worker_memory(workers=16, profiles_per_worker=10_000, seed=0):
+    """
+    Per-worker RSS with private tables (every worker loads the CSV files) and with shared tables.
+
+    Parameters:
+        workers (int): number of worker processes.
+        profiles_per_worker (int): size of the batch every worker calculates.
+        seed (int): seed of the random profiles.
+
+    Returns:
+        dict: mode ("private", "shared") -> list of per-worker dicts with "pid" and the memory
+              ("rss", "rss_anon", "rss_shmem" in KiB) "before" and "after_tables" (in the
+              initializer) and "after_batch".
+    """
+
+    import loaders.load_datasets as datasets
+    import deductions.optional_deductions as od
+    import tax_calculations.total_income_tax as t
+    import diagnostics.differential_check as dc
+
+    multipliers = datasets.load_cantonal_municipal_church_multipliers()
+    tax_tables = t.compile_tax_tables(
+        datasets.load_federal_tax_rates(), datasets.load_cantonal_base_tax_rates(), multipliers
+    )
+    profiles = dc.random_profiles(
+        np.random.default_rng(seed), profiles_per_worker, multipliers["commune"].tolist()
+    )
+
+    # Workers are started with "spawn": a fresh interpreter, as a separate server process would be
+    context = multiprocessing.get_context("spawn")
+    publication = publish_tax_tables(tax_tables, od.get_deduction_rules("federal"), od.get_deduction_rules("cantonal"))
+    report = {}
+    try:
+        for mode in ("private", "shared"):
+            barrier = context.Barrier(workers)
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_report_worker,
+                                     initargs=(mode, publication["name"], barrier)) as pool:
+                report[mode] = list(pool.map(_report_task, [profiles] * workers))
+    finally:
+        unpublish_tax_tables(publication)
+    return report
+
+
+def format_memory_report(report):
+    """Text table: average per-worker memory (MiB) per mode and stage, and the total of all workers."""
+
+    lines = [f"{'mode':<8} {'stage':<13} {'RSS/worker':>11} {'private':>9} {'shared':>8} {'RSS total':>10}"]
+    for mode, workers in report.items():
+        for stage in ("before", "after_tables", "after_batch"):
+            values = [w[stage] for w in workers]
+
+            def mean_mib(field):
+                known = [v[field] for v in values if v[field] is not None]
+                return f"{sum(known) / len(known) / 1024:.1f}" if known else "n/a"
+
+            total = sum(v["rss"] for v in values) / 1024
+            lines.append(f"{mode:<8} {stage:<13} {mean_mib('rss'):>11} {mean_mib('rss_anon'):>9} "
+                         f"{mean_mib('rss_shmem'):>8} {total:>10.1f}")
+    lines.append(f"({len(next(iter(report.values())))} workers, MiB)")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-worker memory with private vs. shared tax tables.")
+    parser.add_argument("--workers", type=int, default=16, help="number of worker processes")
+    parser.add_argument("--profiles", type=int, default=10_000, help="profiles calculated per worker")
+    args = parser.parse_args()
+
+    print(format_memory_report(measure_worker_memory(args.workers, args.profiles)))
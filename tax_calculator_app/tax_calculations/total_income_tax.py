@@ -1,5 +1,8 @@
 # tax_calculations/total_income_tax.py
 
+# Import libraries
+import numpy as np              # rounding of the vectorized results
+
 # Backend modules
 import tax_calculations.federal_tax as fed
 import tax_calculations.canton_municipal_church_tax as can
@@ -77,6 +80,29 @@ def calculation_total_income_tax(
         church_affiliation
     )
 
+    return combine_income_tax_components(
+        federal_tax,
+        base_income_tax_cantonal,
+        (total_canton_municipal_church, tax_canton, tax_commune, tax_church),
+    )
+
+
+def combine_income_tax_components(federal_tax, base_income_tax_cantonal, cantonal_municipal_church_tax):
+    """
+    Sum the tax layers and build the result of calculation_total_income_tax().
+
+    Parameters:
+        federal_tax (float): federal income tax
+        base_income_tax_cantonal (float): cantonal base tax (before multipliers)
+        cantonal_municipal_church_tax (tuple): (total, cantonal, municipal, church tax)
+            as returned by calculation_cantonal_municipal_church_tax
+
+    Returns:
+        dict: rounded tax values for each component and the total income tax.
+    """
+
+    total_canton_municipal_church, tax_canton, tax_commune, tax_church = cantonal_municipal_church_tax
+
     ### Sum all tax categories
     total_income_tax = federal_tax + total_canton_municipal_church
 
@@ -95,3 +121,87 @@ def calculation_total_income_tax(
 
     ### Return all individual categories + total income tax
     return income_tax
+
+
+##################################################################################################
+
+### Compile all tax tables
+# Batch calculations work on the compiled (NumPy) form of the three tax tables.
+# They are compiled once and passed around as one dictionary.
+
+
+def compile_tax_tables(
+    tax_rates_federal,
+    tax_rates_cantonal,
+    tax_multiplicators_cantonal_municipal,
+    ):
+    """
+    Compile the federal, cantonal and multiplier tables for batch calculations.
+
+    Parameters:
+        tax_rates_federal (DataFrame): federal income tax rates
+        tax_rates_cantonal (DataFrame): cantonal base income tax rates
+        tax_multiplicators_cantonal_municipal (DataFrame): multipliers for cantonal/municipal/church tax
+
+    Returns:
+        dict: "federal", "cantonal" and "multipliers" compiled tables.
+    """
+
+    return {
+        "federal": fed.compile_federal_tax_schedule(tax_rates_federal),
+        "cantonal": base.compile_cantonal_tax_schedule(tax_rates_cantonal),
+        "multipliers": can.compile_multiplier_table(tax_multiplicators_cantonal_municipal),
+    }
+
+
+def calculation_total_income_tax_vectorized(
+    tax_tables,                             # compiled tax tables (compile_tax_tables)
+    marital_status,                         # array of "single" / "married"
+    number_of_children,                     # array of dependent children counts
+    income_net_federal,                     # array of federal net incomes
+    income_net_cantonal,                    # array of cantonal net incomes
+    commune,                                # array of communes
+    church_affiliation,                     # array of church affiliations (None / "none" = no church)
+    decimals=2,                             # rounding as in the scalar function (None = unrounded)
+    ):
+    """
+    Vectorized version of calculation_total_income_tax() for many taxpayers at once.
+
+    Parameters:
+        tax_tables (dict): compiled tax tables from compile_tax_tables
+        marital_status, number_of_children, income_net_federal, income_net_cantonal,
+        commune, church_affiliation (array-like): one value per taxpayer
+        decimals (int or None): number of decimals to round to, None for unrounded values
+
+    Returns:
+        dict: same keys as calculation_total_income_tax(), one NumPy array per key.
+    """
+
+    federal_tax = fed.calculation_income_tax_federal_vectorized(
+        tax_tables["federal"], marital_status, number_of_children, income_net_federal
+    )
+    base_income_tax_cantonal = base.calculation_income_tax_base_SG_vectorized(
+        tax_tables["cantonal"], income_net_cantonal
+    )
+    (
+        total_canton_municipal_church,
+        tax_canton,
+        tax_commune,
+        tax_church
+    ) = can.calculation_cantonal_municipal_church_tax_vectorized(
+        tax_tables["multipliers"], base_income_tax_cantonal, commune, church_affiliation
+    )
+
+    income_tax = {
+        "federal_tax": federal_tax,
+        "cantonal_base_tax": base_income_tax_cantonal,
+        "cantonal_tax": tax_canton,
+        "municipal_tax": tax_commune,
+        "church_tax": tax_church,
+        "total_cantonal_municipal_church_tax": total_canton_municipal_church,
+        "total_income_tax": federal_tax + total_canton_municipal_church}
+
+    if decimals is not None:
+        income_tax = {key: np.round(value, decimals) for key, value in income_tax.items()}
+
+    return income_tax
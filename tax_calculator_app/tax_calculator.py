@@ -4,16 +4,34 @@
 import streamlit as st          # streamlit to create UI 
 import pandas as pd             # pandas for data handling
 import time                     # time used in loading/progress animation
-import plotly.express as px     # plotly used to create pie and bar charts 
-import joblib                   # loads ML-models 
 import os                       # builds file paths that work in multiple operating systems
+# plotly.express (charts) and joblib/sklearn (ML models) are imported on first use after
+# "Calculate", so a new session only loads what the input form needs
 
 
 # Backend modules
-import loaders.load_datasets as datasets
-import deductions.mandatory_deductions as md
-import deductions.optional_deductions as od
-import tax_calculations.total_income_tax as t
+import loaders.startup as startup
+import loaders.warmup as warmup
+import loaders.paths as paths
+import tax_calculations.calculation_pipeline as cp
+import tax_calculations.marginal_savings as ms
+import analysis.prediction_cache as pc
+import diagnostics.profiling as profiling
+import diagnostics.metrics as metrics
+
+
+### Profile this rerun (only if enabled through TAX_APP_PROFILE, see diagnostics/profiling.py)
+profiling_session = profiling.start_profiling("streamlit_rerun")
+
+
+### Metrics endpoint / file (only if enabled through TAX_APP_METRICS_PORT or TAX_APP_METRICS_FILE,
+### see diagnostics/metrics.py), started once per server process
+@st.cache_resource
+def start_metrics_exporters():
+    '''Start the configured metrics exporters.'''
+    return metrics.start_exporters_from_env()
+
+start_metrics_exporters()
 
 
 ##################################################################################################
@@ -21,16 +39,25 @@ import tax_calculations.total_income_tax as t
 
 ### Load data
 
-# Load tax rate tables and multipliers used for all calculations
-tax_rates_federal = datasets.load_federal_tax_rates()
-tax_rates_cantonal = datasets.load_cantonal_base_tax_rates()
-tax_multiplicators_cantonal_municipal = datasets.load_cantonal_municipal_church_multipliers()
+# Load tax rate tables, multipliers (API + CSV fallback) and deduction rules concurrently,
+# once per server process (see loaders/startup.py)
+@st.cache_resource
+def load_app_context():
+    '''Load all datasets on a thread pool and return them as one context dictionary.'''
+    return startup.load_app_context()
+
+app_context = load_app_context()
+
+# Tax rate tables and multipliers used for all calculations
+tax_rates_federal = app_context["tax_rates_federal"]
+tax_rates_cantonal = app_context["tax_rates_cantonal"]
+tax_multiplicators_cantonal_municipal = app_context["tax_multiplicators_cantonal_municipal"]
 
-# Load validated communal multipliers (API + CSV fallback)
-communal_multipliers = datasets.load_communal_multipliers_validated()
+# List of commune names for the dropdown (validated communal multipliers)
+communes = app_context["communes"]
 
-# List of commune names for the dropdown
-communes = communal_multipliers["commune"].tolist()
+# Compiled (array) form of the tax tables, used for the exact marginal savings and the commune comparison
+tax_tables = app_context["tax_tables"]
 
 
 ### Load ML models for deduction savings
@@ -40,24 +67,45 @@ def load_savings_models():
       - Pillar 3a contributions
       - Childcare expenses (third-party)
       - Insurance premiums & savings interest
-    Models were trained offline and saved here:
+    Models were trained offline and saved here (tax_calculator_app/models, see loaders/paths.py):
       models/savings_delta_3a.pkl
       models/savings_delta_childcare.pkl
       models/savings_delta_insurance.pkl'''
 
+    # Imported here: unpickling the models also imports sklearn, the slowest import of the app
+    import joblib
+
     # Create empty dictionary
     models = {}     
 
     # Load individual models and save them in the dictionary                                                                  
-    models["delta_3a"] = joblib.load("models/savings_delta_3a.pkl")
-    models["delta_childcare"] = joblib.load("models/savings_delta_childcare.pkl")
-    models["delta_insurance"] = joblib.load("models/savings_delta_insurance.pkl")
+    with metrics.timed("tax_app_load_seconds", load="savings_models"):
+        models["delta_3a"] = joblib.load(paths.model_path("savings_delta_3a.pkl"))
+        models["delta_childcare"] = joblib.load(paths.model_path("savings_delta_childcare.pkl"))
+        models["delta_insurance"] = joblib.load(paths.model_path("savings_delta_insurance.pkl"))
     
     # Return the dictionary 
     return models
 
-# Load models once and reuse
-savings_models = load_savings_models()
+# Models are loaded on the first calculation (cached afterwards), not at startup
+
+
+### Prediction cache for the ML models, shared by all sessions (see analysis/prediction_cache.py)
+@st.cache_resource
+def load_prediction_cache():
+    '''Create the LRU cache of savings predictions, keyed by the rounded features.'''
+    return pc.create_prediction_cache()
+
+
+### Warm-up (see loaders/warmup.py): the models, the prediction cache, a few calculations and the
+### charts are prepared in the background, once per server process, while the first user fills in
+### the form (TAX_APP_WARMUP=off disables it)
+if os.environ.get("TAX_APP_WARMUP", "on").strip().lower() != "off":
+    warmup.start_warm_up(
+        load_context=load_app_context,
+        load_models=load_savings_models,
+        load_prediction_cache=load_prediction_cache,
+    )
 
 
 ##################################################################################################
@@ -67,6 +115,9 @@ savings_models = load_savings_models()
 # Create sidebar
 st.sidebar.success("Welcome to the St. Gallen tax calculator!")
 
+# Exact ML estimates skip the prediction cache (amounts are otherwise rounded to CHF 100 for the models)
+exact_ml_estimates = st.sidebar.checkbox("Exact ML estimates (skip prediction cache)", value=False)
+
 # Add title and infobox
 st.title("🧮 St. Gallen Tax Calculator 2025")
 st.info("With this app you can calculate your income tax and find out where you have the potential of saving money by finding potential tax saving options!")
@@ -142,8 +193,8 @@ with st.container():
 # Create button to trigger calculation
 calc = st.button("Calculate", type="primary")
 
-# Loading bar animation
-if calc:
+# Loading bar animation (TAX_APP_LOADING_ANIMATION=off skips it, e.g. for load tests)
+if calc and os.environ.get("TAX_APP_LOADING_ANIMATION", "on").strip().lower() != "off":
     placeholder = st.empty()
     time.sleep(1)
 
@@ -164,6 +215,9 @@ if calc:
 
 # Determine deductions
 if calc:
+    # Latency of the calculation (without the loading animation above), see diagnostics/metrics.py
+    calculation_start = time.perf_counter()
+
     # normalize inputs to match backend expectations
     marital_status_norm = "married" if marital_status.lower().startswith("m") else "single"
 
@@ -176,67 +230,45 @@ if calc:
     }
     church_affiliation_norm = church_map.get(church_affiliation, None)
 
-    # Calculate mandatory deductions 
-    # through functions in deductions/mandatory_deductions.py
-    social_deductions_total = md.get_total_social_deductions(income_gross, employed)
-    bv_minimal_contribution = md.get_mandatory_pension_contribution(income_gross, age)
-    total_mandatory_deductions = md.get_total_mandatory_deductions(income_gross, age, employed)
-
-    # Calculate optional deductions - federal 
-    # through function in deductions/optional_deductions.py
-    federal_optional_deductions = od.calculate_federal_optional_deductions(
-        income_gross,
-        employed,
-        marital_status_norm,
-        number_of_children,
-        contribution_pillar_3a,
-        total_insurance_expenses,
-        travel_expenses_main_income,
-        child_care_expenses_third_party,
-    )
-    total_optimal_deduction_federal = federal_optional_deductions.get("total_federal_optional_deductions", 0)
-
-    # Calculate optional deductions - cantonal 
-    # through function in deductions/optional_deductions.py
-    cantonal_optional_deduction = od.calculate_cantonal_optional_deductions(
-        income_gross,
-        employed,
-        marital_status_norm,
-        number_of_children,
-        contribution_pillar_3a,
-        total_insurance_expenses,
-        travel_expenses_main_income,
-        child_care_expenses_third_party,
-        is_two_income_couple,
-        taxable_assets,
-        child_education_expenses,
-        number_of_children_under_7,
-        number_of_children_7_and_over,
-    )
-    total_optional_deduction_cantonal = cantonal_optional_deduction.get("total_cantonal_optional_deductions", 0)
-
-    # Net income calculation on federal and cantonal level
-    income_net_federal = income_gross - (total_mandatory_deductions + total_optimal_deduction_federal)
-    income_net_cantonal = income_gross - (total_mandatory_deductions + total_optional_deduction_cantonal)
-
-    # Compute various tax categories through the function within tax_calculations/total_income_tax.py
-    income_tax_dictionary = t.calculation_total_income_tax(
-        tax_rates_federal,
-        tax_rates_cantonal,
-        tax_multiplicators_cantonal_municipal,
-        marital_status=marital_status_norm,
-        number_of_children=number_of_children,
-        income_net_federal=income_net_federal,
-        income_net_cantonal=income_net_cantonal,
-        commune=commune,
-        church_affiliation=church_affiliation_norm,
-    )
+    # Profile fields used by the calculation stages and the ML models (same fields as the training dataset)
+    features_for_ml = {
+        "income_gross": income_gross,
+        "age": age,
+        "employed": employed,  # bool, same as in dataset
+        "marital_status": marital_status_norm,
+        "is_two_income_couple": is_two_income_couple,  # bool
+        "number_of_children_under_7": number_of_children_under_7,
+        "number_of_children_7_and_over": number_of_children_7_and_over,
+        "number_of_children": number_of_children,
+        "commune": commune,
+        "church_affiliation": church_affiliation_norm or "none",
+        "contribution_pillar_3a": contribution_pillar_3a,
+        "total_insurance_expenses": total_insurance_expenses,
+        "travel_expenses_main_income": travel_expenses_main_income,
+        "child_care_expenses_third_party": child_care_expenses_third_party,
+        "taxable_assets": taxable_assets,
+        "child_education_expenses": child_education_expenses}
+    calculation_inputs = {**features_for_ml, "exact_ml_estimates": exact_ml_estimates}
+
+    # Memoized calculation stages of this session: only stages whose inputs changed since the
+    # last calculation are recomputed (see tax_calculations/calculation_pipeline.py)
+    pipeline_state = st.session_state.setdefault("calculation_pipeline", cp.create_pipeline_state())
+    misses_before = {name: stats["misses"] for name, stats in pipeline_state["stats"].items()}
+
+    # Mandatory deductions (deductions/mandatory_deductions.py), optional deductions
+    # (deductions/optional_deductions.py), net incomes and the tax components
+    # (tax_calculations/), each as one stage of the pipeline
+    stage_results = cp.run_pipeline(calculation_inputs, app_context, pipeline_state, targets=["income_tax"])
+    income_tax_dictionary = stage_results["income_tax"]
 
 
 ##################################################################################################
 
     # Show results in the app 
 
+    # Charting library, only needed once results are shown
+    import plotly.express as px
+
     # We only want these four tax categories in the breakdown:
     component_keys = ["federal_tax", "cantonal_tax", "municipal_tax", "church_tax"]
 
@@ -295,41 +327,26 @@ if calc:
         # Create header 
         st.write("### Tax-saving opportunities")
 
-        # Build feature row dictionary equivalent to the training dataset
-        features_for_ml = {
-            "income_gross": income_gross,
-            "age": age,
-            "employed": employed,  # bool, same as in dataset
-            "marital_status": marital_status_norm,
-            "is_two_income_couple": is_two_income_couple,  # bool
-            "number_of_children_under_7": number_of_children_under_7,
-            "number_of_children_7_and_over": number_of_children_7_and_over,
-            "number_of_children": number_of_children,
-            "commune": commune,
-            "church_affiliation": church_affiliation_norm or "none",
-            "contribution_pillar_3a": contribution_pillar_3a,
-            "total_insurance_expenses": total_insurance_expenses,
-            "travel_expenses_main_income": travel_expenses_main_income,
-            "child_care_expenses_third_party": child_care_expenses_third_party,
-            "taxable_assets": taxable_assets,
-            "child_education_expenses": child_education_expenses}
-
-        # Create DataFrame containing the features from the dictionary 
-        df_features = pd.DataFrame([features_for_ml])
+        # Load models once and reuse (cached by st.cache_resource)
+        savings_models = load_savings_models()
+        prediction_cache = load_prediction_cache()
+        ml_context = {**app_context, "savings_models": savings_models, "prediction_cache": prediction_cache}
+
+        # Exact tax saved by one more franc of each deductible input at the current position, and
+        # the predicted savings if user maxed out the deduction (repeated or near-identical
+        # profiles are answered from the prediction cache)
+        stage_results = cp.run_pipeline(
+            calculation_inputs, ml_context, pipeline_state, targets=["marginal_savings", "ml_savings_predictions"]
+        )
+        marginal_savings = stage_results["marginal_savings"]
+        predictions = stage_results["ml_savings_predictions"]
 
         # Create empty dictionary for ML predictions
         raw_preds = {}
 
-        # Loop through ML models once per model 
-        for key, model in savings_models.items():
-            try:
-                # Try to predict potential savings if user maxed out the deduction 
-                # Returns a NumPy array which we convert to float 
-                pred = float(model.predict(df_features)[0])
-            except Exception:
-                pred = 0.0
-            # Prevent negative savings
-            raw_preds[key] = max(0.0, pred)  
+        # Failed predictions count as 0, negative savings are prevented
+        for key, pred in predictions.items():
+            raw_preds[key] = max(0.0, pred if pred is not None else 0.0)
 
         # Create dictionary with adjusted labels for each model 
         models_adjusted = {
@@ -352,28 +369,26 @@ if calc:
             # Sort by potential saving, descending
             items.sort(key=lambda x: x[1], reverse=True)
 
+            # Input field behind each model, used to look up its exact marginal saving
+            models_inputs = {
+                "Pillar 3a contributions": "contribution_pillar_3a",
+                "Childcare expenses (third-party)": "child_care_expenses_third_party",
+                "Insurance premiums & savings interest": "total_insurance_expenses"}
+
             # Build data for chart
             chart_rows = []
             for label, amount in items:
-                if amount > 2000:
-                    level = "High"
-                elif amount > 500:
-                    level = "Medium"
-                else:
-                    level = "Low"
-
                 chart_rows.append(
                     {
                         "Deduction": label,
                         "Estimated savings": amount,
-                        "Level": level,
-                        "Level_label": f"{level} potential",
+                        "Saving per extra CHF 100": 100 * marginal_savings[models_inputs[label]],
                     }
                 )
 
             chart_df = pd.DataFrame(chart_rows)
 
-            # Create orizontal bar chart, colored by potential level
+            # Create horizontal bar chart, colored by the exact saving per additional CHF 100
             chart_df_sorted = chart_df.sort_values("Estimated savings")
 
             fig = px.bar(
@@ -381,16 +396,12 @@ if calc:
                 x="Estimated savings",
                 y="Deduction",
                 orientation="h",
-                color="Level",
-                color_discrete_map={
-                    "High": "green",
-                    "Medium": "yellow",
-                    "Low": "red",
-                },
+                color="Saving per extra CHF 100",
+                color_continuous_scale="Greens",
                 labels={
                     "Estimated savings": "Estimated savings (CHF)",
                     "Deduction": "",
-                    "Level": "Potential level",
+                    "Saving per extra CHF 100": "CHF saved per extra CHF 100",
                 },
                 title="Estimated tax-saving potential by deduction",
             )
@@ -409,10 +420,135 @@ if calc:
             for row in sorted(chart_rows, key=lambda r: r["Estimated savings"], reverse=True):
                 label = row["Deduction"]
                 amount = row["Estimated savings"]
-                level = row["Level"]
+                per_100 = row["Saving per extra CHF 100"]
+
+                if per_100 > 0:
+                    marginal_text = f"each additional CHF 100 currently saves **CHF {per_100:,.2f}**"
+                else:
+                    marginal_text = "an additional franc currently saves no tax (legal maximum reached)"
 
                 st.write(
-                    f"- **{label}**: {level} potential – "
+                    f"- **{label}**: {marginal_text}; "
                     f"estimated savings up to **CHF {amount:,.0f}** "
                     f"if this deduction is fully used (subject to legal limits).")
-       
\ No newline at end of file
+
+            # Share of ML estimates answered from the prediction cache (all sessions)
+            cache_stats = pc.cache_stats(prediction_cache)
+            if exact_ml_estimates:
+                st.caption("ML estimates calculated from the exact inputs (prediction cache skipped).")
+            else:
+                st.caption(
+                    f"ML estimates based on amounts rounded to CHF {prediction_cache['resolution']['income_gross']:g}. Prediction cache: "
+                    f"{cache_stats['hit_rate']:.0%} hits ({cache_stats['hits']} of {cache_stats['hits'] + cache_stats['misses']})."
+                )
+
+        # Exact marginal savings for every deductible input
+        st.write("#### Tax saved per additional CHF 100")
+        marginal_labels = {
+            "contribution_pillar_3a": "Pillar 3a contributions",
+            "total_insurance_expenses": "Insurance premiums & savings interest",
+            "travel_expenses_main_income": "Commuting / travel expenses",
+            "child_care_expenses_third_party": "Childcare expenses (third-party)",
+            "child_education_expenses": "Child education expenses",
+            "taxable_assets": "Taxable assets (asset management deduction)",
+        }
+        st.dataframe(
+            pd.DataFrame({
+                "Input": [marginal_labels[k] for k in ms.MARGINAL_SAVINGS_INPUTS],
+                "Tax saved per extra CHF 100": [round(100 * marginal_savings[k], 2) for k in ms.MARGINAL_SAVINGS_INPUTS],
+            }),
+            hide_index=True,
+            use_container_width=True,
+        )
+
+
+##################################################################################################
+
+
+        ### Commune comparison
+        # Same profile in every commune of St. Gallen, cheapest commune first
+        st.write("### Compare all communes")
+
+        commune_comparison = cp.run_pipeline(
+            calculation_inputs, app_context, pipeline_state, targets=["commune_comparison"]
+        )["commune_comparison"]
+        cheapest = commune_comparison.iloc[0]
+        current = commune_comparison[commune_comparison["commune"] == commune].iloc[0]
+
+        if current["difference_to_cheapest"] > 0:
+            st.write(
+                f"With the same income and deductions, **{cheapest['commune']}** would be the cheapest commune: "
+                f"CHF {cheapest['total_income_tax']:,.0f}, i.e. **CHF {current['difference_to_cheapest']:,.0f} less** "
+                f"than in {commune} (rank {current['rank']} of {len(commune_comparison)})."
+            )
+        else:
+            st.write(f"**{commune}** is already the cheapest commune for this profile.")
+
+        # Bar chart of the total tax per commune, the selected commune highlighted
+        commune_chart_df = commune_comparison.assign(
+            selection=lambda df: df["commune"].eq(commune).map({True: "Your commune", False: "Other communes"})
+        )
+        fig = px.bar(
+            commune_chart_df,
+            x="commune",
+            y="total_income_tax",
+            color="selection",
+            color_discrete_map={"Your commune": "#d62728", "Other communes": "#2ca02c"},
+            labels={"commune": "", "total_income_tax": "Total income tax (CHF)", "selection": ""},
+            title="Total income tax by commune",
+        )
+        fig.update_layout(
+            yaxis_tickprefix="CHF ",
+            xaxis={"categoryorder": "total ascending"},
+            margin=dict(l=10, r=10, t=40, b=40),
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+        # Full ranking (columns can be sorted by clicking the header)
+        st.dataframe(
+            commune_comparison[[
+                "rank", "commune", "total_income_tax", "municipal_tax", "church_tax", "difference_to_current",
+            ]].rename(columns={
+                "rank": "Rank",
+                "commune": "Commune",
+                "total_income_tax": "Total tax (CHF)",
+                "municipal_tax": "Municipal tax (CHF)",
+                "church_tax": "Church tax (CHF)",
+                "difference_to_current": "Difference to your commune (CHF)",
+            }),
+            hide_index=True,
+            use_container_width=True,
+        )
+
+        # Diagnostics: which calculation stages were reused in this session
+        with st.expander("Diagnostics: calculation stages"):
+            stage_stats = pd.DataFrame(cp.pipeline_stats(pipeline_state))
+            stage_stats["seconds"] = (stage_stats["seconds"] * 1000).round(2)
+            st.dataframe(
+                stage_stats.rename(columns={
+                    "stage": "Stage", "hits": "Reused", "misses": "Recomputed",
+                    "hit_rate": "Reuse rate", "seconds": "Time recomputing (ms)",
+                }),
+                hide_index=True,
+                use_container_width=True,
+            )
+
+
+
+##################################################################################################
+
+
+### Record the latency of the calculation; slow calculations are logged with sanitized inputs
+if calc:
+    metrics.record_request(
+        "calculation",
+        time.perf_counter() - calculation_start,
+        calculation_inputs,
+        details={"recomputed_stages": [
+            name for name, stats in pipeline_state["stats"].items() if stats["misses"] > misses_before[name]
+        ]},
+    )
+
+
+### Write the profile of this rerun (no-op when profiling is disabled or the rerun was not sampled)
+profiling.stop_profiling(profiling_session)